@@ -0,0 +1,542 @@
+"""
+CSC540 Database Project - Batch Command Line Interface
+Food Manufacturing Inventory Management System
+Non-interactive subcommands for scripted intake, production, reports and queries,
+one JSON result per operation on stdout
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import mysql.connector
+
+from capacity_planner import CapacityPlanner
+from manufacturer_menu import ManufacturerMenu, SCHEDULE_GROUP_SIZE
+from supplier_menu import SupplierMenu, MIN_SHELF_LIFE_DAYS
+from query_menu import QUERIES
+
+# Connection setting -> (environment variable, default used when no --config file is given)
+CONNECTION_SETTINGS = {
+    'host': ('MYSQL_HOST', '127.0.0.1'),
+    'port': ('MYSQL_TCP_PORT', 3306),
+    'user': ('MYSQL_USER', 'root'),
+    'password': ('MYSQL_PWD', None),
+    'database': ('MYSQL_DATABASE', 'csc540_project'),
+}
+
+REPORTS = ('nearly-out-of-stock', 'almost-expired', 'batch-cost', 'spend-by-month', 'top-spend', 'capacity',
+           'expiry-buckets')
+DEFAULT_RECALL_DAYS = 20     # same default window as the recall menu
+DEFAULT_EXPIRY_DAYS = 10     # same default threshold as the almost-expired report
+DEFAULT_TOP_SPEND = 10       # same default count as the top-spend report
+
+
+def parse_date(value):
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def parse_lot_ids(value):
+    # "A,B,C" on the command line, ["A", "B", "C"] in JSON lines
+    items = value if isinstance(value, list) else str(value).split(',')
+    return [str(item).strip() for item in items if str(item).strip()]
+
+
+def parse_query_param(value):
+    # Command-line values arrive as strings; numeric ones are IDs
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+def result_rows(cursor):
+    rows = []
+    for result in cursor.stored_results():
+        rows = [dict(zip(result.column_names, row)) for row in result.fetchall()]
+    return rows
+
+
+def require(options, *names):
+    missing = [name for name in names if options.get(name) is None]
+    if missing:
+        raise ValueError(f"Missing required option(s): {', '.join(missing)}")
+
+
+class BatchSession:
+    # One connection for the whole run, shared by every operation and menu object
+    def __init__(self, connection, user_id):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.user_id = user_id
+        self._menus = {}
+
+    def _role_id(self, role, table, id_column):
+        if not self.user_id:
+            raise ValueError(f"--user-id is required (a {role} UserID)")
+        self.cursor.execute(f"""
+            SELECT t.{id_column}
+            FROM User u
+            INNER JOIN {table} t ON t.UserID = u.UserID
+            WHERE u.UserID = %s AND u.UserRole = %s
+        """, (self.user_id, role))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise ValueError(f"User {self.user_id} is not a {role.lower()}")
+        return row[0]
+
+    def _menu(self, menu):
+        menu.connection, menu.cursor = self.connection, self.cursor
+        return menu
+
+    def manufacturer_menu(self):
+        if 'manufacturer' not in self._menus:
+            manufacturer_id = self._role_id('MANUFACTURER', 'Manufacturer', 'ManufacturerID')
+            self._menus['manufacturer'] = self._menu(
+                ManufacturerMenu(None, self.user_id, manufacturer_id))
+        return self._menus['manufacturer']
+
+    def supplier_menu(self):
+        if 'supplier' not in self._menus:
+            supplier_id = self._role_id('SUPPLIER', 'Supplier', 'SupplierID')
+            self._menus['supplier'] = self._menu(SupplierMenu(None, self.user_id, supplier_id))
+        return self._menus['supplier']
+
+    def close(self):
+        self.cursor.close()
+
+
+def create_ingredient_batch(session, options):
+    require(options, 'formulation_id', 'packages', 'expiration_date')
+    menu = session.supplier_menu()
+
+    session.cursor.callproc('sp_ensure_current_formulations')
+    session.connection.commit()
+    session.cursor.execute("""
+        SELECT f.PackSize
+        FROM CurrentFormulation cf
+        INNER JOIN Formulation f ON cf.FormulationID = f.FormulationID
+        WHERE cf.FormulationID = %s AND cf.SupplierID = %s
+    """, (options['formulation_id'], menu.supplier_id))
+    row = session.cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Formulation {options['formulation_id']} is not an active formulation "
+                         f"of supplier {menu.supplier_id}")
+    pack_size = row[0]
+
+    packages = options['packages']
+    if packages <= 0:
+        raise ValueError("packages must be positive")
+
+    expiration_date = options['expiration_date']
+    if (expiration_date - date.today()).days < MIN_SHELF_LIFE_DAYS:
+        raise ValueError(f"Expiration must be at least {MIN_SHELF_LIFE_DAYS} days from today")
+
+    has_conflicts, conflicts = menu.check_formulation_conflicts(options['formulation_id'])
+    if has_conflicts and not options.get('allow_conflicts'):
+        pairs = ', '.join(f"{c[1]} + {c[3]}" for c in conflicts)
+        raise ValueError(f"Formulation has do-not-combine conflicts ({pairs}); "
+                         f"pass allow_conflicts to create the batch anyway")
+
+    total_oz = packages * pack_size
+    lot_id = menu.insert_ingredient_batch(options['formulation_id'], packages, total_oz,
+                                          expiration_date.strftime("%Y-%m-%d"))
+    return {'lot_id': lot_id, 'packages': packages, 'total_oz': total_oz,
+            'expiration_date': expiration_date}
+
+
+def receive(session, options):
+    require(options, 'lot_ids')
+    if not options['lot_ids']:
+        raise ValueError("lot_ids is empty")
+    menu = session.manufacturer_menu()
+
+    received = menu.claim_ingredient_batches(options['lot_ids'])
+    return {'requested': len(options['lot_ids']), 'received': received}
+
+
+def produce(session, options):
+    require(options, 'recipe_id', 'expiration_date')
+    menu = session.manufacturer_menu()
+    recipe_id = options['recipe_id']
+
+    session.cursor.execute("""
+        SELECT p.DefaultBatchSize
+        FROM Recipe r
+        INNER JOIN Product p ON r.ProductID = p.ProductID
+        WHERE r.RecipeID = %s AND p.ManufacturerID = %s
+    """, (recipe_id, menu.manufacturer_id))
+    row = session.cursor.fetchone()
+    if row is None:
+        raise ValueError(f"Recipe {recipe_id} does not belong to manufacturer {menu.manufacturer_id}")
+
+    batches = 1 if options.get('batches') is None else options['batches']
+    if batches <= 0:
+        raise ValueError("batches must be positive")
+    batch_qty = batches * row[0]
+
+    production_date = options.get('production_date') or date.today()
+    expiration_date = options['expiration_date']
+    if expiration_date <= production_date:
+        raise ValueError("Expiration must be after production date")
+
+    # Quick on-hand check, then FEFO allocation, health check and insert in one locked transaction
+    shortfalls = menu.check_recipe_inventory(recipe_id, batch_qty)
+    if shortfalls:
+        raise ValueError("Insufficient inventory: " + ", ".join(
+            f"{ing_name} needs {shortfall_oz:.2f} more oz" for ing_name, shortfall_oz in shortfalls))
+
+    success, lot_id, allocations, total_cost, message = menu.commit_product_batch(
+        recipe_id, batch_qty, production_date.strftime("%Y-%m-%d"),
+        expiration_date.strftime("%Y-%m-%d")
+    )
+    if not success:
+        raise ValueError(message)
+    return {
+        'lot_id': lot_id,
+        'units': batch_qty,
+        'batch_cost': round(total_cost, 2),
+        'per_unit_cost': round(total_cost / batch_qty, 4),
+        'allocations': [{'lot_id': ing_lot, 'quantity_oz': qty, 'cost': round(cost, 2)}
+                        for ing_lot, qty, cost in allocations],
+    }
+
+
+def schedule(session, options):
+    require(options, 'jobs')
+    menu = session.manufacturer_menu()
+
+    # Each line of the jobs file is a produce record; production options given here are defaults
+    defaults = {field: options[field] for field in COMMANDS['produce'][2] if options.get(field) is not None}
+    try:
+        stream = sys.stdin if options['jobs'] == '-' else open(options['jobs'])
+    except OSError as err:
+        raise ValueError(f"Cannot read jobs file: {err}")
+    try:
+        records = [dict(defaults, **line_options('produce', line)) for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    for line_number, record in enumerate(records, 1):
+        try:
+            require(record, 'recipe_id', 'expiration_date')
+        except ValueError as err:
+            raise ValueError(f"Job {line_number}: {err}")
+
+    # Batches are counted in the product's standard size, as for produce
+    sizes = {}
+    if records:
+        recipe_ids = sorted({record['recipe_id'] for record in records})
+        placeholders = ','.join(['%s'] * len(recipe_ids))
+        session.cursor.execute(f"""
+            SELECT r.RecipeID, p.DefaultBatchSize
+            FROM Recipe r
+            INNER JOIN Product p ON r.ProductID = p.ProductID
+            WHERE r.RecipeID IN ({placeholders})
+        """, recipe_ids)
+        sizes = dict(session.cursor.fetchall())
+
+    jobs = []
+    for record in records:
+        batches = 1 if record.get('batches') is None else record['batches']
+        jobs.append((record['recipe_id'], batches * sizes.get(record['recipe_id'], 0),
+                     record.get('production_date') or date.today(), record['expiration_date']))
+
+    group_size = options.get('group_size') or SCHEDULE_GROUP_SIZE
+    if group_size <= 0:
+        raise ValueError("group_size must be positive")
+
+    report = []
+    for job_number, ((recipe_id, units, _, _), result) in enumerate(
+            zip(jobs, menu.produce_schedule(jobs, group_size)), 1):
+        success, lot_id, total_cost, message = result
+        entry = {'job': job_number, 'recipe_id': recipe_id, 'ok': success}
+        if success:
+            entry.update(lot_id=lot_id, units=units, batch_cost=round(total_cost, 2),
+                         per_unit_cost=round(total_cost / units, 4))
+        else:
+            entry['error'] = message
+        report.append(entry)
+
+    return {
+        'succeeded': sum(entry['ok'] for entry in report),
+        'failed': sum(not entry['ok'] for entry in report),
+        'jobs': report,
+    }
+
+
+def report(session, options):
+    require(options, 'report')
+    kind = options['report']
+
+    if kind == 'nearly-out-of-stock':
+        menu = session.manufacturer_menu()
+        session.cursor.callproc('sp_report_nearly_out_of_stock', [menu.manufacturer_id])
+    elif kind == 'almost-expired':
+        menu = session.manufacturer_menu()
+        days = options.get('days')
+        session.cursor.callproc('sp_report_almost_expired',
+                                [menu.manufacturer_id, DEFAULT_EXPIRY_DAYS if days is None else days])
+    elif kind == 'expiry-buckets':
+        menu = session.manufacturer_menu()
+        days = options.get('days')
+        session.cursor.callproc('sp_report_expiry_buckets',
+                                [menu.manufacturer_id, DEFAULT_EXPIRY_DAYS if days is None else days])
+    elif kind == 'batch-cost':
+        require(options, 'lot_id')
+        session.manufacturer_menu()
+        session.cursor.callproc('sp_get_batch_cost_summary', [options['lot_id']])
+    elif kind == 'spend-by-month':
+        menu = session.manufacturer_menu()
+        session.cursor.callproc('sp_report_supplier_spend_by_month',
+                                [menu.manufacturer_id, options.get('month_from'), options.get('month_to')])
+    elif kind == 'top-spend':
+        menu = session.manufacturer_menu()
+        limit = options.get('limit')
+        session.cursor.callproc('sp_report_top_spend',
+                                [menu.manufacturer_id, options.get('month_from'), options.get('month_to'),
+                                 (options.get('group_by') or 'supplier').upper(),
+                                 DEFAULT_TOP_SPEND if limit is None else limit])
+    elif kind == 'capacity':
+        menu = session.manufacturer_menu()
+        planner = CapacityPlanner(menu.manufacturer_id)
+        planner.load(session.cursor, options.get('as_of'))
+        session.connection.commit()
+        mix, leftover = planner.plan_mix()
+        return {
+            'as_of': planner.as_of,
+            'rows': [{'product_id': product_id, 'product_name': product_name, 'recipe_id': recipe_id,
+                      'max_units': max_units, 'limiting_ingredient': limiting}
+                     for product_id, product_name, recipe_id, max_units, limiting in planner.capacity()],
+            'mix': [{'product_id': product_id, 'product_name': product_name, 'batches': batches, 'units': units}
+                    for product_id, product_name, batches, units in mix],
+            'leftover': [{'ingredient_id': ing_id, 'ingredient_name': planner.ingredient_name(ing_id),
+                          'oz': round(oz, 2), 'next_expiration': next_expiration}
+                         for ing_id, (oz, next_expiration) in sorted(leftover.items())],
+        }
+    else:
+        raise ValueError(f"Unknown report '{kind}' (expected one of: {', '.join(REPORTS)})")
+
+    return {'rows': result_rows(session.cursor)}
+
+
+def trace_recall(session, options):
+    if (options.get('ingredient_id') is None) == (options.get('lot_id') is None):
+        raise ValueError("Give exactly one of ingredient_id or lot_id")
+    session.manufacturer_menu()
+
+    date_to = options.get('date_to') or date.today()
+    date_from = options.get('date_from') or date_to - timedelta(days=DEFAULT_RECALL_DAYS)
+
+    session.cursor.callproc('sp_trace_recall',
+                            [options.get('ingredient_id'), options.get('lot_id'), date_from, date_to])
+    return {'date_from': date_from, 'date_to': date_to, 'rows': result_rows(session.cursor)}
+
+
+def query(session, options):
+    require(options, 'number')
+    if options['number'] not in QUERIES:
+        raise ValueError(f"Unknown query {options['number']} (expected 1-{len(QUERIES)})")
+
+    procedure, default_params = QUERIES[options['number']]
+    params = [parse_query_param(p) for p in options.get('params') or []]
+    # Extra parameters replace the QueryMenu defaults from the left
+    params = params + default_params[len(params):]
+
+    session.cursor.callproc(procedure, params)
+    return {'procedure': procedure, 'params': params, 'rows': result_rows(session.cursor)}
+
+
+# Subcommand -> (handler, help, {option: (type, help)})
+COMMANDS = {
+    'create-ingredient-batch': (create_ingredient_batch, "create an ingredient lot (supplier)", {
+        'formulation_id': (int, "active formulation of this supplier"),
+        'packages': (float, "number of packages"),
+        'expiration_date': (parse_date, f"YYYY-MM-DD, at least {MIN_SHELF_LIFE_DAYS} days out"),
+        'allow_conflicts': (bool, "create the lot even if the formulation has do-not-combine conflicts"),
+    }),
+    'receive': (receive, "claim unclaimed ingredient lots (manufacturer)", {
+        'lot_ids': (parse_lot_ids, "comma-separated ingredient LotIDs"),
+    }),
+    'produce': (produce, "create a product batch with FEFO allocation (manufacturer)", {
+        'recipe_id': (int, "recipe of one of this manufacturer's products"),
+        'batches': (int, "number of standard batches (default 1)"),
+        'production_date': (parse_date, "YYYY-MM-DD (default today)"),
+        'expiration_date': (parse_date, "YYYY-MM-DD"),
+    }),
+    'schedule': (schedule, "produce a list of batches jointly, in grouped transactions (manufacturer)", {
+        'jobs': (str, "JSON-lines file of produce records ('-' for stdin), one job per line"),
+        'group_size': (int, f"jobs inserted per transaction (default {SCHEDULE_GROUP_SIZE})"),
+        'batches': (int, "default for jobs without batches (default 1)"),
+        'production_date': (parse_date, "default for jobs without production_date (default today)"),
+        'expiration_date': (parse_date, "default for jobs without expiration_date"),
+    }),
+    'report': (report, "run a manufacturer report", {
+        'report': (str, f"one of: {', '.join(REPORTS)}"),
+        'days': (int, f"almost-expired and expiry-buckets threshold (default {DEFAULT_EXPIRY_DAYS})"),
+        'lot_id': (str, "product LotID for batch-cost"),
+        'month_from': (parse_date, "YYYY-MM-DD, any day of the first month for spend reports"),
+        'month_to': (parse_date, "YYYY-MM-DD, any day of the last month for spend reports"),
+        'group_by': (str, "top-spend grouping, supplier or ingredient (default supplier)"),
+        'limit': (int, f"top-spend row count (default {DEFAULT_TOP_SPEND})"),
+        'as_of': (parse_date, "YYYY-MM-DD, production date for the capacity report (default today)"),
+    }),
+    'trace-recall': (trace_recall, "product batches that used an ingredient or ingredient lot", {
+        'ingredient_id': (int, "IngredientID"),
+        'lot_id': (str, "ingredient LotID"),
+        'date_from': (parse_date, f"YYYY-MM-DD (default {DEFAULT_RECALL_DAYS} days before date_to)"),
+        'date_to': (parse_date, "YYYY-MM-DD (default today)"),
+    }),
+    'query': (query, "run one of the five required queries", {
+        'number': (int, "query number, 1-5"),
+        'params': (list, "procedure arguments replacing the defaults"),
+    }),
+}
+POSITIONAL = {'report': 'report', 'query': 'number', 'schedule': 'jobs'}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Run inventory operations without prompts. Each operation prints one JSON object.")
+    parser.add_argument('--config', help="MySQL option file with a [client] section "
+                                         "(user, password, host, port, database)")
+    parser.add_argument('--host', help="default $MYSQL_HOST or 127.0.0.1")
+    parser.add_argument('--port', type=int, help="default $MYSQL_TCP_PORT or 3306")
+    parser.add_argument('--user', help="MySQL user, default $MYSQL_USER or root")
+    parser.add_argument('--database', help="default $MYSQL_DATABASE or csc540_project")
+    parser.add_argument('--user-id', default=os.environ.get('CSC540_USER_ID'),
+                        help="application UserID to act as, e.g. MFG001 (default $CSC540_USER_ID)")
+    parser.add_argument('--input', help="JSON-lines file ('-' for stdin); one operation per line, "
+                                        "keys are the subcommand's options")
+    parser.add_argument('--stop-on-error', action='store_true',
+                        help="stop at the first failed operation of a JSON-lines run")
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, help_text, fields) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=help_text)
+        for field, (field_type, field_help) in fields.items():
+            if POSITIONAL.get(name) == field:
+                sub.add_argument(field, type=field_type, nargs='?', help=field_help)
+            elif field_type is bool:
+                sub.add_argument('--' + field.replace('_', '-'), dest=field,
+                                 action='store_true', default=None, help=field_help)
+            elif field_type is list:
+                sub.add_argument(field, nargs='*', help=field_help)
+            else:
+                sub.add_argument('--' + field.replace('_', '-'), dest=field,
+                                 type=field_type, help=field_help)
+    return parser
+
+
+def line_options(command, line):
+    # Validate and convert one JSON-lines record with the same types as the command line
+    fields = COMMANDS[command][2]
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("Each input line must be a JSON object")
+
+    options = {}
+    for key, value in record.items():
+        if key not in fields:
+            raise ValueError(f"Unknown option '{key}' for {command}")
+        field_type = fields[key][0]
+        if value is None or field_type in (bool, list):
+            options[key] = value
+        else:
+            options[key] = field_type(value)
+    return options
+
+
+def connection_config(args):
+    config = {}
+    if args.config:
+        config['option_files'] = args.config
+
+    for key, (env_name, default) in CONNECTION_SETTINGS.items():
+        value = getattr(args, key, None)
+        if value is None:
+            value = os.environ.get(env_name)
+        # With an option file, anything not set explicitly comes from the file
+        if value is None and not args.config:
+            value = default
+        if value is not None:
+            config[key] = int(value) if key == 'port' else value
+
+    if not args.config and 'password' not in config:
+        raise ValueError("No MySQL password: set MYSQL_PWD or pass --config")
+    return config
+
+
+def run_operation(session, command, options):
+    handler = COMMANDS[command][0]
+    try:
+        result = handler(session, options)
+        return {'command': command, 'ok': True, 'result': result}
+    except (ValueError, mysql.connector.Error) as err:
+        session.connection.rollback()
+        return {'command': command, 'ok': False, 'error': str(err)}
+
+
+def emit(record):
+    print(json.dumps(record, default=_json_default), flush=True)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    fields = COMMANDS[args.command][2]
+    # Options given on the command line are defaults for every JSON-lines record
+    base_options = {field: getattr(args, field) for field in fields}
+
+    try:
+        config = connection_config(args)
+        connection = mysql.connector.connect(**config)
+    except (ValueError, mysql.connector.Error) as err:
+        emit({'command': args.command, 'ok': False, 'error': f"Cannot connect to database: {err}"})
+        return 1
+
+    session = BatchSession(connection, args.user_id)
+    failed = 0
+    try:
+        if args.input is None:
+            record = run_operation(session, args.command, base_options)
+            failed += not record['ok']
+            emit(record)
+        else:
+            stream = sys.stdin if args.input == '-' else open(args.input)
+            try:
+                for line_number, line in enumerate(stream, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        options = dict(base_options, **line_options(args.command, line))
+                        record = run_operation(session, args.command, options)
+                    except (TypeError, ValueError) as err:  # includes malformed JSON
+                        record = {'command': args.command, 'ok': False, 'error': str(err)}
+                    record['line'] = line_number
+                    failed += not record['ok']
+                    emit(record)
+                    if failed and args.stop_on_error:
+                        break
+            finally:
+                if stream is not sys.stdin:
+                    stream.close()
+    finally:
+        session.close()
+        connection.close()
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,439 @@
+"""
+CSC540 Database Project - Stored Procedure Benchmark
+Food Manufacturing Inventory Management System
+Latency, rows examined, scan/filesort and EXPLAIN capture for every sp_* procedure and QueryMenu query,
+with a stored baseline to catch plan and latency regressions
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+
+import generate_data
+from viewer_menu import PAGE_SIZE
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+HISTORY_CONSUMER = 'events_statements_history_long'
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+class BenchmarkCase:
+    def __init__(self, name, procedure=None, args=(), query=None, params=(), writes=False):
+        self.name = name
+        self.procedure = procedure
+        self.args = list(args)
+        self.query = query
+        self.params = tuple(params)
+        self.writes = writes  # run inside a transaction that is always rolled back
+
+    def run(self, cursor):
+        if self.procedure:
+            cursor.callproc(self.procedure, self.args)
+            for result in cursor.stored_results():
+                result.fetchall()
+        else:
+            cursor.execute(self.query, self.params)
+            cursor.fetchall()
+
+
+def sample_parameters(cursor):
+    # Representative IDs taken from whatever data is loaded (fill.sql or generate_data.py)
+    cursor.execute("""
+        SELECT pb.LotID, pb.RecipeID, p.ProductID, p.ManufacturerID, m.UserID, p.DefaultBatchSize,
+               pb.ProductionDate
+        FROM ProductBatch pb
+        INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
+        INNER JOIN Product p ON r.ProductID = p.ProductID
+        INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
+        ORDER BY pb.ProductionDate DESC, pb.LotID
+        LIMIT 2
+    """)
+    batches = cursor.fetchall()
+    if len(batches) < 2:
+        raise SystemExit("Error: Load data first (fill.sql or generate_data.py)")
+    lot_id, recipe_id, product_id, manufacturer_id, manufacturer_user, batch_size, production_date = batches[0]
+
+    cursor.execute("""
+        SELECT pbib.IngredientLotID, f.IngredientID
+        FROM ProductBatchIngredientBatch pbib
+        INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        WHERE pbib.ProductLotID = %s
+    """, (lot_id,))
+    used_lots = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT f.FormulationID, f.PackSize, f.SupplierID
+        FROM Formulation f
+        ORDER BY EXISTS (SELECT 1 FROM FormulationIngredientList fil
+                         WHERE fil.FormulationID = f.FormulationID) DESC, f.FormulationID
+        LIMIT 1
+    """)
+    formulation_id, pack_size, supplier_id = cursor.fetchone()
+
+    cursor.execute("""
+        SELECT LotID
+        FROM IngredientBatch
+        WHERE ManufacturerID = %s AND ExpirationDate > CURDATE() AND TotalQuantityOz >= 1
+        LIMIT 3
+    """, (manufacturer_id,))
+    allocations = [{"ibatch_id": row[0], "ibatch_quantity_used": 1} for row in cursor.fetchall()]
+
+    return {
+        'lot_id': lot_id,
+        'other_lot_id': batches[1][0],
+        'production_date': production_date,
+        'recipe_id': recipe_id,
+        'product_id': product_id,
+        'manufacturer_id': manufacturer_id,
+        'manufacturer_user': manufacturer_user,
+        'batch_size': batch_size,
+        'ingredient_lot': used_lots[0][0] if used_lots else None,
+        'ingredient_id': used_lots[0][1] if used_lots else None,
+        'lot_ids_json': json.dumps([row[0] for row in used_lots]),
+        'formulation_id': formulation_id,
+        'pack_size': pack_size,
+        'supplier_id': supplier_id,
+        'allocations': json.dumps(allocations),
+    }
+
+
+def build_cases(p):
+    today = date.today()
+    all_dates = (date(2000, 1, 1), date(9999, 12, 31))
+    return [
+        # Utility
+        BenchmarkCase('sp_next_lot_id', 'sp_next_lot_id', ['BENCH-0', None], writes=True),
+        BenchmarkCase('sp_bump_change_counter', 'sp_bump_change_counter', ['benchmark'], writes=True),
+        BenchmarkCase('sp_sync_lot_sequences', 'sp_sync_lot_sequences', writes=True),
+        # Supplier
+        BenchmarkCase('sp_view_formulation_details', 'sp_view_formulation_details', [p['formulation_id']]),
+        BenchmarkCase('sp_view_do_not_combine_list', 'sp_view_do_not_combine_list'),
+        BenchmarkCase('sp_get_formulation_conflicts', 'sp_get_formulation_conflicts', [p['formulation_id']]),
+        BenchmarkCase('sp_create_ingredient_batch', 'sp_create_ingredient_batch',
+                      [p['formulation_id'], 1, p['pack_size'], today + timedelta(days=120), None], writes=True),
+        # Manufacturer
+        BenchmarkCase('sp_view_manufacturer_products', 'sp_view_manufacturer_products', [p['manufacturer_id']]),
+        BenchmarkCase('sp_view_manufacturer_ingredient_inventory', 'sp_view_manufacturer_ingredient_inventory',
+                      [p['manufacturer_id']]),
+        BenchmarkCase('sp_view_manufacturer_product_batches', 'sp_view_manufacturer_product_batches',
+                      [p['manufacturer_id']]),
+        BenchmarkCase('sp_get_recipe_conflicts', 'sp_get_recipe_conflicts', [p['recipe_id']]),
+        BenchmarkCase('sp_report_nearly_out_of_stock', 'sp_report_nearly_out_of_stock', [p['manufacturer_id']]),
+        BenchmarkCase('sp_report_almost_expired', 'sp_report_almost_expired', [p['manufacturer_id'], 30]),
+        BenchmarkCase('sp_report_expiry_buckets', 'sp_report_expiry_buckets', [p['manufacturer_id'], 30]),
+        BenchmarkCase('sp_get_batch_cost_summary', 'sp_get_batch_cost_summary', [p['lot_id']]),
+        BenchmarkCase('sp_report_supplier_spend_by_month', 'sp_report_supplier_spend_by_month',
+                      [p['manufacturer_id'], today - timedelta(days=365), today]),
+        BenchmarkCase('sp_report_top_spend', 'sp_report_top_spend',
+                      [p['manufacturer_id'], None, None, 'SUPPLIER', 10]),
+        BenchmarkCase('sp_trace_recall (lot)', 'sp_trace_recall', [None, p['ingredient_lot'], *all_dates]),
+        BenchmarkCase('sp_trace_recall (ingredient)', 'sp_trace_recall', [p['ingredient_id'], None, *all_dates]),
+        BenchmarkCase('sp_bulk_recall (lots)', 'sp_bulk_recall', [p['lot_ids_json'], None, None, None, None]),
+        BenchmarkCase('sp_bulk_recall (supplier)', 'sp_bulk_recall', [None, p['supplier_id'], None, None, None]),
+        BenchmarkCase('sp_evaluate_health_risk_for_allocated_lots', 'sp_evaluate_health_risk_for_allocated_lots',
+                      [p['lot_ids_json']]),
+        BenchmarkCase('sp_get_fefo_allocation_plan', 'sp_get_fefo_allocation_plan',
+                      [p['recipe_id'], p['batch_size'], p['manufacturer_id']]),
+        BenchmarkCase('sp_validate_recipe_inventory', 'sp_validate_recipe_inventory',
+                      [p['recipe_id'], p['batch_size'], p['manufacturer_id']]),
+        BenchmarkCase('sp_refresh_flattened_bom', 'sp_refresh_flattened_bom', [p['lot_id']], writes=True),
+        BenchmarkCase('sp_create_product_batch', 'sp_create_product_batch',
+                      [p['recipe_id'], 1, today, today + timedelta(days=30), 1.00, p['allocations'], None],
+                      writes=True),
+        # Viewer
+        BenchmarkCase('sp_browse_product_batches (first page)', 'sp_browse_product_batches',
+                      [None, None, None, None, None, None, PAGE_SIZE + 1]),
+        BenchmarkCase('sp_browse_product_batches (next page)', 'sp_browse_product_batches',
+                      [None, None, None, None, p['production_date'], p['lot_id'], PAGE_SIZE + 1]),
+        BenchmarkCase('sp_browse_product_batches (manufacturer)', 'sp_browse_product_batches',
+                      [p['manufacturer_id'], None, None, None, None, None, PAGE_SIZE + 1]),
+        BenchmarkCase('sp_compare_batches_incompatibilities', 'sp_compare_batches_incompatibilities',
+                      [p['lot_id'], p['other_lot_id']]),
+        BenchmarkCase('vw_flattened_product_bom', query="""
+            SELECT * FROM vw_flattened_product_bom WHERE BatchLotID = %s
+        """, params=[p['lot_id']]),
+        BenchmarkCase('vw_active_formulations', query="SELECT * FROM vw_active_formulations"),
+        BenchmarkCase('sp_get_active_formulations (today)', 'sp_get_active_formulations', [None, None]),
+        BenchmarkCase('sp_get_active_formulations (as of)', 'sp_get_active_formulations',
+                      [None, today - timedelta(days=180)]),
+        # QueryMenu
+        BenchmarkCase('sp_query_last_batch_ingredients', 'sp_query_last_batch_ingredients',
+                      [p['product_id'], p['manufacturer_user']]),
+        BenchmarkCase('sp_query_supplier_spending', 'sp_query_supplier_spending', [p['manufacturer_id']]),
+        BenchmarkCase('sp_query_product_unit_cost', 'sp_query_product_unit_cost', [p['lot_id']]),
+        BenchmarkCase('sp_query_conflicting_ingredients', 'sp_query_conflicting_ingredients', [p['lot_id']]),
+        BenchmarkCase('sp_query_manufacturers_not_supplied', 'sp_query_manufacturers_not_supplied',
+                      [p['supplier_id']]),
+    ]
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def normalize_sql(sql_text):
+    return re.sub(r'\s+', ' ', sql_text or '').strip()
+
+
+class Profiler:
+    # Reads this connection's statements back from performance_schema after each profiled call
+    def __init__(self, cursor):
+        self.cursor = cursor
+        cursor.execute("SELECT PS_CURRENT_THREAD_ID()")
+        self.thread_id = cursor.fetchone()[0]
+        cursor.execute("SELECT ENABLED FROM performance_schema.setup_consumers WHERE NAME = %s",
+                       (HISTORY_CONSUMER,))
+        self.was_enabled = cursor.fetchone()[0]
+        cursor.execute("UPDATE performance_schema.setup_consumers SET ENABLED = 'YES' WHERE NAME = %s",
+                       (HISTORY_CONSUMER,))
+
+    def close(self):
+        self.cursor.execute("UPDATE performance_schema.setup_consumers SET ENABLED = %s WHERE NAME = %s",
+                            (self.was_enabled, HISTORY_CONSUMER))
+
+    def last_event_id(self):
+        self.cursor.execute("""
+            SELECT COALESCE(MAX(EVENT_ID), 0)
+            FROM performance_schema.events_statements_history_long
+            WHERE THREAD_ID = %s
+        """, (self.thread_id,))
+        return self.cursor.fetchone()[0]
+
+    def statements_since(self, event_id, nested):
+        # Procedures are measured by the statements they run, plain queries by themselves
+        self.cursor.execute(f"""
+            SELECT SQL_TEXT, ROWS_EXAMINED, SELECT_SCAN + SELECT_FULL_JOIN, SORT_ROWS
+            FROM performance_schema.events_statements_history_long
+            WHERE THREAD_ID = %s AND EVENT_ID > %s
+              AND NESTING_EVENT_LEVEL {'>' if nested else '='} 0
+            ORDER BY EVENT_ID
+        """, (self.thread_id, event_id))
+        return self.cursor.fetchall()
+
+
+def explain_statements(cursor, case, statements):
+    # Procedure statements still refer to their parameters; bind them to user variables first
+    substitutions = []
+    if case.procedure:
+        cursor.execute("""
+            SELECT PARAMETER_NAME, PARAMETER_MODE
+            FROM information_schema.PARAMETERS
+            WHERE SPECIFIC_SCHEMA = DATABASE() AND SPECIFIC_NAME = %s AND ORDINAL_POSITION > 0
+            ORDER BY ORDINAL_POSITION
+        """, (case.procedure,))
+        for (name, mode), value in zip(cursor.fetchall(), case.args):
+            if mode != 'OUT':
+                cursor.execute(f"SET @bench_{name} = %s", (value,))
+                substitutions.append(name)
+
+    plans = []
+    for sql_text in statements:
+        if not sql_text.upper().startswith(EXPLAINABLE):
+            continue
+        for name in substitutions:
+            sql_text = re.sub(rf'\b{name}\b', f'@bench_{name}', sql_text)
+        try:
+            cursor.execute(f"EXPLAIN FORMAT=JSON {sql_text}")
+            plans.append({'statement': sql_text, 'plan': json.loads(cursor.fetchone()[0])})
+        except mysql.connector.Error as err:
+            # Statements that use DECLAREd locals cannot be explained outside the procedure
+            plans.append({'statement': sql_text, 'error': str(err)})
+    return plans
+
+
+def benchmark_case(connection, cursor, profiler, case, iterations, warmup):
+    latencies = []
+    for i in range(warmup + iterations):
+        if case.writes:
+            # Earlier reads leave a transaction open; end it so this one can start
+            connection.rollback()
+            connection.start_transaction()
+        try:
+            started = time.perf_counter()
+            case.run(cursor)
+            elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            if case.writes:
+                connection.rollback()
+        if i >= warmup:
+            latencies.append(elapsed)
+
+    # One more, instrumented call for rows examined, full scans and plans
+    event_id = profiler.last_event_id()
+    if case.writes:
+        connection.rollback()
+        connection.start_transaction()
+    try:
+        case.run(cursor)
+        statements = profiler.statements_since(event_id, nested=bool(case.procedure))
+        plans = explain_statements(cursor, case, [normalize_sql(s[0]) for s in statements])
+    finally:
+        if case.writes:
+            connection.rollback()
+
+    return {
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'rows_examined': int(sum(s[1] or 0 for s in statements)),
+        'full_scans': sorted({normalize_sql(s[0])[:200] for s in statements if s[2]}),
+        'filesorts': sorted({normalize_sql(s[0])[:200] for s in statements if s[3]}),
+        'explain': plans,
+    }
+
+
+def run_suite(connection, iterations, warmup, only=None):
+    cursor = connection.cursor()
+    cases = build_cases(sample_parameters(cursor))
+
+    # Every sp_* procedure should have a case; report the ones that do not
+    cursor.execute("""
+        SELECT ROUTINE_NAME FROM information_schema.ROUTINES
+        WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_TYPE = 'PROCEDURE' AND ROUTINE_NAME LIKE 'sp\\_%'
+    """)
+    covered = {case.procedure for case in cases}
+    for (name,) in cursor.fetchall():
+        if name not in covered:
+            print(f"Warning: no benchmark case for {name}")
+    if only:
+        cases = [case for case in cases if any(o in case.name for o in only)]
+
+    profiler = Profiler(cursor)
+    results = {}
+    try:
+        for case in cases:
+            try:
+                results[case.name] = benchmark_case(connection, cursor, profiler, case, iterations, warmup)
+            except mysql.connector.Error as err:
+                results[case.name] = {'error': str(err)}
+    finally:
+        profiler.close()
+        cursor.close()
+    return results
+
+
+def compare(results, baseline, tolerance, min_ms):
+    failures = []
+    for name, result in results.items():
+        if 'error' in result:
+            failures.append(f"{name}: {result['error']}")
+            continue
+        base = baseline.get(name)
+        if not base or 'error' in base:
+            continue
+        if result['p95_ms'] > base['p95_ms'] * (1 + tolerance) and result['p95_ms'] - base['p95_ms'] > min_ms:
+            failures.append(f"{name}: p95 {result['p95_ms']:.2f} ms vs baseline {base['p95_ms']:.2f} ms")
+        for scan in set(result['full_scans']) - set(base['full_scans']):
+            failures.append(f"{name}: new full scan in: {scan}")
+        for sort in set(result['filesorts']) - set(base.get('filesorts', [])):
+            failures.append(f"{name}: new filesort in: {sort}")
+    return failures
+
+
+def print_report(label, results):
+    print("\n" + "="*107)
+    print(f"BENCHMARK - dataset: {label}")
+    print("="*107)
+    print(f"{'Case':<45} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'Rows Exam.':>12} {'Scans':>6} {'Sorts':>6}")
+    print("-"*107)
+    for name, r in results.items():
+        if 'error' in r:
+            print(f"{name:<45} ERROR: {r['error']}")
+        else:
+            print(f"{name:<45} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                  f"{r['rows_examined']:>12,} {len(r['full_scans']):>6} {len(r['filesorts']):>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark every sp_* procedure and QueryMenu query against a local MySQL.")
+    parser.add_argument('--sizes', help="comma-separated generate_data.py --rows values; "
+                                        "each size REPLACES the database contents before it is measured")
+    parser.add_argument('--seed', type=int, default=540)
+    parser.add_argument('--only', help="comma-separated case name filters, e.g. sp_evaluate_health_risk")
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 slowdown (default 0.25)")
+    parser.add_argument('--min-ms', type=float, default=2.0, help="ignore p95 slowdowns below this many ms")
+    parser.add_argument('--output', help="write full results, including EXPLAIN JSON, to this file")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--database', default='csc540_project')
+    args = parser.parse_args(argv)
+
+    password = os.environ.get('MYSQL_PWD')
+    if password is None:
+        password = input("Enter MySQL password: ")
+        os.environ['MYSQL_PWD'] = password  # picked up by generate_data.py
+
+    connect_args = ['--host', args.host, '--port', str(args.port), '--user', args.user,
+                    '--database', args.database]
+    labels = args.sizes.split(',') if args.sizes else ['current']
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    all_results = {}
+    failures = []
+    for label in labels:
+        if label != 'current':
+            if generate_data.main(['--rows', label, '--seed', str(args.seed)] + connect_args) != 0:
+                return 1
+        try:
+            connection = mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                                 password=password, database=args.database)
+        except mysql.connector.Error as err:
+            print(f"Error: Cannot connect to database: {err}")
+            return 1
+        try:
+            results = run_suite(connection, args.iterations, args.warmup,
+                                args.only.split(',') if args.only else None)
+        finally:
+            connection.close()
+
+        print_report(label, results)
+        all_results[label] = results
+        failures += [f"[{label}] {msg}" for msg in compare(results, baseline.get(label, {}),
+                                                             args.tolerance, args.min_ms)]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2, default=str)
+
+    if args.save_baseline:
+        # EXPLAIN output stays in --output; the baseline only keeps what compare() reads
+        for label, results in all_results.items():
+            baseline[label] = {name: {k: v for k, v in r.items() if k != 'explain'}
+                               for name, r in results.items()}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, default=str)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if failures:
+        print("\nREGRESSIONS:")
+        for msg in failures:
+            print(f"  {msg}")
+        return 1
+    print("\nNo regressions against the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
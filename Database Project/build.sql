@@ -7,6 +7,13 @@ USE csc540_project;
 #### BUILD DATABASE ########################################
 SET FOREIGN_KEY_CHECKS = 0;
 
+DROP TABLE IF EXISTS CurrentFormulation;
+DROP TABLE IF EXISTS FormulationAtomicExpansion;
+DROP TABLE IF EXISTS SupplierSpendMonthly;
+DROP TABLE IF EXISTS IngredientInventorySummary;
+DROP TABLE IF EXISTS ChangeCounter;
+DROP TABLE IF EXISTS LotSequence;
+DROP TABLE IF EXISTS ProductBatchFlatBOM;
 DROP TABLE IF EXISTS ProductBatchIngredientBatch;
 DROP TABLE IF EXISTS ProductBatch;
 DROP TABLE IF EXISTS RecipeBOM;
@@ -67,6 +74,10 @@ CREATE TABLE Formulation (
     EffectiveEndDate DATE NOT NULL DEFAULT '9999-12-31',
     CHECK (EffectiveStartDate <= EffectiveEndDate),
     UNIQUE(SupplierID, IngredientID, VersionNumber),
+    -- Ingredient -> supplier formulations (FEFO candidates, recipe expansion)
+    INDEX idx_formulation_ingredient_supplier (IngredientID, SupplierID),
+    -- Versions of an ingredient in effect on a given date (sp_get_active_formulations)
+    INDEX idx_formulation_interval (IngredientID, EffectiveStartDate, EffectiveEndDate),
     FOREIGN KEY (IngredientID) REFERENCES Ingredient(IngredientID)
         ON DELETE RESTRICT,
     FOREIGN KEY (SupplierID) REFERENCES Supplier(SupplierID)
@@ -85,6 +96,26 @@ CREATE TABLE FormulationIngredientList (
 		ON DELETE RESTRICT
 );
 
+-- Current version of each supplier's formulation of an ingredient: the latest-starting one in effect today
+--  IsLatestForIngredient marks the one version per ingredient used to expand compounds.
+--  Kept by the Formulation triggers; sp_refresh_current_formulations re-derives every row after
+--  bulk loads, and sp_ensure_current_formulations once per day (first reader of the day, or
+--  ev_refresh_current_formulations) so dated versions start and end without an edit
+CREATE TABLE CurrentFormulation (
+    SupplierID INT NOT NULL,
+    IngredientID INT NOT NULL,
+    FormulationID INT NOT NULL UNIQUE,
+    IsLatestForIngredient BOOL NOT NULL DEFAULT FALSE,
+    PRIMARY KEY (SupplierID, IngredientID),
+    INDEX idx_current_formulation_latest (IngredientID, IsLatestForIngredient, FormulationID),
+    FOREIGN KEY (FormulationID) REFERENCES Formulation(FormulationID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (SupplierID) REFERENCES Supplier(SupplierID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (IngredientID) REFERENCES Ingredient(IngredientID)
+        ON DELETE CASCADE
+);
+
 -- Ingredient Batch table
 CREATE TABLE IngredientBatch (
     LotID VARCHAR(255) PRIMARY KEY,
@@ -93,6 +124,13 @@ CREATE TABLE IngredientBatch (
 	Quantity FLOAT NOT NULL CHECK (Quantity >= 0),
     ExpirationDate DATE NOT NULL,
     TotalQuantityOz FLOAT NOT NULL DEFAULT 0 CHECK (TotalQuantityOz >= 0),
+    -- Day the manufacturer claimed the lot; NULL while it is still with the supplier
+    ReceivedDate DATE,
+    -- Covering index for a manufacturer's lots in FEFO order (ExpirationDate, LotID)
+    --  Quantity filters and the Formulation join are answered from the index itself
+    INDEX idx_ingredient_batch_fefo (ManufacturerID, ExpirationDate, LotID, FormulationID, TotalQuantityOz, Quantity),
+    -- A supplier's lots by expiry: range scans per formulation for the supplier batch listing
+    INDEX idx_ingredient_batch_formulation_expiry (FormulationID, ExpirationDate),
     FOREIGN KEY (FormulationID) REFERENCES Formulation(FormulationID)
 		ON DELETE RESTRICT,
 	FOREIGN KEY (ManufacturerID) REFERENCES Manufacturer(ManufacturerID)
@@ -160,6 +198,8 @@ CREATE TABLE ProductBatch (
     BatchCost   DECIMAL(10,2) NOT NULL DEFAULT 0,
     PerUnitCost DECIMAL(10,4) NOT NULL DEFAULT 0,
     CHECK (ExpirationDate > ProductionDate),
+    -- Browse order (newest first); sp_browse_product_batches reads one page at a time from it
+    INDEX idx_product_batch_browse (ProductionDate DESC, LotID),
     FOREIGN KEY (RecipeID) REFERENCES Recipe(RecipeID)
         ON DELETE CASCADE
 );
@@ -169,12 +209,98 @@ CREATE TABLE ProductBatchIngredientBatch (
     IngredientLotID VARCHAR(255) NOT NULL,
     QuantityUsed FLOAT NOT NULL CHECK (QuantityUsed > 0),
     PRIMARY KEY (ProductLotID, IngredientLotID),
+    -- Reverse lookup for recalls: ingredient lot -> product lots that consumed it
+    INDEX idx_pbib_ingredient_lot (IngredientLotID, ProductLotID, QuantityUsed),
     FOREIGN KEY (ProductLotID) REFERENCES ProductBatch(LotID)
         ON DELETE CASCADE,
     FOREIGN KEY (IngredientLotID) REFERENCES IngredientBatch(LotID)
         ON DELETE RESTRICT
 );
 
+-- Flattened (atomic) BOM per product batch
+--  Filled by sp_refresh_flattened_bom when a batch is committed; read by vw_flattened_product_bom
+CREATE TABLE ProductBatchFlatBOM (
+    ProductLotID VARCHAR(255) NOT NULL,
+    IngredientID INT NOT NULL,
+    TotalQuantityOz FLOAT NOT NULL,
+    PRIMARY KEY (ProductLotID, IngredientID),
+    FOREIGN KEY (ProductLotID) REFERENCES ProductBatch(LotID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (IngredientID) REFERENCES Ingredient(IngredientID)
+        ON DELETE RESTRICT
+);
+
+-- Last batch number handed out per LotID prefix
+--  Ingredient lots use '<IngredientID>-<SupplierID>', product lots '<ProductID>-<UserID>'
+CREATE TABLE LotSequence (
+    LotPrefix VARCHAR(255) PRIMARY KEY,
+    LastBatchNumber INT NOT NULL DEFAULT 0 CHECK (LastBatchNumber >= 0)
+);
+
+-- Version counters polled by the application's session caches
+--  'conflicts' is bumped whenever an ingredient, the do-not-combine graph or a formulation changes
+--  'ingredients' is bumped whenever an ingredient is added, renamed or removed
+--  'current_formulations_day' holds TO_DAYS() of the day CurrentFormulation was last re-derived
+CREATE TABLE ChangeCounter (
+    CounterName VARCHAR(64) PRIMARY KEY,
+    Version BIGINT NOT NULL DEFAULT 0
+);
+
+-- On-hand oz per manufacturer and ingredient, one row per expiration date
+--  Kept current by the IngredientBatch triggers (intake, manufacturer claim, consumption);
+--  rebuilt by sp_refresh_inventory_summary after bulk loads with triggers disabled
+CREATE TABLE IngredientInventorySummary (
+    ManufacturerID INT NOT NULL,
+    IngredientID INT NOT NULL,
+    ExpirationDate DATE NOT NULL,
+    OnHandOz DOUBLE NOT NULL DEFAULT 0,
+    LotCount INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (ManufacturerID, IngredientID, ExpirationDate),
+    -- Daily expiry buckets across all ingredients, answered from the index (sp_report_expiry_buckets)
+    INDEX idx_inventory_summary_expiry (ManufacturerID, ExpirationDate, IngredientID, OnHandOz, LotCount),
+    FOREIGN KEY (ManufacturerID) REFERENCES Manufacturer(ManufacturerID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (IngredientID) REFERENCES Ingredient(IngredientID)
+        ON DELETE CASCADE
+);
+
+-- Spend per manufacturer, calendar month (SpendMonth is the 1st), supplier and ingredient
+--  Purchases count in the month a lot is claimed (ReceivedDate), consumption in the month the
+--  product batch was made. Kept current by the IngredientBatch and consumption triggers and
+--  sp_apply_batch_consumption; rebuilt by sp_refresh_supplier_spend after bulk loads
+CREATE TABLE SupplierSpendMonthly (
+    ManufacturerID INT NOT NULL,
+    SpendMonth DATE NOT NULL,
+    SupplierID INT NOT NULL,
+    IngredientID INT NOT NULL,
+    LotsPurchased INT NOT NULL DEFAULT 0,
+    PurchasedOz DOUBLE NOT NULL DEFAULT 0,
+    PurchasedCost DOUBLE NOT NULL DEFAULT 0,
+    ConsumedOz DOUBLE NOT NULL DEFAULT 0,
+    ConsumedCost DOUBLE NOT NULL DEFAULT 0,
+    PRIMARY KEY (ManufacturerID, SpendMonth, SupplierID, IngredientID),
+    FOREIGN KEY (ManufacturerID) REFERENCES Manufacturer(ManufacturerID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (SupplierID) REFERENCES Supplier(SupplierID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (IngredientID) REFERENCES Ingredient(IngredientID)
+        ON DELETE CASCADE
+);
+
+-- Atomic closure of every formulation: oz of each atomic ingredient per oz of the formulation
+--  An atomic formulation maps to its own ingredient at 1.0. Compound materials nested at any depth
+--  expand through their active formulation as of the refresh. Rebuilt by sp_refresh_formulation_expansion
+CREATE TABLE FormulationAtomicExpansion (
+    FormulationID INT NOT NULL,
+    IngredientID INT NOT NULL,
+    OzPerOz DOUBLE NOT NULL,
+    PRIMARY KEY (FormulationID, IngredientID),
+    FOREIGN KEY (FormulationID) REFERENCES Formulation(FormulationID)
+        ON DELETE CASCADE,
+    FOREIGN KEY (IngredientID) REFERENCES Ingredient(IngredientID)
+        ON DELETE CASCADE
+);
+
 
 #### TRIGGERS ########################################
 
@@ -190,7 +316,7 @@ FOR EACH ROW
 BEGIN
     DECLARE v_IngredientID INT;
     DECLARE v_SupplierID INT;
-    DECLARE v_NewBatchID INT;
+    DECLARE v_LotID VARCHAR(255);
     DECLARE v_msg VARCHAR(255);
 
     SELECT IngredientID, SupplierID
@@ -204,13 +330,12 @@ BEGIN
         SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
     END IF;
 
-    -- BatchID is the max of the suppliers current BatchIDs + 1 (in LotID)
-    SELECT COALESCE(MAX(CAST(SUBSTRING_INDEX(LotID, '-B', -1) AS UNSIGNED)), 0) INTO v_NewBatchID
-    FROM IngredientBatch
-    WHERE LotID LIKE CONCAT(v_IngredientID, '-', v_SupplierID, '-%');
-    SET v_NewBatchID = v_NewBatchID + 1;
-
-    SET NEW.LotID = CONCAT(v_IngredientID, '-', v_SupplierID, '-B', LPAD(v_NewBatchID, 4, '0'));
+    -- BatchID is the next value of the ingredient/supplier counter (in LotID)
+    --  Skipped when sp_create_ingredient_batch already assigned the LotID
+    IF NEW.LotID IS NULL OR NEW.LotID = '' THEN
+        CALL sp_next_lot_id(CONCAT(v_IngredientID, '-', v_SupplierID), v_LotID);
+        SET NEW.LotID = v_LotID;
+    END IF;
 END$$
 
 CREATE TRIGGER before_insert_product_batch
@@ -220,7 +345,7 @@ BEGIN
     DECLARE v_ProductID INT;
     DECLARE v_ManufacturerID INT;
     DECLARE v_UserID VARCHAR(7); 
-    DECLARE v_NewBatchID INT;
+    DECLARE v_LotID VARCHAR(255);
     DECLARE v_msg VARCHAR(255);
 
     -- Get ProductID from Recipe
@@ -257,20 +382,20 @@ BEGIN
         SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
     END IF;
 
-    SELECT COALESCE(MAX(CAST(SUBSTRING_INDEX(LotID, '-B', -1) AS UNSIGNED)), 0)
-    INTO v_NewBatchID
-    FROM ProductBatch
-    WHERE LotID LIKE CONCAT(v_ProductID, '-', v_UserID, '-B%');  
-    
-    SET v_NewBatchID = v_NewBatchID + 1;
-    SET NEW.LotID = CONCAT(v_ProductID, '-', v_UserID, '-B', LPAD(v_NewBatchID, 4, '0'));
+    -- BatchID is the next value of the product/manufacturer counter (in LotID)
+    --  Skipped when the caller already assigned the LotID (sp_create_product_batch, sp_reserve_lot_ids)
+    IF NEW.LotID IS NULL OR NEW.LotID = '' THEN
+        CALL sp_next_lot_id(CONCAT(v_ProductID, '-', v_UserID), v_LotID);
+        SET NEW.LotID = v_LotID;
+    END IF;
 END$$
 
+-- Skipped while sp_apply_batch_consumption consumes (@csc540_bulk_consumption); its UPDATE checks expiry itself
 CREATE TRIGGER prevent_expired_consumption
 BEFORE UPDATE ON IngredientBatch
 FOR EACH ROW
 BEGIN
-    IF NOW() > OLD.ExpirationDate THEN
+    IF @csc540_bulk_consumption IS NULL AND NOW() > OLD.ExpirationDate THEN
         IF NEW.TotalQuantityOz <> OLD.TotalQuantityOz THEN
             SIGNAL SQLSTATE '45000'
             SET MESSAGE_TEXT = 'Cannot consume ingredient batch: Past expiration date';
@@ -301,22 +426,91 @@ BEGIN
     SET NEW.UserID = CONCAT(prefix, LPAD(max_number + 1, 3, '0'));
 END$$
 
+-- Consumption rows inserted one at a time (AddProductBatch) draw down their lot here
+--  sp_create_product_batch and production schedules set @csc540_bulk_consumption, and
+--  sp_apply_batch_consumption applies all of their rows in one UPDATE
 DROP TRIGGER IF EXISTS after_insert_consumption$$
 CREATE TRIGGER after_insert_consumption
 AFTER INSERT ON ProductBatchIngredientBatch
 FOR EACH ROW
 BEGIN
-    DECLARE v_pack_size FLOAT;
-    
-    SELECT f.PackSize INTO v_pack_size
-    FROM IngredientBatch ib
-    JOIN Formulation f ON ib.FormulationID = f.FormulationID
-    WHERE ib.LotID = NEW.IngredientLotID;
-    
-    UPDATE IngredientBatch
-    SET TotalQuantityOz = TotalQuantityOz - NEW.QuantityUsed,
-        Quantity = (TotalQuantityOz - NEW.QuantityUsed) / v_pack_size
-    WHERE LotID = NEW.IngredientLotID;
+    DECLARE v_manufacturer_id INT;
+    DECLARE v_formulation_id INT;
+    DECLARE v_production_date DATE;
+
+    IF @csc540_bulk_consumption IS NULL THEN
+        UPDATE IngredientBatch ib
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        SET ib.TotalQuantityOz = ib.TotalQuantityOz - NEW.QuantityUsed,
+            ib.Quantity = ib.Quantity - NEW.QuantityUsed / f.PackSize
+        WHERE ib.LotID = NEW.IngredientLotID;
+
+        SELECT ib.ManufacturerID, ib.FormulationID, pb.ProductionDate
+        INTO v_manufacturer_id, v_formulation_id, v_production_date
+        FROM IngredientBatch ib
+        INNER JOIN ProductBatch pb ON pb.LotID = NEW.ProductLotID
+        WHERE ib.LotID = NEW.IngredientLotID;
+
+        IF v_manufacturer_id IS NOT NULL THEN
+            CALL sp_add_supplier_spend(v_manufacturer_id, v_formulation_id, v_production_date,
+                                       0, 0, NEW.QuantityUsed);
+        END IF;
+    END IF;
+END$$
+
+
+-- Keep IngredientInventorySummary in step with manufacturer-owned lots
+--  Supplier intake has no ManufacturerID yet; the claim in receive_ingredient_batches
+--  and single-row consumption (after_insert_consumption) arrive here as updates.
+--  sp_apply_batch_consumption adjusts the summary itself for the lots it consumes.
+--  The claim (or a lot inserted already owned) is also recorded as a purchase in SupplierSpendMonthly.
+DROP TRIGGER IF EXISTS after_insert_ingredient_batch$$
+CREATE TRIGGER after_insert_ingredient_batch
+AFTER INSERT ON IngredientBatch
+FOR EACH ROW
+BEGIN
+    IF NEW.ManufacturerID IS NOT NULL THEN
+        CALL sp_adjust_inventory_summary(NEW.ManufacturerID, NEW.FormulationID, NEW.ExpirationDate,
+                                         NEW.TotalQuantityOz, NEW.TotalQuantityOz > 0);
+        CALL sp_add_supplier_spend(NEW.ManufacturerID, NEW.FormulationID,
+                                   COALESCE(NEW.ReceivedDate, CURDATE()), 1, NEW.TotalQuantityOz, 0);
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS after_update_ingredient_batch$$
+CREATE TRIGGER after_update_ingredient_batch
+AFTER UPDATE ON IngredientBatch
+FOR EACH ROW
+BEGIN
+    IF @csc540_bulk_consumption IS NULL AND (NOT (OLD.ManufacturerID <=> NEW.ManufacturerID)
+       OR OLD.FormulationID <> NEW.FormulationID
+       OR OLD.ExpirationDate <> NEW.ExpirationDate
+       OR OLD.TotalQuantityOz <> NEW.TotalQuantityOz) THEN
+        IF OLD.ManufacturerID IS NOT NULL THEN
+            CALL sp_adjust_inventory_summary(OLD.ManufacturerID, OLD.FormulationID, OLD.ExpirationDate,
+                                             -OLD.TotalQuantityOz, -(OLD.TotalQuantityOz > 0));
+        END IF;
+        IF NEW.ManufacturerID IS NOT NULL THEN
+            CALL sp_adjust_inventory_summary(NEW.ManufacturerID, NEW.FormulationID, NEW.ExpirationDate,
+                                             NEW.TotalQuantityOz, NEW.TotalQuantityOz > 0);
+        END IF;
+        -- A claim is the purchase
+        IF OLD.ManufacturerID IS NULL AND NEW.ManufacturerID IS NOT NULL THEN
+            CALL sp_add_supplier_spend(NEW.ManufacturerID, NEW.FormulationID,
+                                       COALESCE(NEW.ReceivedDate, CURDATE()), 1, NEW.TotalQuantityOz, 0);
+        END IF;
+    END IF;
+END$$
+
+DROP TRIGGER IF EXISTS after_delete_ingredient_batch$$
+CREATE TRIGGER after_delete_ingredient_batch
+AFTER DELETE ON IngredientBatch
+FOR EACH ROW
+BEGIN
+    IF OLD.ManufacturerID IS NOT NULL THEN
+        CALL sp_adjust_inventory_summary(OLD.ManufacturerID, OLD.FormulationID, OLD.ExpirationDate,
+                                         -OLD.TotalQuantityOz, -(OLD.TotalQuantityOz > 0));
+    END IF;
 END$$
 
 
@@ -354,6 +548,576 @@ BEGIN
     END IF;
 END$$
 
+
+-- Invalidate the session conflict index (conflict_index.py) on any ingredient, DNC or formulation change
+--  and the session ingredient catalog (ingredient_catalog.py) on any ingredient change
+DROP TRIGGER IF EXISTS after_insert_ingredient$$
+CREATE TRIGGER after_insert_ingredient
+AFTER INSERT ON Ingredient
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+    CALL sp_bump_change_counter('ingredients');
+END$$
+
+DROP TRIGGER IF EXISTS after_update_ingredient$$
+CREATE TRIGGER after_update_ingredient
+AFTER UPDATE ON Ingredient
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+    CALL sp_bump_change_counter('ingredients');
+END$$
+
+DROP TRIGGER IF EXISTS after_delete_ingredient$$
+CREATE TRIGGER after_delete_ingredient
+AFTER DELETE ON Ingredient
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+    CALL sp_bump_change_counter('ingredients');
+END$$
+
+DROP TRIGGER IF EXISTS after_insert_do_not_combine$$
+CREATE TRIGGER after_insert_do_not_combine
+AFTER INSERT ON DoNotCombineList
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_update_do_not_combine$$
+CREATE TRIGGER after_update_do_not_combine
+AFTER UPDATE ON DoNotCombineList
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_delete_do_not_combine$$
+CREATE TRIGGER after_delete_do_not_combine
+AFTER DELETE ON DoNotCombineList
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_insert_formulation_material$$
+CREATE TRIGGER after_insert_formulation_material
+AFTER INSERT ON FormulationIngredientList
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_update_formulation_material$$
+CREATE TRIGGER after_update_formulation_material
+AFTER UPDATE ON FormulationIngredientList
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_delete_formulation_material$$
+CREATE TRIGGER after_delete_formulation_material
+AFTER DELETE ON FormulationIngredientList
+FOR EACH ROW
+BEGIN
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_insert_formulation$$
+CREATE TRIGGER after_insert_formulation
+AFTER INSERT ON Formulation
+FOR EACH ROW
+BEGIN
+    -- An atomic formulation's closure is itself; compound ones need their materials first
+    INSERT INTO FormulationAtomicExpansion (FormulationID, IngredientID, OzPerOz)
+    SELECT NEW.FormulationID, IngredientID, 1
+    FROM Ingredient
+    WHERE IngredientID = NEW.IngredientID AND IsCompound = FALSE;
+
+    CALL sp_set_current_formulation(NEW.SupplierID, NEW.IngredientID);
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DROP TRIGGER IF EXISTS after_update_formulation$$
+CREATE TRIGGER after_update_formulation
+AFTER UPDATE ON Formulation
+FOR EACH ROW
+BEGIN
+    IF OLD.SupplierID <> NEW.SupplierID OR OLD.IngredientID <> NEW.IngredientID THEN
+        CALL sp_set_current_formulation(OLD.SupplierID, OLD.IngredientID);
+    END IF;
+    CALL sp_set_current_formulation(NEW.SupplierID, NEW.IngredientID);
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+-- The CurrentFormulation row has already cascaded away; fall back to the previous version
+DROP TRIGGER IF EXISTS after_delete_formulation$$
+CREATE TRIGGER after_delete_formulation
+AFTER DELETE ON Formulation
+FOR EACH ROW
+BEGIN
+    CALL sp_set_current_formulation(OLD.SupplierID, OLD.IngredientID);
+    CALL sp_bump_change_counter('conflicts');
+END$$
+
+DELIMITER ;
+
+#### UTILITY PROCEDURES ########################################
+
+DELIMITER $$
+
+DROP PROCEDURE IF EXISTS sp_next_lot_id$$
+-- Hands out the next LotID for a prefix from the LotSequence counters
+--  The upsert locks the counter row, so concurrent inserts never reuse a number
+CREATE PROCEDURE sp_next_lot_id(
+    IN p_prefix VARCHAR(255),
+    OUT p_lot_id VARCHAR(255)
+)
+BEGIN
+    DECLARE v_NewBatchID INT;
+
+    INSERT INTO LotSequence (LotPrefix, LastBatchNumber)
+    VALUES (p_prefix, 1)
+    ON DUPLICATE KEY UPDATE LastBatchNumber = LastBatchNumber + 1;
+
+    SELECT LastBatchNumber INTO v_NewBatchID
+    FROM LotSequence
+    WHERE LotPrefix = p_prefix;
+
+    SET p_lot_id = CONCAT(p_prefix, '-B', LPAD(v_NewBatchID, 4, '0'));
+END$$
+
+DROP PROCEDURE IF EXISTS sp_reserve_lot_ids$$
+-- Hands out p_count consecutive LotIDs for a prefix at once, as a JSON array
+--  Same numbering as sp_next_lot_id, for callers that insert many batches with executemany
+CREATE PROCEDURE sp_reserve_lot_ids(
+    IN p_prefix VARCHAR(255),
+    IN p_count INT,
+    OUT p_lot_ids JSON
+)
+BEGIN
+    DECLARE v_LastBatchID INT;
+
+    INSERT INTO LotSequence (LotPrefix, LastBatchNumber)
+    VALUES (p_prefix, p_count)
+    ON DUPLICATE KEY UPDATE LastBatchNumber = LastBatchNumber + p_count;
+
+    SELECT LastBatchNumber INTO v_LastBatchID
+    FROM LotSequence
+    WHERE LotPrefix = p_prefix;
+
+    WITH RECURSIVE numbers (BatchNumber) AS (
+        SELECT v_LastBatchID - p_count + 1
+        UNION ALL
+        SELECT BatchNumber + 1 FROM numbers WHERE BatchNumber < v_LastBatchID
+    )
+    SELECT JSON_ARRAYAGG(CONCAT(p_prefix, '-B', LPAD(BatchNumber, 4, '0')))
+    INTO p_lot_ids
+    FROM numbers;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_bump_change_counter$$
+-- Advances a named ChangeCounter version so cached copies know to reload
+CREATE PROCEDURE sp_bump_change_counter(
+    IN p_counter_name VARCHAR(64)
+)
+BEGIN
+    INSERT INTO ChangeCounter (CounterName, Version)
+    VALUES (p_counter_name, 1)
+    ON DUPLICATE KEY UPDATE Version = Version + 1;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_adjust_inventory_summary$$
+-- Applies one lot's change to its IngredientInventorySummary bucket
+CREATE PROCEDURE sp_adjust_inventory_summary(
+    IN p_manufacturer_id INT,
+    IN p_formulation_id INT,
+    IN p_expiration_date DATE,
+    IN p_delta_oz DOUBLE,
+    IN p_delta_lots INT
+)
+BEGIN
+    INSERT INTO IngredientInventorySummary (ManufacturerID, IngredientID, ExpirationDate, OnHandOz, LotCount)
+    SELECT * FROM (
+        SELECT p_manufacturer_id AS ManufacturerID, IngredientID, p_expiration_date AS ExpirationDate,
+               p_delta_oz AS DeltaOz, p_delta_lots AS DeltaLots
+        FROM Formulation
+        WHERE FormulationID = p_formulation_id
+    ) delta
+    ON DUPLICATE KEY UPDATE OnHandOz = OnHandOz + delta.DeltaOz,
+                            LotCount = LotCount + delta.DeltaLots;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_refresh_inventory_summary$$
+-- Rebuilds IngredientInventorySummary from the manufacturer-owned lots
+--  Run after loading IngredientBatch rows with the triggers disabled (fill.sql, generate_data.py)
+CREATE PROCEDURE sp_refresh_inventory_summary()
+BEGIN
+    DELETE FROM IngredientInventorySummary;
+
+    INSERT INTO IngredientInventorySummary (ManufacturerID, IngredientID, ExpirationDate, OnHandOz, LotCount)
+    SELECT ib.ManufacturerID, f.IngredientID, ib.ExpirationDate,
+           SUM(ib.TotalQuantityOz), SUM(ib.TotalQuantityOz > 0)
+    FROM IngredientBatch ib
+    INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+    WHERE ib.ManufacturerID IS NOT NULL
+    GROUP BY ib.ManufacturerID, f.IngredientID, ib.ExpirationDate;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_add_supplier_spend$$
+-- Adds a purchase and/or consumption of one formulation to its SupplierSpendMonthly month
+--  Cost is priced per oz from the formulation's UnitPrice and PackSize
+CREATE PROCEDURE sp_add_supplier_spend(
+    IN p_manufacturer_id INT,
+    IN p_formulation_id INT,
+    IN p_spend_date DATE,
+    IN p_lots INT,
+    IN p_purchased_oz DOUBLE,
+    IN p_consumed_oz DOUBLE
+)
+BEGIN
+    INSERT INTO SupplierSpendMonthly (ManufacturerID, SpendMonth, SupplierID, IngredientID, LotsPurchased,
+                                      PurchasedOz, PurchasedCost, ConsumedOz, ConsumedCost)
+    SELECT * FROM (
+        SELECT p_manufacturer_id AS ManufacturerID,
+               p_spend_date - INTERVAL (DAY(p_spend_date) - 1) DAY AS SpendMonth,
+               SupplierID, IngredientID, p_lots AS DeltaLots,
+               p_purchased_oz AS DeltaPurchasedOz, p_purchased_oz * UnitPrice / PackSize AS DeltaPurchasedCost,
+               p_consumed_oz AS DeltaConsumedOz, p_consumed_oz * UnitPrice / PackSize AS DeltaConsumedCost
+        FROM Formulation
+        WHERE FormulationID = p_formulation_id
+    ) delta
+    ON DUPLICATE KEY UPDATE LotsPurchased = LotsPurchased + delta.DeltaLots,
+                            PurchasedOz = PurchasedOz + delta.DeltaPurchasedOz,
+                            PurchasedCost = PurchasedCost + delta.DeltaPurchasedCost,
+                            ConsumedOz = ConsumedOz + delta.DeltaConsumedOz,
+                            ConsumedCost = ConsumedCost + delta.DeltaConsumedCost;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_refresh_supplier_spend$$
+-- Rebuilds SupplierSpendMonthly from the manufacturer-owned lots and their consumption
+--  A lot's purchase is what is left plus what was consumed from it
+--  Run after loading rows with the triggers disabled (fill.sql, generate_data.py)
+CREATE PROCEDURE sp_refresh_supplier_spend()
+BEGIN
+    DELETE FROM SupplierSpendMonthly;
+
+    INSERT INTO SupplierSpendMonthly (ManufacturerID, SpendMonth, SupplierID, IngredientID,
+                                      LotsPurchased, PurchasedOz, PurchasedCost)
+    SELECT lot.ManufacturerID, lot.SpendMonth, f.SupplierID, f.IngredientID,
+           COUNT(*), SUM(lot.PurchasedOz), SUM(lot.PurchasedOz * f.UnitPrice / f.PackSize)
+    FROM (
+        SELECT ib.ManufacturerID, ib.FormulationID,
+               COALESCE(ib.ReceivedDate, CURDATE()) - INTERVAL (DAY(COALESCE(ib.ReceivedDate, CURDATE())) - 1) DAY
+                   AS SpendMonth,
+               ib.TotalQuantityOz + COALESCE(used.UsedOz, 0) AS PurchasedOz
+        FROM IngredientBatch ib
+        LEFT JOIN (
+            SELECT IngredientLotID, SUM(QuantityUsed) AS UsedOz
+            FROM ProductBatchIngredientBatch
+            GROUP BY IngredientLotID
+        ) used ON used.IngredientLotID = ib.LotID
+        WHERE ib.ManufacturerID IS NOT NULL
+    ) lot
+    INNER JOIN Formulation f ON lot.FormulationID = f.FormulationID
+    GROUP BY lot.ManufacturerID, lot.SpendMonth, f.SupplierID, f.IngredientID;
+
+    INSERT INTO SupplierSpendMonthly (ManufacturerID, SpendMonth, SupplierID, IngredientID,
+                                      ConsumedOz, ConsumedCost)
+    SELECT * FROM (
+        SELECT ib.ManufacturerID,
+               pb.ProductionDate - INTERVAL (DAY(pb.ProductionDate) - 1) DAY AS SpendMonth,
+               f.SupplierID, f.IngredientID,
+               SUM(pbib.QuantityUsed) AS UsedOz,
+               SUM(pbib.QuantityUsed * f.UnitPrice / f.PackSize) AS UsedCost
+        FROM ProductBatchIngredientBatch pbib
+        INNER JOIN ProductBatch pb ON pbib.ProductLotID = pb.LotID
+        INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        WHERE ib.ManufacturerID IS NOT NULL
+        GROUP BY ib.ManufacturerID, SpendMonth, f.SupplierID, f.IngredientID
+    ) consumed
+    ON DUPLICATE KEY UPDATE ConsumedOz = consumed.UsedOz,
+                            ConsumedCost = consumed.UsedCost;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_set_current_formulation$$
+-- Re-points CurrentFormulation for one supplier's ingredient, then re-picks the ingredient's latest version
+CREATE PROCEDURE sp_set_current_formulation(
+    IN p_supplier_id INT,
+    IN p_ingredient_id INT
+)
+BEGIN
+    DECLARE v_latest_id INT;
+
+    DELETE FROM CurrentFormulation
+    WHERE SupplierID = p_supplier_id AND IngredientID = p_ingredient_id;
+
+    INSERT INTO CurrentFormulation (SupplierID, IngredientID, FormulationID)
+    SELECT SupplierID, IngredientID, FormulationID
+    FROM Formulation
+    WHERE SupplierID = p_supplier_id AND IngredientID = p_ingredient_id
+    AND EffectiveStartDate <= CURDATE() AND EffectiveEndDate >= CURDATE()
+    ORDER BY EffectiveStartDate DESC, FormulationID DESC
+    LIMIT 1;
+
+    SELECT cf.FormulationID INTO v_latest_id
+    FROM CurrentFormulation cf
+    INNER JOIN Formulation f ON cf.FormulationID = f.FormulationID
+    WHERE cf.IngredientID = p_ingredient_id
+    ORDER BY f.EffectiveStartDate DESC, f.FormulationID DESC
+    LIMIT 1;
+
+    UPDATE CurrentFormulation
+    SET IsLatestForIngredient = (FormulationID <=> v_latest_id)
+    WHERE IngredientID = p_ingredient_id;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_refresh_current_formulations$$
+-- Rebuilds CurrentFormulation from the effective dates of every version
+--  Run after bulk loads with the triggers disabled (fill.sql, generate_data.py);
+--  sp_ensure_current_formulations runs it when the day changes
+CREATE PROCEDURE sp_refresh_current_formulations()
+BEGIN
+    DELETE FROM CurrentFormulation;
+
+    INSERT INTO CurrentFormulation (SupplierID, IngredientID, FormulationID, IsLatestForIngredient)
+    SELECT SupplierID, IngredientID, FormulationID,
+           ROW_NUMBER() OVER (PARTITION BY IngredientID
+                              ORDER BY EffectiveStartDate DESC, FormulationID DESC) = 1
+    FROM (
+        SELECT SupplierID, IngredientID, FormulationID, EffectiveStartDate,
+               ROW_NUMBER() OVER (PARTITION BY SupplierID, IngredientID
+                                  ORDER BY EffectiveStartDate DESC, FormulationID DESC) AS rn
+        FROM Formulation
+        WHERE CURDATE() BETWEEN EffectiveStartDate AND EffectiveEndDate
+    ) ranked
+    WHERE rn = 1;
+
+    INSERT INTO ChangeCounter (CounterName, Version)
+    VALUES ('current_formulations_day', TO_DAYS(CURDATE()))
+    ON DUPLICATE KEY UPDATE Version = TO_DAYS(CURDATE());
+END$$
+
+DROP PROCEDURE IF EXISTS sp_ensure_current_formulations$$
+-- Re-derives CurrentFormulation if it was last derived on an earlier day, so versions whose
+--  EffectiveStartDate arrives or EffectiveEndDate passes take over without an edit.
+--  Every reader of today's versions calls this first. When a pointer moved, the cached expansions
+--  are rebuilt (nested compounds expand through the current versions) and 'conflicts' is bumped.
+CREATE PROCEDURE sp_ensure_current_formulations()
+BEGIN
+    DECLARE v_added INT;
+    DECLARE v_removed INT;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM ChangeCounter
+        WHERE CounterName = 'current_formulations_day' AND Version = TO_DAYS(CURDATE())
+    ) THEN
+        DROP TEMPORARY TABLE IF EXISTS tmp_previous_current;
+        CREATE TEMPORARY TABLE tmp_previous_current (
+            FormulationID INT PRIMARY KEY,
+            IsLatestForIngredient BOOL NOT NULL
+        );
+        INSERT INTO tmp_previous_current (FormulationID, IsLatestForIngredient)
+        SELECT FormulationID, IsLatestForIngredient FROM CurrentFormulation;
+
+        CALL sp_refresh_current_formulations();
+
+        SELECT COUNT(*) INTO v_added
+        FROM CurrentFormulation cf
+        LEFT JOIN tmp_previous_current prev ON prev.FormulationID = cf.FormulationID
+        WHERE prev.FormulationID IS NULL OR prev.IsLatestForIngredient <> cf.IsLatestForIngredient;
+
+        SELECT COUNT(*) INTO v_removed
+        FROM tmp_previous_current prev
+        LEFT JOIN CurrentFormulation cf ON cf.FormulationID = prev.FormulationID
+        WHERE cf.FormulationID IS NULL;
+
+        DROP TEMPORARY TABLE tmp_previous_current;
+
+        IF v_added + v_removed > 0 THEN
+            CALL sp_refresh_formulation_expansion(NULL);
+            CALL sp_bump_change_counter('conflicts');
+        END IF;
+    END IF;
+END$$
+
+DROP EVENT IF EXISTS ev_refresh_current_formulations$$
+-- Moves the pointers just after midnight, so views read after the day changes are current too
+--  (needs the event scheduler, on by default in MySQL 8; the readers' own check covers it otherwise)
+CREATE EVENT ev_refresh_current_formulations
+ON SCHEDULE EVERY 1 DAY STARTS CURDATE() + INTERVAL 1 DAY + INTERVAL 1 MINUTE
+DO CALL sp_ensure_current_formulations()$$
+
+DROP PROCEDURE IF EXISTS sp_get_active_formulations$$
+-- Active formulation of many ingredients at once: the latest-starting version in effect on p_as_of
+--  p_ingredient_ids: JSON array of IngredientIDs, NULL for every ingredient; p_as_of NULL means today
+--  Today is read from CurrentFormulation; other dates probe idx_formulation_interval per ingredient
+CREATE PROCEDURE sp_get_active_formulations(
+    IN p_ingredient_ids JSON,
+    IN p_as_of DATE
+)
+BEGIN
+    IF p_as_of IS NULL OR p_as_of = CURDATE() THEN
+        CALL sp_ensure_current_formulations();
+
+        SELECT cf.IngredientID, cf.FormulationID, cf.SupplierID
+        FROM CurrentFormulation cf
+        WHERE cf.IsLatestForIngredient = TRUE
+        AND (p_ingredient_ids IS NULL OR cf.IngredientID IN (
+            SELECT jt.IngredientID
+            FROM JSON_TABLE(p_ingredient_ids, '$[*]' COLUMNS (IngredientID INT PATH '$')) jt
+        ))
+        ORDER BY cf.IngredientID;
+    ELSE
+        SELECT i.IngredientID, af.FormulationID, af.SupplierID
+        FROM Ingredient i
+        INNER JOIN LATERAL (
+            SELECT f.FormulationID, f.SupplierID
+            FROM Formulation f
+            WHERE f.IngredientID = i.IngredientID
+            AND f.EffectiveStartDate <= p_as_of
+            AND f.EffectiveEndDate >= p_as_of
+            ORDER BY f.EffectiveStartDate DESC, f.FormulationID DESC
+            LIMIT 1
+        ) af ON TRUE
+        WHERE p_ingredient_ids IS NULL OR i.IngredientID IN (
+            SELECT jt.IngredientID
+            FROM JSON_TABLE(p_ingredient_ids, '$[*]' COLUMNS (IngredientID INT PATH '$')) jt
+        )
+        ORDER BY i.IngredientID;
+    END IF;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_refresh_formulation_expansion$$
+-- Rebuilds FormulationAtomicExpansion for the formulations of p_ingredient_id and for every
+-- formulation that contains that ingredient at any depth (all formulations when NULL)
+--  A material that already appears on its own expansion path is a cycle and is rejected
+CREATE PROCEDURE sp_refresh_formulation_expansion(
+    IN p_ingredient_id INT
+)
+BEGIN
+    DECLARE v_cycle_path VARCHAR(4000);
+    DECLARE v_msg VARCHAR(255);
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_expansion_roots;
+    CREATE TEMPORARY TABLE tmp_expansion_roots (FormulationID INT PRIMARY KEY);
+
+    IF p_ingredient_id IS NULL THEN
+        INSERT INTO tmp_expansion_roots (FormulationID)
+        SELECT FormulationID FROM Formulation;
+    ELSE
+        INSERT INTO tmp_expansion_roots (FormulationID)
+        WITH RECURSIVE Containing AS (
+            SELECT p_ingredient_id AS IngredientID, CAST(p_ingredient_id AS CHAR(4000)) AS Path
+
+            UNION ALL
+
+            SELECT f.IngredientID, CONCAT(c.Path, ',', f.IngredientID)
+            FROM Containing c
+            INNER JOIN FormulationIngredientList fil ON fil.MaterialID = c.IngredientID
+            INNER JOIN Formulation f ON fil.FormulationID = f.FormulationID
+            WHERE FIND_IN_SET(f.IngredientID, c.Path) = 0
+        )
+        SELECT DISTINCT f.FormulationID
+        FROM Containing c
+        INNER JOIN Formulation f ON f.IngredientID = c.IngredientID;
+    END IF;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_expansion;
+    CREATE TEMPORARY TABLE tmp_expansion (
+        RootID INT NOT NULL,
+        IngredientID INT NOT NULL,
+        IsCompound BOOL NOT NULL,
+        OzPerOz DOUBLE NOT NULL,
+        IsCycle BOOL NOT NULL,
+        Path VARCHAR(4000) NOT NULL
+    );
+
+    INSERT INTO tmp_expansion (RootID, IngredientID, IsCompound, OzPerOz, IsCycle, Path)
+    WITH RECURSIVE Expansion AS (
+        SELECT
+            f.FormulationID AS RootID,
+            f.IngredientID,
+            i.IsCompound,
+            f.FormulationID,
+            CAST(1 AS DOUBLE) AS OzPerOz,
+            FALSE AS IsCycle,
+            CAST(f.IngredientID AS CHAR(4000)) AS Path
+        FROM tmp_expansion_roots r
+        INNER JOIN Formulation f ON f.FormulationID = r.FormulationID
+        INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
+
+        UNION ALL
+
+        -- Materials scale by oz per pack; nested compounds continue through their active formulation
+        SELECT
+            e.RootID,
+            fil.MaterialID,
+            i2.IsCompound,
+            af.FormulationID,
+            e.OzPerOz * fil.Quantity / f.PackSize,
+            FIND_IN_SET(fil.MaterialID, e.Path) > 0,
+            CONCAT(e.Path, ',', fil.MaterialID)
+        FROM Expansion e
+        INNER JOIN Formulation f ON e.FormulationID = f.FormulationID
+        INNER JOIN FormulationIngredientList fil ON fil.FormulationID = f.FormulationID
+        INNER JOIN Ingredient i2 ON fil.MaterialID = i2.IngredientID
+        LEFT JOIN CurrentFormulation af
+            ON af.IngredientID = fil.MaterialID AND af.IsLatestForIngredient = TRUE AND i2.IsCompound = TRUE
+        WHERE e.IsCompound = TRUE AND e.IsCycle = FALSE
+    )
+    SELECT RootID, IngredientID, IsCompound, OzPerOz, IsCycle, Path
+    FROM Expansion;
+
+    SELECT Path INTO v_cycle_path
+    FROM tmp_expansion
+    WHERE IsCycle = TRUE
+    LIMIT 1;
+
+    IF v_cycle_path IS NOT NULL THEN
+        SET v_msg = CONCAT('Formulation materials form a cycle through ingredients ', LEFT(v_cycle_path, 180));
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
+    END IF;
+
+    DELETE fae FROM FormulationAtomicExpansion fae
+    INNER JOIN tmp_expansion_roots r ON fae.FormulationID = r.FormulationID;
+
+    INSERT INTO FormulationAtomicExpansion (FormulationID, IngredientID, OzPerOz)
+    SELECT RootID, IngredientID, SUM(OzPerOz)
+    FROM tmp_expansion
+    WHERE IsCompound = FALSE
+    GROUP BY RootID, IngredientID;
+
+    DROP TEMPORARY TABLE tmp_expansion;
+    DROP TEMPORARY TABLE tmp_expansion_roots;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_sync_lot_sequences$$
+-- Re-seeds the LotSequence counters from the LotIDs already stored
+--  Run after loading rows with explicit LotIDs while the triggers are disabled (fill.sql)
+CREATE PROCEDURE sp_sync_lot_sequences()
+BEGIN
+    INSERT INTO LotSequence (LotPrefix, LastBatchNumber)
+    SELECT * FROM (
+        SELECT LotPrefix, MAX(BatchNumber) AS MaxBatchNumber
+        FROM (
+            SELECT SUBSTRING_INDEX(LotID, '-B', 1) AS LotPrefix,
+                   CAST(SUBSTRING_INDEX(LotID, '-B', -1) AS UNSIGNED) AS BatchNumber
+            FROM IngredientBatch
+            UNION ALL
+            SELECT SUBSTRING_INDEX(LotID, '-B', 1),
+                   CAST(SUBSTRING_INDEX(LotID, '-B', -1) AS UNSIGNED)
+            FROM ProductBatch
+        ) lots
+        GROUP BY LotPrefix
+    ) seeded
+    ON DUPLICATE KEY UPDATE LastBatchNumber = GREATEST(LastBatchNumber, seeded.MaxBatchNumber);
+END$$
+
 DELIMITER ;
 
 #### SUPPLIER PROCEDURES ########################################
@@ -398,23 +1162,56 @@ CREATE PROCEDURE sp_get_formulation_conflicts(
     IN p_formulation_id INT
 )
 BEGIN
+    CALL sp_ensure_current_formulations();
+
+    -- Pairs among the formulation's atomic closure, so nested compounds are covered too
     SELECT DISTINCT
-        m1.MaterialID AS Ingredient1ID,
+        m1.IngredientID AS Ingredient1ID,
         i1.IngredientName AS Ingredient1Name,
-        m2.MaterialID AS Ingredient2ID,
+        m2.IngredientID AS Ingredient2ID,
         i2.IngredientName AS Ingredient2Name
-    FROM FormulationIngredientList m1
-    INNER JOIN FormulationIngredientList m2 
+    FROM FormulationAtomicExpansion m1
+    INNER JOIN FormulationAtomicExpansion m2 
         ON m1.FormulationID = m2.FormulationID
-       AND m1.MaterialID < m2.MaterialID
-    INNER JOIN Ingredient i1 ON m1.MaterialID = i1.IngredientID
-    INNER JOIN Ingredient i2 ON m2.MaterialID = i2.IngredientID
+       AND m1.IngredientID < m2.IngredientID
+    INNER JOIN Ingredient i1 ON m1.IngredientID = i1.IngredientID
+    INNER JOIN Ingredient i2 ON m2.IngredientID = i2.IngredientID
     INNER JOIN DoNotCombineList dnc
-        ON (dnc.Ingredient1ID = m1.MaterialID AND dnc.Ingredient2ID = m2.MaterialID)
-         OR (dnc.Ingredient2ID = m1.MaterialID AND dnc.Ingredient1ID = m2.MaterialID)
+        ON (dnc.Ingredient1ID = m1.IngredientID AND dnc.Ingredient2ID = m2.IngredientID)
+         OR (dnc.Ingredient2ID = m1.IngredientID AND dnc.Ingredient1ID = m2.IngredientID)
     WHERE m1.FormulationID = p_formulation_id;
 END$$
 
+DROP PROCEDURE IF EXISTS sp_create_ingredient_batch$$
+-- Creates an ingredient batch and returns its generated LotID
+CREATE PROCEDURE sp_create_ingredient_batch(
+    IN p_formulation_id INT,
+    IN p_quantity FLOAT,
+    IN p_total_quantity_oz FLOAT,
+    IN p_expiration_date DATE,
+    OUT p_lot_id VARCHAR(255)
+)
+BEGIN
+    DECLARE v_IngredientID INT;
+    DECLARE v_SupplierID INT;
+    DECLARE v_msg VARCHAR(255);
+
+    SELECT IngredientID, SupplierID
+    INTO v_IngredientID, v_SupplierID
+    FROM Formulation
+    WHERE FormulationID = p_formulation_id;
+
+    IF v_IngredientID IS NULL THEN
+        SET v_msg = CONCAT('Invalid FormulationID for IngredientBatch: ', p_formulation_id);
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
+    END IF;
+
+    CALL sp_next_lot_id(CONCAT(v_IngredientID, '-', v_SupplierID), p_lot_id);
+
+    INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate)
+    VALUES (p_lot_id, p_formulation_id, p_quantity, p_total_quantity_oz, p_expiration_date);
+END$$
+
 DELIMITER ;
 
 #### MANUFACTURER PROCEDURES ########################################
@@ -451,14 +1248,14 @@ BEGIN
         ib.ExpirationDate,
         CASE 
             WHEN ib.ExpirationDate < CURDATE() THEN 'EXPIRED'
-            WHEN DATEDIFF(ib.ExpirationDate, CURDATE()) <= 7 THEN 'EXPIRING SOON'
+            WHEN ib.ExpirationDate <= CURDATE() + INTERVAL 7 DAY THEN 'EXPIRING SOON'
             ELSE 'GOOD'
         END AS Status
     FROM IngredientBatch ib
     INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
     INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
     WHERE ib.ManufacturerID = p_manufacturer_id
-      AND ib.TotalQuantityOz > 0 
+      AND ib.TotalQuantityOz > 0
     ORDER BY i.IngredientName, ib.ExpirationDate;
 END$$
 
@@ -507,10 +1304,11 @@ CREATE PROCEDURE sp_report_nearly_out_of_stock(
     IN p_manufacturer_id INT
 )
 BEGIN
+    -- On-hand comes from IngredientInventorySummary: one range read per BOM line
     SELECT 
         i.IngredientID,
         i.IngredientName,
-        COALESCE(SUM(ib.TotalQuantityOz), 0) AS TotalOnHandOz,
+        COALESCE(inv.OnHandOz, 0) AS TotalOnHandOz,
         rb.Quantity AS QuantityPerUnit,
         p.DefaultBatchSize AS RequiredForOneBatch,
         (rb.Quantity * p.DefaultBatchSize) AS RequiredForOneBatchTotal,
@@ -522,29 +1320,48 @@ BEGIN
         FROM Recipe
         GROUP BY ProductID
     ) latest_recipe ON latest_recipe.ProductID = p.ProductID
-    INNER JOIN Recipe r ON r.RecipeID = latest_recipe.LatestRecipeID
-    INNER JOIN RecipeBOM rb ON rb.RecipeID = r.RecipeID
+    INNER JOIN RecipeBOM rb ON rb.RecipeID = latest_recipe.LatestRecipeID
     INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
-    LEFT JOIN IngredientBatch ib 
-        ON ib.ManufacturerID = p_manufacturer_id
-       AND ib.ExpirationDate >= CURDATE()
-       AND EXISTS (
-           SELECT 1 FROM Formulation f 
-           WHERE f.FormulationID = ib.FormulationID 
-             AND f.IngredientID = i.IngredientID
-       )
+    LEFT JOIN LATERAL (
+        SELECT SUM(s.OnHandOz) AS OnHandOz
+        FROM IngredientInventorySummary s
+        WHERE s.ManufacturerID = p_manufacturer_id
+          AND s.IngredientID = rb.IngredientID
+          AND s.ExpirationDate >= CURDATE()
+    ) inv ON TRUE
     WHERE p.ManufacturerID = p_manufacturer_id
-    GROUP BY 
-        i.IngredientID, 
-        i.IngredientName, 
-        rb.Quantity, 
-        p.ProductID, 
-        p.ProductName, 
-        p.DefaultBatchSize
-    HAVING TotalOnHandOz < (rb.Quantity * p.DefaultBatchSize)
+      AND COALESCE(inv.OnHandOz, 0) < (rb.Quantity * p.DefaultBatchSize)
     ORDER BY TotalOnHandOz ASC;
 END$$
 
+DROP PROCEDURE IF EXISTS sp_validate_recipe_inventory$$
+-- Per BOM line: oz needed for a run vs. unexpired oz on hand (from IngredientInventorySummary)
+--  ShortfallOz > 0 means the recipe cannot be produced in that quantity
+CREATE PROCEDURE sp_validate_recipe_inventory(
+    IN p_recipe_id INT,
+    IN p_batch_quantity INT,
+    IN p_manufacturer_id INT
+)
+BEGIN
+    SELECT
+        rb.IngredientID,
+        i.IngredientName,
+        rb.Quantity * p_batch_quantity AS NeededOz,
+        COALESCE(inv.OnHandOz, 0) AS OnHandOz,
+        GREATEST(rb.Quantity * p_batch_quantity - COALESCE(inv.OnHandOz, 0), 0) AS ShortfallOz
+    FROM RecipeBOM rb
+    INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
+    LEFT JOIN LATERAL (
+        SELECT SUM(s.OnHandOz) AS OnHandOz
+        FROM IngredientInventorySummary s
+        WHERE s.ManufacturerID = p_manufacturer_id
+          AND s.IngredientID = rb.IngredientID
+          AND s.ExpirationDate >= CURDATE()
+    ) inv ON TRUE
+    WHERE rb.RecipeID = p_recipe_id
+    ORDER BY rb.IngredientID;
+END$$
+
 DROP PROCEDURE IF EXISTS sp_report_almost_expired$$
 CREATE PROCEDURE sp_report_almost_expired(
     IN p_manufacturer_id INT,
@@ -560,16 +1377,40 @@ BEGIN
         DATEDIFF(ib.ExpirationDate, CURDATE()) AS DaysUntilExpiry,
         CASE 
             WHEN ib.ExpirationDate < CURDATE() THEN 'EXPIRED'
-            WHEN DATEDIFF(ib.ExpirationDate, CURDATE()) <= p_days_threshold THEN 'EXPIRING SOON'
-            ELSE 'OK'
+            ELSE 'EXPIRING SOON'
         END AS Status
     FROM IngredientBatch ib
     INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
     INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
     WHERE ib.ManufacturerID = p_manufacturer_id
+      AND ib.ExpirationDate <= CURDATE() + INTERVAL p_days_threshold DAY
       AND ib.TotalQuantityOz > 0
-      AND DATEDIFF(ib.ExpirationDate, CURDATE()) <= p_days_threshold
-    ORDER BY ib.ExpirationDate ASC, i.IngredientName;
+    -- Index order of idx_ingredient_batch_fefo, so no filesort
+    ORDER BY ib.ExpirationDate ASC, ib.LotID ASC;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_report_expiry_buckets$$
+-- On-hand stock per expiration day from today to p_days_threshold days out
+--  Reads one range of the IngredientInventorySummary buckets, so the cost follows the days asked for,
+--  not the lot count or the expired history; expired lots are listed by sp_report_almost_expired
+CREATE PROCEDURE sp_report_expiry_buckets(
+    IN p_manufacturer_id INT,
+    IN p_days_threshold INT
+)
+BEGIN
+    SELECT
+        s.ExpirationDate,
+        DATEDIFF(s.ExpirationDate, CURDATE()) AS DaysUntilExpiry,
+        COUNT(*) AS Ingredients,
+        SUM(s.LotCount) AS LotCount,
+        SUM(s.OnHandOz) AS OnHandOz
+    FROM IngredientInventorySummary s
+    WHERE s.ManufacturerID = p_manufacturer_id
+      AND s.ExpirationDate >= CURDATE()
+      AND s.ExpirationDate <= CURDATE() + INTERVAL p_days_threshold DAY
+      AND s.LotCount > 0
+    GROUP BY s.ExpirationDate
+    ORDER BY s.ExpirationDate;
 END$$
 
 DROP PROCEDURE IF EXISTS sp_get_batch_cost_summary$$
@@ -660,44 +1501,69 @@ BEGIN
     END IF;
 END$$
 
+DROP PROCEDURE IF EXISTS sp_bulk_recall$$
+-- Every product lot affected by a set of suspect ingredient lots, in one pass
+--  Suspects are the union of a JSON array of LotIDs, every lot of a supplier and
+--  every lot of a formulation version (any of the three may be NULL).
+--  One row per affected product lot, listing which suspect lots it consumed.
+CREATE PROCEDURE sp_bulk_recall(
+    IN p_lot_ids        JSON,
+    IN p_supplier_id    INT,
+    IN p_formulation_id INT,
+    IN p_date_from      DATE,
+    IN p_date_to        DATE
+)
+BEGIN
+    WITH SuspectLots AS (
+        SELECT jt.LotID
+        FROM JSON_TABLE(COALESCE(p_lot_ids, JSON_ARRAY()), '$[*]'
+                        COLUMNS (LotID VARCHAR(255) PATH '$')) jt
+        UNION
+        SELECT ib.LotID
+        FROM Formulation f
+        INNER JOIN IngredientBatch ib ON ib.FormulationID = f.FormulationID
+        WHERE f.SupplierID = p_supplier_id
+        UNION
+        SELECT ib.LotID
+        FROM IngredientBatch ib
+        WHERE ib.FormulationID = p_formulation_id
+    )
+    SELECT
+        pb.LotID AS ProductLotID,
+        p.ProductID,
+        p.ProductName,
+        p.ManufacturerID,
+        pb.ProductionDate,
+        pb.BatchQuantity,
+        COUNT(*) AS SuspectLotCount,
+        GROUP_CONCAT(pbib.IngredientLotID ORDER BY pbib.IngredientLotID SEPARATOR ', ') AS SuspectLots
+    FROM SuspectLots sl
+    INNER JOIN ProductBatchIngredientBatch pbib ON pbib.IngredientLotID = sl.LotID
+    INNER JOIN ProductBatch pb ON pb.LotID = pbib.ProductLotID
+    INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
+    INNER JOIN Product p ON r.ProductID = p.ProductID
+    WHERE pb.ProductionDate BETWEEN COALESCE(p_date_from, '1000-01-01') AND COALESCE(p_date_to, '9999-12-31')
+    GROUP BY pb.LotID, p.ProductID, p.ProductName, p.ManufacturerID, pb.ProductionDate, pb.BatchQuantity
+    ORDER BY pb.ProductionDate DESC, pb.LotID;
+END$$
+
 DROP PROCEDURE IF EXISTS sp_get_recipe_conflicts$$
 CREATE PROCEDURE sp_get_recipe_conflicts(
     IN p_recipe_id INT
 )
 BEGIN
-    WITH RECURSIVE FlatRecipe AS (
-        SELECT 
-            rb.IngredientID,
-            i.IsCompound,
-            CAST(NULL AS UNSIGNED) AS FormulationID,
-            1 AS Level
+    CALL sp_ensure_current_formulations();
+
+    -- Compound lines expand through the cached closure of their current formulation
+    WITH AtomicIngredients AS (
+        SELECT DISTINCT COALESCE(fae.IngredientID, rb.IngredientID) AS IngredientID
         FROM RecipeBOM rb
         INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
+        LEFT JOIN CurrentFormulation af
+            ON af.IngredientID = rb.IngredientID AND af.IsLatestForIngredient = TRUE AND i.IsCompound = TRUE
+        LEFT JOIN FormulationAtomicExpansion fae ON fae.FormulationID = af.FormulationID
         WHERE rb.RecipeID = p_recipe_id
-        
-        UNION ALL
-        
-        SELECT 
-            fil.MaterialID AS IngredientID,
-            i2.IsCompound,
-            f.FormulationID,
-            fr.Level + 1 AS Level
-        FROM FlatRecipe fr
-        INNER JOIN (
-            SELECT IngredientID, FormulationID, PackSize,
-                   ROW_NUMBER() OVER (PARTITION BY IngredientID 
-                                      ORDER BY EffectiveStartDate DESC, FormulationID DESC) as rn
-            FROM Formulation
-            WHERE CURDATE() BETWEEN EffectiveStartDate AND EffectiveEndDate
-        ) f ON f.IngredientID = fr.IngredientID AND f.rn = 1
-        INNER JOIN FormulationIngredientList fil ON fil.FormulationID = f.FormulationID
-        INNER JOIN Ingredient i2 ON fil.MaterialID = i2.IngredientID
-        WHERE fr.IsCompound = TRUE AND fr.Level = 1
-    ),
-    AtomicIngredients AS (
-        SELECT DISTINCT IngredientID
-        FROM FlatRecipe
-        WHERE IsCompound = FALSE
+        AND (i.IsCompound = FALSE OR fae.IngredientID IS NOT NULL)
     )
     SELECT DISTINCT
         ai1.IngredientID AS Ingredient1ID,
@@ -714,40 +1580,20 @@ BEGIN
 END$$
 
 DROP PROCEDURE IF EXISTS sp_evaluate_health_risk_for_allocated_lots$$
+-- p_lot_ids is a JSON array of ingredient LotIDs; each one is a primary-key probe
+--  Each lot's atomic ingredients come from the cached closure of its formulation
 CREATE PROCEDURE sp_evaluate_health_risk_for_allocated_lots(
-    IN p_lot_ids TEXT
+    IN p_lot_ids JSON
 )
 BEGIN
-    WITH RECURSIVE FlattenedLots AS (
-        SELECT 
-            f.IngredientID,
-            i.IngredientName,
-            i.IsCompound,
-            ib.FormulationID,
-            1 AS Level
-        FROM IngredientBatch ib
-        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
-        INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
-        WHERE FIND_IN_SET(ib.LotID, p_lot_ids) > 0
-        
-        UNION ALL
-        
-        SELECT 
-            fil.MaterialID AS IngredientID,
-            i2.IngredientName,
-            i2.IsCompound,
-            fl.FormulationID,
-            fl.Level + 1 AS Level
-        FROM FlattenedLots fl
-        INNER JOIN Formulation f ON fl.FormulationID = f.FormulationID
-        INNER JOIN FormulationIngredientList fil ON fil.FormulationID = f.FormulationID
-        INNER JOIN Ingredient i2 ON fil.MaterialID = i2.IngredientID
-        WHERE fl.IsCompound = TRUE AND fl.Level = 1
-    ),
-    AtomicIngredients AS (
-        SELECT DISTINCT IngredientID, IngredientName
-        FROM FlattenedLots
-        WHERE IsCompound = FALSE
+    CALL sp_ensure_current_formulations();
+
+    WITH AtomicIngredients AS (
+        SELECT DISTINCT fae.IngredientID, i.IngredientName
+        FROM JSON_TABLE(p_lot_ids, '$[*]' COLUMNS (LotID VARCHAR(255) PATH '$')) jt
+        INNER JOIN IngredientBatch ib ON ib.LotID = jt.LotID
+        INNER JOIN FormulationAtomicExpansion fae ON fae.FormulationID = ib.FormulationID
+        INNER JOIN Ingredient i ON fae.IngredientID = i.IngredientID
     )
     SELECT DISTINCT
         ai1.IngredientID AS Ingredient1ID,
@@ -761,6 +1607,232 @@ BEGIN
     ORDER BY ai1.IngredientName, ai2.IngredientName;
 END$$
 
+DROP PROCEDURE IF EXISTS sp_get_fefo_allocation_plan$$
+-- Complete FEFO allocation plan for a recipe in one result set
+--  One row per (BOM line, ingredient lot) consumed, earliest expiration first.
+--  Lots are taken while the running total of earlier lots is still short of the
+--  requirement; ShortfallOz > 0 (or a NULL LotID) means the line cannot be covered.
+CREATE PROCEDURE sp_get_fefo_allocation_plan(
+    IN p_recipe_id INT,
+    IN p_batch_quantity INT,
+    IN p_manufacturer_id INT
+)
+BEGIN
+    WITH Requirements AS (
+        SELECT
+            rb.IngredientID,
+            i.IngredientName,
+            rb.Quantity * p_batch_quantity AS NeededOz
+        FROM RecipeBOM rb
+        INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
+        WHERE rb.RecipeID = p_recipe_id
+    ),
+    CandidateLots AS (
+        SELECT
+            f.IngredientID,
+            ib.LotID,
+            ib.ExpirationDate,
+            ib.TotalQuantityOz,
+            f.PackSize,
+            f.UnitPrice,
+            COALESCE(SUM(ib.TotalQuantityOz) OVER (
+                PARTITION BY f.IngredientID
+                ORDER BY ib.ExpirationDate, ib.LotID
+                ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+            ), 0) AS ConsumedBeforeOz,
+            SUM(ib.TotalQuantityOz) OVER (PARTITION BY f.IngredientID) AS AvailableOz
+        FROM IngredientBatch ib
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        WHERE ib.ManufacturerID = p_manufacturer_id
+          AND ib.TotalQuantityOz > 0
+          AND ib.ExpirationDate >= CURDATE()
+          AND f.IngredientID IN (SELECT IngredientID FROM Requirements)
+    )
+    SELECT
+        req.IngredientID,
+        req.IngredientName,
+        req.NeededOz,
+        cl.LotID,
+        LEAST(cl.TotalQuantityOz, req.NeededOz - cl.ConsumedBeforeOz) AS QuantityOz,
+        (LEAST(cl.TotalQuantityOz, req.NeededOz - cl.ConsumedBeforeOz) / cl.PackSize) * cl.UnitPrice AS Cost,
+        GREATEST(req.NeededOz - COALESCE(cl.AvailableOz, 0), 0) AS ShortfallOz
+    FROM Requirements req
+    LEFT JOIN CandidateLots cl
+        ON cl.IngredientID = req.IngredientID
+       AND cl.ConsumedBeforeOz < req.NeededOz
+    ORDER BY req.IngredientID, cl.ExpirationDate, cl.LotID;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_refresh_flattened_bom$$
+-- Rebuilds the ProductBatchFlatBOM rows for one product lot (or every lot when NULL)
+--  Each lot is expanded through FormulationAtomicExpansion, scaled by the oz used
+CREATE PROCEDURE sp_refresh_flattened_bom(
+    IN p_product_lot_id VARCHAR(255)
+)
+BEGIN
+    DELETE FROM ProductBatchFlatBOM
+    WHERE p_product_lot_id IS NULL OR ProductLotID = p_product_lot_id;
+
+    INSERT INTO ProductBatchFlatBOM (ProductLotID, IngredientID, TotalQuantityOz)
+    SELECT pbib.ProductLotID, fae.IngredientID, SUM(pbib.QuantityUsed * fae.OzPerOz)
+    FROM ProductBatchIngredientBatch pbib
+    INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
+    INNER JOIN FormulationAtomicExpansion fae ON fae.FormulationID = ib.FormulationID
+    WHERE p_product_lot_id IS NULL OR pbib.ProductLotID = p_product_lot_id
+    GROUP BY pbib.ProductLotID, fae.IngredientID;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_apply_batch_consumption$$
+-- Applies the consumption rows of newly inserted product lots to inventory
+--  p_product_lot_ids: ["LotID", ...]; the caller inserted their ProductBatchIngredientBatch rows
+--  with @csc540_bulk_consumption set, and this clears it again.
+--  The lots are drawn down with one UPDATE ... JOIN, the inventory summary and spend rollup with one upsert each.
+CREATE PROCEDURE sp_apply_batch_consumption(
+    IN p_product_lot_ids JSON
+)
+BEGIN
+    DECLARE v_lot_count INT;
+
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        SET @csc540_bulk_consumption = NULL;
+        DROP TEMPORARY TABLE IF EXISTS tmp_batch_consumption;
+        RESIGNAL;
+    END;
+
+    -- One row per ingredient lot, since several new batches may draw on the same lot
+    DROP TEMPORARY TABLE IF EXISTS tmp_batch_consumption;
+    CREATE TEMPORARY TABLE tmp_batch_consumption (
+        IngredientLotID VARCHAR(255) PRIMARY KEY,
+        UsedOz DOUBLE NOT NULL
+    );
+
+    INSERT INTO tmp_batch_consumption (IngredientLotID, UsedOz)
+    SELECT pbib.IngredientLotID, SUM(pbib.QuantityUsed)
+    FROM JSON_TABLE(p_product_lot_ids, '$[*]' COLUMNS(lot_id VARCHAR(255) PATH '$')) new_lot
+    INNER JOIN ProductBatchIngredientBatch pbib ON pbib.ProductLotID = new_lot.lot_id
+    GROUP BY pbib.IngredientLotID;
+
+    SET v_lot_count = ROW_COUNT();
+
+    -- Every lot must still be in date and have stock; the same test as prevent_expired_consumption
+    UPDATE IngredientBatch ib
+    INNER JOIN tmp_batch_consumption c ON ib.LotID = c.IngredientLotID
+    INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+    SET ib.TotalQuantityOz = ib.TotalQuantityOz - c.UsedOz,
+        ib.Quantity = ib.Quantity - c.UsedOz / f.PackSize
+    WHERE NOW() <= ib.ExpirationDate
+    AND ib.TotalQuantityOz > 0;
+
+    IF ROW_COUNT() <> v_lot_count THEN
+        SIGNAL SQLSTATE '45000'
+        SET MESSAGE_TEXT = 'Cannot consume ingredient batch: Past expiration date or none on hand';
+    END IF;
+
+    -- The lots all had stock before, so a lot leaves the count once it reaches zero
+    INSERT INTO IngredientInventorySummary (ManufacturerID, IngredientID, ExpirationDate, OnHandOz, LotCount)
+    SELECT * FROM (
+        SELECT ib.ManufacturerID, f.IngredientID, ib.ExpirationDate,
+               -SUM(c.UsedOz) AS DeltaOz, -SUM(ib.TotalQuantityOz <= 0) AS DeltaLots
+        FROM tmp_batch_consumption c
+        INNER JOIN IngredientBatch ib ON c.IngredientLotID = ib.LotID
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        WHERE ib.ManufacturerID IS NOT NULL
+        GROUP BY ib.ManufacturerID, f.IngredientID, ib.ExpirationDate
+    ) delta
+    ON DUPLICATE KEY UPDATE OnHandOz = OnHandOz + delta.DeltaOz,
+                            LotCount = LotCount + delta.DeltaLots;
+
+    -- Consumption counts in the month of the product batch that used it
+    INSERT INTO SupplierSpendMonthly (ManufacturerID, SpendMonth, SupplierID, IngredientID,
+                                      ConsumedOz, ConsumedCost)
+    SELECT * FROM (
+        SELECT ib.ManufacturerID,
+               pb.ProductionDate - INTERVAL (DAY(pb.ProductionDate) - 1) DAY AS SpendMonth,
+               f.SupplierID, f.IngredientID,
+               SUM(pbib.QuantityUsed) AS UsedOz,
+               SUM(pbib.QuantityUsed * f.UnitPrice / f.PackSize) AS UsedCost
+        FROM JSON_TABLE(p_product_lot_ids, '$[*]' COLUMNS(lot_id VARCHAR(255) PATH '$')) new_lot
+        INNER JOIN ProductBatch pb ON pb.LotID = new_lot.lot_id
+        INNER JOIN ProductBatchIngredientBatch pbib ON pbib.ProductLotID = pb.LotID
+        INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        WHERE ib.ManufacturerID IS NOT NULL
+        GROUP BY ib.ManufacturerID, SpendMonth, f.SupplierID, f.IngredientID
+    ) consumed
+    ON DUPLICATE KEY UPDATE ConsumedOz = ConsumedOz + consumed.UsedOz,
+                            ConsumedCost = ConsumedCost + consumed.UsedCost;
+
+    SET @csc540_bulk_consumption = NULL;
+    DROP TEMPORARY TABLE tmp_batch_consumption;
+
+    -- Same expansion as sp_refresh_flattened_bom, for just the new lots
+    INSERT INTO ProductBatchFlatBOM (ProductLotID, IngredientID, TotalQuantityOz)
+    SELECT pbib.ProductLotID, fae.IngredientID, SUM(pbib.QuantityUsed * fae.OzPerOz)
+    FROM JSON_TABLE(p_product_lot_ids, '$[*]' COLUMNS(lot_id VARCHAR(255) PATH '$')) new_lot
+    INNER JOIN ProductBatchIngredientBatch pbib ON pbib.ProductLotID = new_lot.lot_id
+    INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
+    INNER JOIN FormulationAtomicExpansion fae ON fae.FormulationID = ib.FormulationID
+    GROUP BY pbib.ProductLotID, fae.IngredientID;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_create_product_batch$$
+-- Creates a product batch with all of its consumption rows and returns the LotID
+--  p_allocations: [{"ibatch_id": LotID, "ibatch_quantity_used": oz}, ...]
+--  Runs inside the caller's transaction; the caller commits or rolls back.
+--  @csc540_bulk_consumption keeps the per-row consumption triggers out of the way
+--  while sp_apply_batch_consumption draws the lots down in one pass.
+CREATE PROCEDURE sp_create_product_batch(
+    IN p_recipe_id INT,
+    IN p_batch_quantity INT,
+    IN p_production_date DATE,
+    IN p_expiration_date DATE,
+    IN p_batch_cost DECIMAL(10,2),
+    IN p_allocations JSON,
+    OUT p_lot_id VARCHAR(255)
+)
+BEGIN
+    DECLARE v_ProductID INT;
+    DECLARE v_UserID VARCHAR(7);
+    DECLARE v_msg VARCHAR(255);
+
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+        SET @csc540_bulk_consumption = NULL;
+        RESIGNAL;
+    END;
+
+    SELECT p.ProductID, m.UserID
+    INTO v_ProductID, v_UserID
+    FROM Recipe r
+    INNER JOIN Product p ON r.ProductID = p.ProductID
+    INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
+    WHERE r.RecipeID = p_recipe_id;
+
+    IF v_ProductID IS NULL THEN
+        SET v_msg = CONCAT('Invalid RecipeID for ProductBatch: ', p_recipe_id);
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
+    END IF;
+
+    CALL sp_next_lot_id(CONCAT(v_ProductID, '-', v_UserID), p_lot_id);
+
+    INSERT INTO ProductBatch (LotID, RecipeID, BatchQuantity, ProductionDate,
+                              ExpirationDate, BatchCost, PerUnitCost)
+    VALUES (p_lot_id, p_recipe_id, p_batch_quantity, p_production_date,
+            p_expiration_date, p_batch_cost, p_batch_cost / p_batch_quantity);
+
+    SET @csc540_bulk_consumption = 1;
+
+    INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
+    SELECT p_lot_id, item.ibatch_id, item.ibatch_quantity_used
+    FROM JSON_TABLE(p_allocations, '$[*]' COLUMNS(
+        ibatch_id VARCHAR(255) PATH '$.ibatch_id',
+        ibatch_quantity_used DOUBLE PATH '$.ibatch_quantity_used'
+    )) item;
+
+    CALL sp_apply_batch_consumption(JSON_ARRAY(p_lot_id));
+END$$
+
 DROP PROCEDURE IF EXISTS AddProductBatch$$
 -- Adding a product batch
 -- 	Supports manual ingredient batch assignment or automatic consumption (FEFO)
@@ -1016,6 +2088,8 @@ proc_label: BEGIN
 		CLOSE rbom_cursor;
 	END IF;
 
+    CALL sp_refresh_flattened_bom(p_product_batch_id);
+
     -- Success
     COMMIT;
     SET p_success = TRUE;
@@ -1029,7 +2103,18 @@ DELIMITER ;
 DELIMITER $$
 
 DROP PROCEDURE IF EXISTS sp_browse_product_batches$$
-CREATE PROCEDURE sp_browse_product_batches()
+-- One page of product batches, newest first, keyed on (ProductionDate DESC, LotID)
+--  Pass the last row of the previous page as p_after_date/p_after_lot_id (NULL for the first page).
+--  The manufacturer, product and date filters are optional (NULL = any).
+CREATE PROCEDURE sp_browse_product_batches(
+    IN p_manufacturer_id INT,
+    IN p_product_id INT,
+    IN p_date_from DATE,
+    IN p_date_to DATE,
+    IN p_after_date DATE,
+    IN p_after_lot_id VARCHAR(255),
+    IN p_page_size INT
+)
 BEGIN
     SELECT 
         pb.LotID,
@@ -1047,7 +2132,15 @@ BEGIN
     INNER JOIN ProductCategory pc ON p.CategoryID = pc.CategoryID
     INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
     INNER JOIN User u ON m.UserID = u.UserID
-    ORDER BY pb.ProductionDate DESC, pb.LotID;
+    WHERE (p_manufacturer_id IS NULL OR p.ManufacturerID = p_manufacturer_id)
+      AND (p_product_id IS NULL OR p.ProductID = p_product_id)
+      AND (p_date_from IS NULL OR pb.ProductionDate >= p_date_from)
+      AND (p_date_to IS NULL OR pb.ProductionDate <= p_date_to)
+      AND (p_after_date IS NULL
+           OR pb.ProductionDate < p_after_date
+           OR (pb.ProductionDate = p_after_date AND pb.LotID > p_after_lot_id))
+    ORDER BY pb.ProductionDate DESC, pb.LotID
+    LIMIT p_page_size;
 END$$
 
 DROP PROCEDURE IF EXISTS sp_compare_batches_incompatibilities$$
@@ -1068,8 +2161,8 @@ BEGIN
     ELSE
         WITH CombinedIngredients AS (
             SELECT DISTINCT IngredientID
-            FROM vw_flattened_product_bom
-            WHERE BatchLotID IN (p_batch1_lot_id, p_batch2_lot_id)
+            FROM ProductBatchFlatBOM
+            WHERE ProductLotID IN (p_batch1_lot_id, p_batch2_lot_id)
         )
         SELECT DISTINCT
             i1.IngredientID AS Ingredient1ID,
@@ -1136,17 +2229,90 @@ BEGIN
     SELECT 
         s.SupplierID,
         u.Username AS SupplierName,
-        COUNT(DISTINCT ib.LotID) AS BatchesPurchased,
-        SUM(ib.Quantity * f.UnitPrice) AS TotalSpent
-    FROM IngredientBatch ib
-    INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
-    INNER JOIN Supplier s ON f.SupplierID = s.SupplierID
+        SUM(ssm.LotsPurchased) AS BatchesPurchased,
+        SUM(ssm.PurchasedCost) AS TotalSpent
+    FROM SupplierSpendMonthly ssm
+    INNER JOIN Supplier s ON ssm.SupplierID = s.SupplierID
     INNER JOIN User u ON s.UserID = u.UserID
-    WHERE ib.ManufacturerID = p_manufacturer_id
+    WHERE ssm.ManufacturerID = p_manufacturer_id
     GROUP BY s.SupplierID, u.Username
     ORDER BY TotalSpent DESC;
 END$$
 
+DROP PROCEDURE IF EXISTS sp_report_supplier_spend_by_month$$
+-- Purchases and consumption per month and supplier from SupplierSpendMonthly
+--  p_month_from / p_month_to: any day in the first / last month, NULL for no bound
+CREATE PROCEDURE sp_report_supplier_spend_by_month(
+    IN p_manufacturer_id INT,
+    IN p_month_from DATE,
+    IN p_month_to DATE
+)
+BEGIN
+    SELECT
+        ssm.SpendMonth,
+        s.SupplierID,
+        u.Username AS SupplierName,
+        SUM(ssm.LotsPurchased) AS LotsPurchased,
+        SUM(ssm.PurchasedOz) AS PurchasedOz,
+        SUM(ssm.PurchasedCost) AS PurchasedCost,
+        SUM(ssm.ConsumedOz) AS ConsumedOz,
+        SUM(ssm.ConsumedCost) AS ConsumedCost
+    FROM SupplierSpendMonthly ssm
+    INNER JOIN Supplier s ON ssm.SupplierID = s.SupplierID
+    INNER JOIN User u ON s.UserID = u.UserID
+    WHERE ssm.ManufacturerID = p_manufacturer_id
+    AND ssm.SpendMonth >= COALESCE(p_month_from - INTERVAL (DAY(p_month_from) - 1) DAY, '1000-01-01')
+    AND ssm.SpendMonth <= COALESCE(p_month_to, '9999-12-31')
+    GROUP BY ssm.SpendMonth, s.SupplierID, u.Username
+    ORDER BY ssm.SpendMonth, PurchasedCost DESC;
+END$$
+
+DROP PROCEDURE IF EXISTS sp_report_top_spend$$
+-- Top p_limit suppliers ('SUPPLIER') or ingredients ('INGREDIENT') by purchase cost over a month range
+--  Month bounds as in sp_report_supplier_spend_by_month
+CREATE PROCEDURE sp_report_top_spend(
+    IN p_manufacturer_id INT,
+    IN p_month_from DATE,
+    IN p_month_to DATE,
+    IN p_group_by VARCHAR(20),
+    IN p_limit INT
+)
+BEGIN
+    DECLARE v_from DATE DEFAULT COALESCE(p_month_from - INTERVAL (DAY(p_month_from) - 1) DAY, '1000-01-01');
+    DECLARE v_to DATE DEFAULT COALESCE(p_month_to, '9999-12-31');
+    DECLARE v_msg VARCHAR(255);
+
+    IF UPPER(p_group_by) = 'SUPPLIER' THEN
+        SELECT s.SupplierID AS ID, u.Username AS Name,
+               SUM(ssm.LotsPurchased) AS LotsPurchased,
+               SUM(ssm.PurchasedCost) AS PurchasedCost,
+               SUM(ssm.ConsumedCost) AS ConsumedCost
+        FROM SupplierSpendMonthly ssm
+        INNER JOIN Supplier s ON ssm.SupplierID = s.SupplierID
+        INNER JOIN User u ON s.UserID = u.UserID
+        WHERE ssm.ManufacturerID = p_manufacturer_id
+        AND ssm.SpendMonth BETWEEN v_from AND v_to
+        GROUP BY s.SupplierID, u.Username
+        ORDER BY PurchasedCost DESC, s.SupplierID
+        LIMIT p_limit;
+    ELSEIF UPPER(p_group_by) = 'INGREDIENT' THEN
+        SELECT i.IngredientID AS ID, i.IngredientName AS Name,
+               SUM(ssm.LotsPurchased) AS LotsPurchased,
+               SUM(ssm.PurchasedCost) AS PurchasedCost,
+               SUM(ssm.ConsumedCost) AS ConsumedCost
+        FROM SupplierSpendMonthly ssm
+        INNER JOIN Ingredient i ON ssm.IngredientID = i.IngredientID
+        WHERE ssm.ManufacturerID = p_manufacturer_id
+        AND ssm.SpendMonth BETWEEN v_from AND v_to
+        GROUP BY i.IngredientID, i.IngredientName
+        ORDER BY PurchasedCost DESC, i.IngredientID
+        LIMIT p_limit;
+    ELSE
+        SET v_msg = CONCAT('Unknown spend grouping: ', COALESCE(p_group_by, 'NULL'));
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
+    END IF;
+END$$
+
 DROP PROCEDURE IF EXISTS sp_query_product_unit_cost$$
 CREATE PROCEDURE sp_query_product_unit_cost(
     IN p_lot_id VARCHAR(50)
@@ -1234,6 +2400,8 @@ DELIMITER ;
 
 #### OTHER VIEWS ########################################
 
+-- One row per supplier's current version, read from CurrentFormulation instead of scanning history
+--  Kept current across days by ev_refresh_current_formulations
 CREATE OR REPLACE VIEW vw_active_formulations AS
 SELECT 
     f.FormulationID,
@@ -1248,11 +2416,13 @@ SELECT
     f.EffectiveStartDate,
     f.EffectiveEndDate,
     COUNT(fil.MaterialID) AS MaterialCount
-FROM Formulation f
+FROM CurrentFormulation cf
+INNER JOIN Formulation f ON cf.FormulationID = f.FormulationID
 INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
 INNER JOIN Supplier s ON f.SupplierID = s.SupplierID
 INNER JOIN User u ON s.UserID = u.UserID
 LEFT JOIN FormulationIngredientList fil ON f.FormulationID = fil.FormulationID
+-- Views cannot call sp_ensure_current_formulations; never show a pointer whose version has ended
 WHERE CURDATE() BETWEEN f.EffectiveStartDate AND f.EffectiveEndDate
 GROUP BY 
     f.FormulationID, f.IngredientID, i.IngredientName, i.IsCompound,
@@ -1260,68 +2430,24 @@ GROUP BY
     f.UnitPrice, f.EffectiveStartDate, f.EffectiveEndDate
 ORDER BY u.Username, i.IngredientName, f.VersionNumber DESC;
 
+-- Reads the materialized ProductBatchFlatBOM rows, so a BatchLotID filter only touches that batch
 CREATE OR REPLACE VIEW vw_flattened_product_bom AS
-WITH RECURSIVE FlatBOM AS (
-    SELECT 
-        pb.LotID AS BatchLotID,
-        p.ProductID,
-        p.ProductName,
-        m.ManufacturerID,
-        u.Username AS ManufacturerName,
-        pb.ProductionDate,
-        pb.BatchQuantity,
-        f.IngredientID,
-        i.IngredientName,
-        i.IsCompound,
-        pbib.QuantityUsed AS TotalQuantity,
-        ib.FormulationID,
-        1 AS Level
-    FROM ProductBatch pb
-    INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
-    INNER JOIN Product p ON r.ProductID = p.ProductID
-    INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
-    INNER JOIN User u ON m.UserID = u.UserID
-    INNER JOIN ProductBatchIngredientBatch pbib ON pb.LotID = pbib.ProductLotID
-    INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
-    INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
-    INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
-    
-    UNION ALL
-    
-    SELECT 
-        fb.BatchLotID,
-        fb.ProductID,
-        fb.ProductName,
-        fb.ManufacturerID,
-        fb.ManufacturerName,
-        fb.ProductionDate,
-        fb.BatchQuantity,
-        fil.MaterialID AS IngredientID,
-        i2.IngredientName,
-        i2.IsCompound,
-        fb.TotalQuantity * (fil.Quantity / f.PackSize) AS TotalQuantity,
-        fb.FormulationID,
-        fb.Level + 1 AS Level
-    FROM FlatBOM fb
-    INNER JOIN Formulation f ON fb.FormulationID = f.FormulationID
-    INNER JOIN FormulationIngredientList fil ON fil.FormulationID = f.FormulationID
-    INNER JOIN Ingredient i2 ON fil.MaterialID = i2.IngredientID
-    WHERE fb.IsCompound = TRUE 
-      AND fb.Level = 1 
-)
 SELECT 
-    BatchLotID,
-    ProductID,
-    ProductName,
-    ManufacturerID,
-    ManufacturerName,
-    ProductionDate,
-    BatchQuantity,
-    IngredientID,
-    IngredientName,
-    SUM(TotalQuantity) AS TotalQuantityOz
-FROM FlatBOM
-WHERE IsCompound = FALSE 
-GROUP BY BatchLotID, ProductID, ProductName, ManufacturerID, ManufacturerName,
-         ProductionDate, BatchQuantity, IngredientID, IngredientName
+    fb.ProductLotID AS BatchLotID,
+    p.ProductID,
+    p.ProductName,
+    m.ManufacturerID,
+    u.Username AS ManufacturerName,
+    pb.ProductionDate,
+    pb.BatchQuantity,
+    fb.IngredientID,
+    i.IngredientName,
+    fb.TotalQuantityOz
+FROM ProductBatchFlatBOM fb
+INNER JOIN ProductBatch pb ON fb.ProductLotID = pb.LotID
+INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
+INNER JOIN Product p ON r.ProductID = p.ProductID
+INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
+INNER JOIN User u ON m.UserID = u.UserID
+INNER JOIN Ingredient i ON fb.IngredientID = i.IngredientID
 ORDER BY BatchLotID, TotalQuantityOz DESC;
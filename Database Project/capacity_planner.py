@@ -0,0 +1,159 @@
+"""
+CSC540 Database Project - Capacity Planner Module
+Food Manufacturing Inventory Management System
+What-if production capacity for a manufacturer's whole catalog, from one load of its on-hand
+inventory and current recipes
+"""
+
+from datetime import date
+
+
+class CapacityPlanner:
+    def __init__(self, manufacturer_id):
+        self.manufacturer_id = manufacturer_id
+        self.as_of = None
+        self._products = {}   # ProductID -> (ProductName, RecipeID, DefaultBatchSize)
+        self._boms = {}       # ProductID -> [(IngredientID, oz per unit), ...]
+        self._names = {}      # IngredientID -> IngredientName
+        self._stock = {}      # IngredientID -> [(ExpirationDate, oz), ...] in FEFO order
+
+    def load(self, cursor, as_of=None):
+        # Stock is what is still in date on as_of (default today); the inventory summary
+        #  already totals it per expiration date, so FEFO order is the bucket order
+        as_of = as_of or date.today()
+
+        # The newest recipe of each product, as the Create Product Batch menu lists first
+        cursor.execute("""
+            SELECT p.ProductID, p.ProductName, r.RecipeID, p.DefaultBatchSize
+            FROM Product p
+            INNER JOIN LATERAL (
+                SELECT RecipeID
+                FROM Recipe
+                WHERE ProductID = p.ProductID
+                ORDER BY CreationDate DESC, RecipeID DESC
+                LIMIT 1
+            ) r ON TRUE
+            WHERE p.ManufacturerID = %s
+            ORDER BY p.ProductID
+        """, (self.manufacturer_id,))
+        products = {product_id: (product_name, recipe_id, batch_size)
+                    for product_id, product_name, recipe_id, batch_size in cursor.fetchall()}
+
+        boms = {}
+        names = {}
+        if products:
+            recipe_products = {recipe_id: product_id for product_id, (_, recipe_id, _) in products.items()}
+            placeholders = ','.join(['%s'] * len(recipe_products))
+            cursor.execute(f"""
+                SELECT rb.RecipeID, rb.IngredientID, i.IngredientName, rb.Quantity
+                FROM RecipeBOM rb
+                INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
+                WHERE rb.RecipeID IN ({placeholders})
+                ORDER BY rb.RecipeID, rb.IngredientID
+            """, list(recipe_products))
+            for recipe_id, ing_id, ing_name, qty_per_unit in cursor.fetchall():
+                boms.setdefault(recipe_products[recipe_id], []).append((ing_id, float(qty_per_unit)))
+                names[ing_id] = ing_name
+
+        cursor.execute("""
+            SELECT IngredientID, ExpirationDate, OnHandOz
+            FROM IngredientInventorySummary
+            WHERE ManufacturerID = %s
+            AND ExpirationDate >= %s
+            AND OnHandOz > 0
+            ORDER BY IngredientID, ExpirationDate
+        """, (self.manufacturer_id, as_of))
+        stock = {}
+        for ing_id, expiration_date, on_hand_oz in cursor.fetchall():
+            stock.setdefault(ing_id, []).append((expiration_date, float(on_hand_oz)))
+
+        self._products = products
+        self._boms = boms
+        self._names = names
+        self._stock = stock
+        self.as_of = as_of
+
+    def on_hand(self, ingredient_id):
+        return sum(oz for _, oz in self._stock.get(ingredient_id, ()))
+
+    def max_batches(self, product_id, on_hand=None):
+        # (whole standard batches the stock covers, limiting IngredientID); (0, None) without a BOM
+        bom = self._boms.get(product_id)
+        if not bom:
+            return (0, None)
+        if on_hand is None:
+            on_hand = {ing_id: self.on_hand(ing_id) for ing_id, _ in bom}
+
+        batch_size = self._products[product_id][2]
+        best = None
+        for ing_id, qty_per_unit in bom:
+            batches = int(on_hand.get(ing_id, 0.0) // (qty_per_unit * batch_size))
+            if best is None or batches < best[0]:
+                best = (batches, ing_id)
+        return best
+
+    def capacity(self):
+        # (ProductID, ProductName, RecipeID, max units, limiting ingredient name) for every product,
+        #  each on its own against the full stock
+        on_hand = {ing_id: self.on_hand(ing_id) for ing_id in self._stock}
+        rows = []
+        for product_id, (product_name, recipe_id, batch_size) in self._products.items():
+            batches, limiting_id = self.max_batches(product_id, on_hand)
+            rows.append((product_id, product_name, recipe_id, batches * batch_size,
+                         self._names.get(limiting_id)))
+        return rows
+
+    def plan_mix(self, demands=None):
+        # Greedy mix drawn FEFO from one shared copy of the stock.
+        #  demands: [(ProductID, batches wanted), ...] filled in priority order;
+        #  None makes one batch of each product in turn until nothing more fits.
+        # Returns ([(ProductID, ProductName, batches, units), ...],
+        #          {IngredientID: (oz left, earliest expiration of what is left)}) for recipe ingredients
+        stock = {ing_id: [list(bucket) for bucket in buckets] for ing_id, buckets in self._stock.items()}
+        on_hand = {ing_id: self.on_hand(ing_id) for ing_id in self._stock}
+        planned = {}
+
+        def make_batch(product_id):
+            batch_size = self._products[product_id][2]
+            needs = [(ing_id, qty_per_unit * batch_size) for ing_id, qty_per_unit in self._boms[product_id]]
+            if any(on_hand.get(ing_id, 0.0) < needed_oz for ing_id, needed_oz in needs):
+                return False
+            for ing_id, needed_oz in needs:
+                on_hand[ing_id] -= needed_oz
+                for bucket in stock[ing_id]:
+                    used_oz = min(bucket[1], needed_oz)
+                    bucket[1] -= used_oz
+                    needed_oz -= used_oz
+                    if needed_oz <= 0:
+                        break
+            planned[product_id] = planned.get(product_id, 0) + 1
+            return True
+
+        if demands is None:
+            candidates = [product_id for product_id in self._products if self._boms.get(product_id)]
+            while candidates:
+                candidates = [product_id for product_id in candidates if make_batch(product_id)]
+        else:
+            for product_id, batches in demands:
+                if not self._boms.get(product_id):
+                    continue
+                for _ in range(batches):
+                    if not make_batch(product_id):
+                        break
+
+        rows = [(product_id, self._products[product_id][0], batches,
+                 batches * self._products[product_id][2])
+                for product_id, batches in planned.items()]
+        # FEFO leaves the latest-dated stock, so the first non-empty bucket is the next to expire unused
+        leftover = {}
+        for ing_id in self._names:
+            left = [(expiration_date, oz) for expiration_date, oz in stock.get(ing_id, ()) if oz > 0]
+            leftover[ing_id] = (max(on_hand.get(ing_id, 0.0), 0.0), left[0][0] if left else None)
+        return rows, leftover
+
+    def ingredient_name(self, ingredient_id):
+        return self._names.get(ingredient_id)
+
+    def product_name(self, product_id):
+        entry = self._products.get(product_id)
+        return entry[0] if entry else None
@@ -0,0 +1,141 @@
+"""
+CSC540 Database Project - Conflict Index Module
+Food Manufacturing Inventory Management System
+Session-level Do-Not-Combine conflict graph for fast, incremental draft checks
+"""
+
+from datetime import date
+
+CONFLICTS_COUNTER = 'conflicts'
+
+
+class ConflictIndex:
+    def __init__(self):
+        self.version = None
+        self.loaded_on = None
+        self._names = {}              # IngredientID -> IngredientName
+        self._compound = set()        # IngredientIDs that are compound
+        self._bits = {}               # IngredientID -> bit position
+        self._adjacency = {}          # IngredientID -> bitset of DNC partners
+        self._ingredient_atoms = {}   # compound IngredientID -> atomic closure of its active formulation
+        self._formulation_atoms = {}  # FormulationID -> atomic closure (FormulationAtomicExpansion)
+
+    def refresh_if_stale(self, cursor):
+        # On a new day the current versions may have moved; that bumps the counter read below
+        if self.loaded_on != date.today():
+            cursor.callproc('sp_ensure_current_formulations')
+
+        cursor.execute("""
+            SELECT Version FROM ChangeCounter WHERE CounterName = %s
+        """, (CONFLICTS_COUNTER,))
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+
+        # Active formulations depend on the date, so a new day also invalidates the index
+        if version != self.version or self.loaded_on != date.today():
+            self.load(cursor, version)
+
+    def load(self, cursor, version):
+        today = date.today()
+
+        cursor.execute("SELECT IngredientID, IngredientName, IsCompound FROM Ingredient")
+        names = {}
+        compound = set()
+        for ing_id, ing_name, is_compound in cursor.fetchall():
+            names[ing_id] = ing_name
+            if is_compound:
+                compound.add(ing_id)
+        bits = {ing_id: pos for pos, ing_id in enumerate(names)}
+
+        cursor.execute("SELECT Ingredient1ID, Ingredient2ID FROM DoNotCombineList")
+        adjacency = {}
+        for ing1_id, ing2_id in cursor.fetchall():
+            adjacency[ing1_id] = adjacency.get(ing1_id, 0) | (1 << bits[ing2_id])
+            adjacency[ing2_id] = adjacency.get(ing2_id, 0) | (1 << bits[ing1_id])
+
+        cursor.execute("""
+            SELECT fae.FormulationID, fae.IngredientID
+            FROM FormulationAtomicExpansion fae
+            INNER JOIN Formulation f ON fae.FormulationID = f.FormulationID
+            WHERE f.IngredientID <> fae.IngredientID
+        """)
+        formulation_atoms = {}
+        for form_id, mat_id in cursor.fetchall():
+            formulation_atoms.setdefault(form_id, set()).add(mat_id)
+
+        # One active version per ingredient, from the CurrentFormulation pointers
+        cursor.callproc('sp_get_active_formulations', [None, None])
+        ingredient_atoms = {}
+        for result in cursor.stored_results():
+            for ing_id, form_id, _ in result.fetchall():
+                if form_id in formulation_atoms:
+                    ingredient_atoms[ing_id] = formulation_atoms[form_id]
+
+        self._names = names
+        self._compound = compound
+        self._bits = bits
+        self._adjacency = adjacency
+        self._ingredient_atoms = ingredient_atoms
+        self._formulation_atoms = formulation_atoms
+        self.version = version
+        self.loaded_on = today
+
+    def expand_ingredients(self, ingredient_ids):
+        # Compound ingredients become the atomic closure of their active formulation, at any depth
+        atoms = set()
+        for ing_id in ingredient_ids:
+            if ing_id in self._compound:
+                atoms.update(self._ingredient_atoms.get(ing_id, ()))
+            else:
+                atoms.add(ing_id)
+        return atoms
+
+    def _mask(self, atoms):
+        mask = 0
+        for ing_id in atoms:
+            if ing_id in self._bits:
+                mask |= 1 << self._bits[ing_id]
+        return mask
+
+    def _pairs(self, atoms, others_mask, others):
+        # (Ingredient1ID, Ingredient1Name, Ingredient2ID, Ingredient2Name), same shape as the procs
+        pairs = set()
+        for ing_id in atoms:
+            if self._adjacency.get(ing_id, 0) & others_mask:
+                for other_id in others:
+                    if other_id in self._bits and self._adjacency[ing_id] >> self._bits[other_id] & 1:
+                        pairs.add((min(ing_id, other_id), max(ing_id, other_id)))
+        return [(a, self._names.get(a), b, self._names.get(b)) for a, b in sorted(pairs)]
+
+    def conflicts(self, atoms):
+        atoms = set(atoms)
+        return self._pairs(atoms, self._mask(atoms), atoms)
+
+    def conflicts_with(self, atoms, new_ingredient_id):
+        # Incremental check: only pairs between the new ingredient and the current draft
+        new_atoms = self.expand_ingredients([new_ingredient_id])
+        atoms = set(atoms) - new_atoms
+        return self._pairs(new_atoms, self._mask(atoms), atoms)
+
+    def recipe_conflicts(self, ingredient_ids):
+        return self.conflicts(self.expand_ingredients(ingredient_ids))
+
+    def formulation_conflicts(self, formulation_id):
+        return self.conflicts(self._formulation_atoms.get(formulation_id, ()))
+
+    def lot_conflicts(self, lots):
+        # lots: (IngredientID, FormulationID) of allocated ingredient lots, the in-memory
+        #  sp_evaluate_health_risk_for_allocated_lots; an atomic formulation is its own ingredient
+        atoms = set()
+        for ing_id, form_id in lots:
+            atoms.update(self._formulation_atoms.get(form_id, (ing_id,)))
+        return self.conflicts(atoms)
+
+
+# One index shared by every menu in this process
+_session_index = ConflictIndex()
+
+
+def get_conflict_index(cursor):
+    _session_index.refresh_if_stale(cursor)
+    return _session_index
@@ -0,0 +1,75 @@
+"""
+CSC540 Database Project - Connection Pool Module
+Food Manufacturing Inventory Management System
+Shared, health-checked MySQL connection pool for the application and workers
+"""
+
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import errors, pooling
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_CHECKOUT_TIMEOUT = 10  # seconds to wait for a free connection
+
+
+class ConnectionPool:
+    def __init__(self, config, pool_size=DEFAULT_POOL_SIZE,
+                 pool_name='csc540_pool', checkout_timeout=DEFAULT_CHECKOUT_TIMEOUT):
+        self.config = dict(config)
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self._pool = pooling.MySQLConnectionPool(
+            pool_name=pool_name,
+            pool_size=pool_size,
+            pool_reset_session=True,
+            **self.config
+        )
+
+    def get_connection(self):
+        # Wait for a free connection instead of failing as soon as the pool is exhausted
+        if self._pool is None:
+            raise errors.PoolError("Connection pool is closed")
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            try:
+                connection = self._pool.get_connection()
+                break
+            except errors.PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+        # Health check - transparently reconnect a connection the server dropped
+        try:
+            connection.ping(reconnect=True, attempts=3, delay=1)
+        except mysql.connector.Error:
+            connection.close()
+            raise
+        return connection
+
+    @contextmanager
+    def session(self):
+        # Check out one connection + cursor for a single operation, then return it
+        connection = self.get_connection()
+        cursor = connection.cursor()
+        try:
+            yield connection, cursor
+        finally:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+            # Never hand a connection with an open transaction back to the pool
+            try:
+                if connection.in_transaction:
+                    connection.rollback()
+            except mysql.connector.Error:
+                pass
+            connection.close()  # returns the connection to the pool
+
+    def close(self):
+        # Drop the pool so its idle connections are garbage-collected, which closes their sockets;
+        #  a connection still checked out goes with it once its holder closes it
+        self._pool = None
@@ -3,6 +3,12 @@ USE csc540_project;
 -- Clean existing data
 SET FOREIGN_KEY_CHECKS = 0;
 
+TRUNCATE TABLE CurrentFormulation;
+TRUNCATE TABLE FormulationAtomicExpansion;
+TRUNCATE TABLE SupplierSpendMonthly;
+TRUNCATE TABLE IngredientInventorySummary;
+TRUNCATE TABLE LotSequence;
+TRUNCATE TABLE ProductBatchFlatBOM;
 TRUNCATE TABLE ProductBatchIngredientBatch;
 TRUNCATE TABLE ProductBatch;
 TRUNCATE TABLE RecipeBOM;
@@ -101,31 +107,31 @@ INSERT INTO RecipeBOM (RecipeID, IngredientID, Quantity) VALUES
 INSERT INTO DoNotCombineList (Ingredient1ID, Ingredient2ID) VALUES 
     (104, 106);  
 
-INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID) 
+INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID, ReceivedDate) 
 VALUES 
-    ('101-20-B0001', 2, 1000, 1000, '2025-11-15', NULL),    
-    ('101-21-B0001', 3, 800, 800, '2025-10-30', NULL),     
-    ('101-20-B0002', 2, 350, 350, '2025-11-01', 2),        
-    ('101-20-B0003', 2, 500, 500, '2025-12-15', NULL);      
+    ('101-20-B0001', 2, 1000, 1000, '2025-11-15', NULL, NULL),    
+    ('101-21-B0001', 3, 800, 800, '2025-10-30', NULL, NULL),     
+    ('101-20-B0002', 2, 350, 350, '2025-11-01', 2, '2025-09-02'),        
+    ('101-20-B0003', 2, 500, 500, '2025-12-15', NULL, NULL);      
 
-INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID) 
+INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID, ReceivedDate) 
 VALUES 
-    ('102-20-B0001', 4, 600, 600, '2025-12-15', 2);  
+    ('102-20-B0001', 4, 600, 600, '2025-12-15', 2, '2025-09-02');  
     
-INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID) 
+INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID, ReceivedDate) 
 VALUES 
-    ('106-20-B0005', 5, 3000, 3000, '2025-12-15', NULL),   
-    ('106-20-B0006', 5, 0, 0, '2025-12-20', 1);            
+    ('106-20-B0005', 5, 3000, 3000, '2025-12-15', NULL, NULL),   
+    ('106-20-B0006', 5, 0, 0, '2025-12-20', 1, '2025-09-19');            
 
-INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID) 
+INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID, ReceivedDate) 
 VALUES 
-    ('108-20-B0001', 6, 1000, 1000, '2025-09-28', NULL),   
-    ('108-20-B0003', 6, 4200, 4200, '2025-12-31', 2);     
+    ('108-20-B0001', 6, 1000, 1000, '2025-09-28', NULL, NULL),   
+    ('108-20-B0003', 6, 4200, 4200, '2025-12-31', 2, '2025-09-02');     
     
-INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID) 
+INSERT INTO IngredientBatch (LotID, FormulationID, Quantity, TotalQuantityOz, ExpirationDate, ManufacturerID, ReceivedDate) 
 VALUES 
-    ('201-20-B0001', 1, 100, 800, '2025-11-30', NULL),     
-    ('201-20-B0002', 1, 17.5, 140, '2025-12-30', 1);     
+    ('201-20-B0001', 1, 100, 800, '2025-11-30', NULL, NULL),     
+    ('201-20-B0002', 1, 17.5, 140, '2025-12-30', 1, '2025-09-19');     
 
 INSERT INTO ProductBatch (LotID, RecipeID, BatchQuantity, ProductionDate, ExpirationDate, BatchCost, PerUnitCost) 
 VALUES 
@@ -141,6 +147,21 @@ VALUES
     ('101-MFG002-B0101', '108-20-B0003', 2100),
     ('101-MFG002-B0101', '102-20-B0001', 600);
 
+-- Start the LotID counters after the explicit LotIDs loaded above
+CALL sp_sync_lot_sequences();
+
+-- Point at the current formulation versions, expand every formulation to its atomic ingredients,
+-- then flatten the batches loaded above
+CALL sp_refresh_current_formulations();
+CALL sp_refresh_formulation_expansion(NULL);
+CALL sp_refresh_flattened_bom(NULL);
+
+-- Rebuild the on-hand summary for the lots loaded above
+CALL sp_refresh_inventory_summary();
+
+-- Rebuild the monthly supplier spend for the lots and batches loaded above
+CALL sp_refresh_supplier_spend();
+
 DELIMITER $$
 
 CREATE TRIGGER before_insert_ingredient_batch
@@ -149,7 +170,7 @@ FOR EACH ROW
 BEGIN
     DECLARE v_IngredientID INT;
     DECLARE v_SupplierID INT;
-    DECLARE v_NewBatchID INT;
+    DECLARE v_LotID VARCHAR(255);
     DECLARE v_msg VARCHAR(255);
 
     SELECT IngredientID, SupplierID
@@ -163,13 +184,12 @@ BEGIN
         SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
     END IF;
 
-    -- BatchID is the max of the suppliers current BatchIDs + 1 (in LotID)
-    SELECT COALESCE(MAX(CAST(SUBSTRING_INDEX(LotID, '-B', -1) AS UNSIGNED)), 0) INTO v_NewBatchID
-    FROM IngredientBatch
-    WHERE LotID LIKE CONCAT(v_IngredientID, '-', v_SupplierID, '-%');
-    SET v_NewBatchID = v_NewBatchID + 1;
-
-    SET NEW.LotID = CONCAT(v_IngredientID, '-', v_SupplierID, '-B', LPAD(v_NewBatchID, 4, '0'));
+    -- BatchID is the next value of the ingredient/supplier counter (in LotID)
+    --  Skipped when sp_create_ingredient_batch already assigned the LotID
+    IF NEW.LotID IS NULL OR NEW.LotID = '' THEN
+        CALL sp_next_lot_id(CONCAT(v_IngredientID, '-', v_SupplierID), v_LotID);
+        SET NEW.LotID = v_LotID;
+    END IF;
 END$$
 
 CREATE TRIGGER before_insert_product_batch
@@ -179,7 +199,7 @@ BEGIN
     DECLARE v_ProductID INT;
     DECLARE v_ManufacturerID INT;
     DECLARE v_UserID VARCHAR(7); 
-    DECLARE v_NewBatchID INT;
+    DECLARE v_LotID VARCHAR(255);
     DECLARE v_msg VARCHAR(255);
 
     -- Get ProductID from Recipe
@@ -216,20 +236,19 @@ BEGIN
         SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = v_msg;
     END IF;
 
-    SELECT COALESCE(MAX(CAST(SUBSTRING_INDEX(LotID, '-B', -1) AS UNSIGNED)), 0)
-    INTO v_NewBatchID
-    FROM ProductBatch
-    WHERE LotID LIKE CONCAT(v_ProductID, '-', v_UserID, '-B%');  
-    
-    SET v_NewBatchID = v_NewBatchID + 1;
-    SET NEW.LotID = CONCAT(v_ProductID, '-', v_UserID, '-B', LPAD(v_NewBatchID, 4, '0'));
+    -- BatchID is the next value of the product/manufacturer counter (in LotID)
+    --  Skipped when the caller already assigned the LotID (sp_create_product_batch, sp_reserve_lot_ids)
+    IF NEW.LotID IS NULL OR NEW.LotID = '' THEN
+        CALL sp_next_lot_id(CONCAT(v_ProductID, '-', v_UserID), v_LotID);
+        SET NEW.LotID = v_LotID;
+    END IF;
 END$$
 
 CREATE TRIGGER prevent_expired_consumption
 BEFORE UPDATE ON IngredientBatch
 FOR EACH ROW
 BEGIN
-    IF NOW() > OLD.ExpirationDate THEN
+    IF @csc540_bulk_consumption IS NULL AND NOW() > OLD.ExpirationDate THEN
         IF NEW.TotalQuantityOz <> OLD.TotalQuantityOz THEN
             SIGNAL SQLSTATE '45000'
             SET MESSAGE_TEXT = 'Cannot consume ingredient batch: Past expiration date';
@@ -265,17 +284,28 @@ CREATE TRIGGER after_insert_consumption
 AFTER INSERT ON ProductBatchIngredientBatch
 FOR EACH ROW
 BEGIN
-    DECLARE v_pack_size FLOAT;
-    
-    SELECT f.PackSize INTO v_pack_size
-    FROM IngredientBatch ib
-    JOIN Formulation f ON ib.FormulationID = f.FormulationID
-    WHERE ib.LotID = NEW.IngredientLotID;
-    
-    UPDATE IngredientBatch
-    SET TotalQuantityOz = TotalQuantityOz - NEW.QuantityUsed,
-        Quantity = (TotalQuantityOz - NEW.QuantityUsed) / v_pack_size
-    WHERE LotID = NEW.IngredientLotID;
+    DECLARE v_manufacturer_id INT;
+    DECLARE v_formulation_id INT;
+    DECLARE v_production_date DATE;
+
+    IF @csc540_bulk_consumption IS NULL THEN
+        UPDATE IngredientBatch ib
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        SET ib.TotalQuantityOz = ib.TotalQuantityOz - NEW.QuantityUsed,
+            ib.Quantity = ib.Quantity - NEW.QuantityUsed / f.PackSize
+        WHERE ib.LotID = NEW.IngredientLotID;
+
+        SELECT ib.ManufacturerID, ib.FormulationID, pb.ProductionDate
+        INTO v_manufacturer_id, v_formulation_id, v_production_date
+        FROM IngredientBatch ib
+        INNER JOIN ProductBatch pb ON pb.LotID = NEW.ProductLotID
+        WHERE ib.LotID = NEW.IngredientLotID;
+
+        IF v_manufacturer_id IS NOT NULL THEN
+            CALL sp_add_supplier_spend(v_manufacturer_id, v_formulation_id, v_production_date,
+                                       0, 0, NEW.QuantityUsed);
+        END IF;
+    END IF;
 END$$
 
 DELIMITER ;
\ No newline at end of file
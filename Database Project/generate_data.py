@@ -0,0 +1,431 @@
+"""
+CSC540 Database Project - Synthetic Data Generator
+Food Manufacturing Inventory Management System
+Deterministic, seedable bulk data for exercising build.sql at production volume
+"""
+
+import argparse
+import math
+import os
+import random
+import re
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+
+import mysql.connector
+
+BUILD_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'build.sql')
+
+# Same order as fill.sql's clean-up
+TABLES = [
+    'CurrentFormulation', 'FormulationAtomicExpansion', 'SupplierSpendMonthly', 'IngredientInventorySummary',
+    'LotSequence', 'ProductBatchFlatBOM', 'ProductBatchIngredientBatch', 'ProductBatch',
+    'RecipeBOM', 'Recipe', 'Product', 'ProductCategory', 'DoNotCombineList',
+    'IngredientBatch', 'FormulationIngredientList', 'Formulation', 'Ingredient',
+    'Manufacturer', 'Supplier', 'User'
+]
+
+FIRST_SUPPLIER_ID = 20
+FIRST_INGREDIENT_ID = 101
+FIRST_PRODUCT_ID = 100
+OPEN_END_DATE = date(9999, 12, 31)
+AVG_LINKS_PER_BATCH = 8  # ~6.5 BOM lines, some split across two lots
+MIN_OZ = 0.01            # smaller remainders are treated as an empty lot
+
+FIRST_NAMES = ['John', 'Alice', 'Jane', 'James', 'Bob', 'Maria', 'Wei', 'Priya', 'Omar', 'Sofia',
+               'Liam', 'Emma', 'Noah', 'Ava', 'Lucas', 'Mia', 'Ethan', 'Zoe', 'Mateo', 'Aisha']
+LAST_NAMES = ['Smith', 'Lee', 'Doe', 'Miller', 'Johnson', 'Garcia', 'Chen', 'Patel', 'Khan', 'Rossi',
+              'Brown', 'Davis', 'Lopez', 'Wilson', 'Kim', 'Nguyen', 'Clark', 'Young', 'Hall', 'King']
+ATOMIC_BASES = ['Salt', 'Pepper', 'Flour', 'Sugar', 'Butter', 'Garlic', 'Onion', 'Tomato', 'Basil',
+                'Oregano', 'Paprika', 'Cumin', 'Rice', 'Beef', 'Chicken', 'Carrot', 'Celery',
+                'Potato', 'Cheese', 'Milk', 'Egg', 'Yeast', 'Olive Oil', 'Vinegar', 'Honey']
+COMPOUND_BASES = ['Seasoning Blend', 'Sauce Base', 'Spice Mix', 'Dough Mix', 'Marinade',
+                  'Stock Concentrate', 'Glaze', 'Rub']
+CATEGORIES = ['Dinners', 'Sides', 'Soups', 'Sauces', 'Breads', 'Snacks', 'Desserts', 'Breakfast']
+PRODUCT_WORDS = ['Classic', 'Hearty', 'Zesty', 'Smoky', 'Garden', 'Country', 'Spicy', 'Golden']
+PRODUCT_NOUNS = ['Stew', 'Pasta', 'Chili', 'Casserole', 'Pie', 'Bake', 'Soup', 'Roll', 'Curry']
+
+
+class BulkWriter:
+    def __init__(self, connection, chunk_rows):
+        self.connection = connection
+        self.cursor = connection.cursor()
+        self.chunk_rows = chunk_rows
+        self.counts = {}
+        self._buffers = {}  # table -> (columns, pending rows)
+
+    def add(self, table, columns, row):
+        rows = self._buffers.setdefault(table, (columns, []))[1]
+        rows.append(row)
+        if len(rows) >= self.chunk_rows:
+            self.flush(table)
+
+    def flush(self, table=None):
+        for name in ([table] if table else list(self._buffers)):
+            columns, rows = self._buffers[name]
+            if not rows:
+                continue
+            # executemany rewrites a plain INSERT ... VALUES into one multi-row INSERT
+            self.cursor.executemany(f"""
+                INSERT INTO {name} ({', '.join(columns)})
+                VALUES ({', '.join(['%s'] * len(columns))})
+            """, rows)
+            self.connection.commit()
+            self.counts[name] = self.counts.get(name, 0) + len(rows)
+            rows.clear()
+
+
+def plan_sizes(consumption_rows):
+    # Derive the catalog size from the requested number of ProductBatchIngredientBatch rows
+    batches = max(1, math.ceil(consumption_rows / AVG_LINKS_PER_BATCH))
+    manufacturers = max(2, round(math.sqrt(batches) / 25))
+    atomic = max(30, min(4000, batches // 500))
+    return {
+        'manufacturers': manufacturers,
+        'suppliers': max(2, manufacturers // 2),
+        'viewers': 3,
+        'atomic': atomic,
+        'compound': max(5, atomic // 10),
+        'dnc_rules': max(5, atomic // 25),
+        'products_per_manufacturer': max(3, batches // (manufacturers * 250)),
+    }
+
+
+def load_trigger_definitions():
+    # Trigger DDL is read back from build.sql so the bulk load never drifts from the schema
+    with open(BUILD_SQL) as f:
+        script = f.read()
+    return re.findall(r'(CREATE TRIGGER (\w+).*?END)\$\$', script, re.S)
+
+
+class DataGenerator:
+    def __init__(self, writer, seed, consumption_rows, days, end_date):
+        self.writer = writer
+        self.rng = random.Random(seed)
+        self.consumption_rows = consumption_rows
+        self.end_date = end_date
+        self.start_date = end_date - timedelta(days=days)
+        self.days = days
+        self.sizes = plan_sizes(consumption_rows)
+
+        self.manufacturers = []      # (ManufacturerID, UserID)
+        self.supplier_ids = []
+        self.atomic_ids = []
+        self.compound_ids = []
+        self.dnc = set()             # (Ingredient1ID, Ingredient2ID)
+        self.offers = {}             # IngredientID -> [(SupplierID, [(FormulationID, start, end, PackSize, UnitPrice)])]
+        self.compound_atoms = {}     # compound IngredientID -> materials of its first formulation
+        self.products = []           # (ProductID, ManufacturerID, UserID, DefaultBatchSize)
+        self.recipes = {}            # ProductID -> ([CreationDate], [(RecipeID, [(IngredientID, Quantity)])])
+
+        self._open_lots = {}         # (ManufacturerID, IngredientID) -> open lot state
+        self._lot_numbers = {}       # LotID prefix -> last batch number
+
+    def run(self):
+        self.generate_users()
+        self.generate_ingredients()
+        self.generate_formulations()
+        self.generate_products()
+        self.generate_production()
+        self.writer.flush()
+
+    def _date_between(self, start, end):
+        return start + timedelta(days=self.rng.randint(0, max(0, (end - start).days)))
+
+    def _name(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def _next_lot_id(self, prefix):
+        number = self._lot_numbers.get(prefix, 0) + 1
+        self._lot_numbers[prefix] = number
+        return f"{prefix}-B{number:04d}"
+
+    def generate_users(self):
+        user_cols = ('UserID', 'Username', 'UserRole')
+        for m in range(1, self.sizes['manufacturers'] + 1):
+            user_id = f"MFG{m:03d}"
+            self.writer.add('User', user_cols, (user_id, self._name(), 'MANUFACTURER'))
+            self.writer.add('Manufacturer', ('ManufacturerID', 'UserID'), (m, user_id))
+            self.manufacturers.append((m, user_id))
+
+        for s in range(FIRST_SUPPLIER_ID, FIRST_SUPPLIER_ID + self.sizes['suppliers']):
+            user_id = f"SUP{s:03d}"
+            self.writer.add('User', user_cols, (user_id, self._name(), 'SUPPLIER'))
+            self.writer.add('Supplier', ('SupplierID', 'UserID'), (s, user_id))
+            self.supplier_ids.append(s)
+
+        for v in range(1, self.sizes['viewers'] + 1):
+            self.writer.add('User', user_cols, (f"VIEW{v:03d}", self._name(), 'VIEWER'))
+
+    def generate_ingredients(self):
+        ing_id = FIRST_INGREDIENT_ID
+        for _ in range(self.sizes['atomic']):
+            name = f"{self.rng.choice(ATOMIC_BASES)} {ing_id}"
+            self.writer.add('Ingredient', ('IngredientID', 'IngredientName', 'IsCompound'), (ing_id, name, False))
+            self.atomic_ids.append(ing_id)
+            ing_id += 1
+        for _ in range(self.sizes['compound']):
+            name = f"{self.rng.choice(COMPOUND_BASES)} {ing_id}"
+            self.writer.add('Ingredient', ('IngredientID', 'IngredientName', 'IsCompound'), (ing_id, name, True))
+            self.compound_ids.append(ing_id)
+            ing_id += 1
+
+        while len(self.dnc) < self.sizes['dnc_rules']:
+            pair = tuple(sorted(self.rng.sample(self.atomic_ids, 2)))
+            if pair not in self.dnc:
+                self.dnc.add(pair)
+                self.writer.add('DoNotCombineList', ('Ingredient1ID', 'Ingredient2ID'), pair)
+
+    def _conflicts(self, atoms, new_atoms):
+        return any((min(a, b), max(a, b)) in self.dnc for a in atoms for b in new_atoms)
+
+    def generate_formulations(self):
+        form_cols = ('FormulationID', 'IngredientID', 'SupplierID', 'PackSize', 'UnitPrice',
+                     'VersionNumber', 'EffectiveStartDate', 'EffectiveEndDate')
+        form_id = 1
+        history_start = self.start_date - timedelta(days=365)
+
+        catalog = [(i, False) for i in self.atomic_ids] + [(i, True) for i in self.compound_ids]
+        for ing_id, is_compound in catalog:
+            if is_compound:
+                # Materials chosen once per compound so versions stay DNC-free
+                materials = []
+                for mat_id in self.rng.sample(self.atomic_ids, self.rng.randint(2, 5)):
+                    if not self._conflicts(materials, [mat_id]):
+                        materials.append(mat_id)
+                self.compound_atoms[ing_id] = materials
+
+            offers = []
+            for supplier_id in self.rng.sample(self.supplier_ids, min(len(self.supplier_ids), self.rng.randint(1, 3))):
+                versions = []
+                version_count = self.rng.randint(1, 3)
+                # Consecutive, non-overlapping effective ranges; the last version is open-ended
+                starts = sorted(self._date_between(history_start, self.end_date) for _ in range(version_count - 1))
+                starts = [history_start] + starts
+                pack_size = float(self.rng.choice([8, 16, 32, 64, 128]))
+                for v, start in enumerate(starts, start=1):
+                    end = starts[v] - timedelta(days=1) if v < version_count else OPEN_END_DATE
+                    end = max(end, start)
+                    unit_price = round(self.rng.uniform(2, 80), 2)
+                    self.writer.add('Formulation', form_cols,
+                                    (form_id, ing_id, supplier_id, pack_size, unit_price, v, start, end))
+                    if is_compound:
+                        for mat_id in self.compound_atoms[ing_id]:
+                            self.writer.add('FormulationIngredientList',
+                                            ('FormulationID', 'MaterialID', 'Quantity'),
+                                            (form_id, mat_id, self.rng.randint(1, 20)))
+                    versions.append((form_id, start, end, pack_size, unit_price))
+                    form_id += 1
+                offers.append((supplier_id, versions))
+            self.offers[ing_id] = offers
+
+    def generate_products(self):
+        for cat_id, name in enumerate(CATEGORIES, start=1):
+            self.writer.add('ProductCategory', ('CategoryID', 'CategoryName'), (cat_id, name))
+
+        product_id = FIRST_PRODUCT_ID
+        recipe_id = 1
+        for mfg_id, user_id in self.manufacturers:
+            for _ in range(self.sizes['products_per_manufacturer']):
+                name = f"{self.rng.choice(PRODUCT_WORDS)} {self.rng.choice(PRODUCT_NOUNS)} {product_id}"
+                batch_size = self.rng.choice([50, 100, 200, 250, 500])
+                self.writer.add('Product',
+                                ('ProductID', 'CategoryID', 'ManufacturerID', 'ProductName', 'DefaultBatchSize'),
+                                (product_id, self.rng.randint(1, len(CATEGORIES)), mfg_id, name, batch_size))
+                self.products.append((product_id, mfg_id, user_id, batch_size))
+
+                created, versions = [], []
+                recipe_count = self.rng.randint(1, 3)
+                for r in range(recipe_count):
+                    creation = self.start_date + timedelta(days=self.days * r // recipe_count)
+                    bom, atoms = [], []
+                    pool = self.atomic_ids if self.rng.random() < 0.8 else self.atomic_ids + self.compound_ids
+                    for ing_id in self.rng.sample(pool, self.rng.randint(3, 10)):
+                        ing_atoms = self.compound_atoms.get(ing_id, [ing_id])
+                        if self._conflicts(atoms, ing_atoms):
+                            continue
+                        atoms.extend(ing_atoms)
+                        bom.append((ing_id, round(self.rng.uniform(0.1, 4.0), 2)))
+                    self.writer.add('Recipe', ('RecipeID', 'ProductID', 'CreationDate'),
+                                    (recipe_id, product_id, creation))
+                    for ing_id, qty in bom:
+                        self.writer.add('RecipeBOM', ('RecipeID', 'IngredientID', 'Quantity'),
+                                        (recipe_id, ing_id, qty))
+                    created.append(creation)
+                    versions.append((recipe_id, bom))
+                    recipe_id += 1
+                self.recipes[product_id] = (created, versions)
+                product_id += 1
+
+    def _open_lot(self, mfg_id, ing_id, need_oz, production_date):
+        supplier_id, versions = self.rng.choice(self.offers[ing_id])
+        received = production_date - timedelta(days=self.rng.randint(0, 14))
+        form_id, _, _, pack_size, unit_price = next(
+            (v for v in reversed(versions) if v[1] <= received), versions[0])
+        # Enough packages to cover a handful of batches
+        packages = max(1, math.ceil(need_oz * self.rng.uniform(3, 10) / pack_size))
+        expiration = max(received + timedelta(days=self.rng.randint(120, 365)),
+                         production_date + timedelta(days=1))
+        return {
+            'lot_id': self._next_lot_id(f"{ing_id}-{supplier_id}"),
+            'form_id': form_id,
+            'mfg_id': mfg_id,
+            'pack_size': pack_size,
+            'cost_per_oz': unit_price / pack_size,
+            'remaining_oz': packages * pack_size,
+            'expiration': expiration,
+            'received': received,
+        }
+
+    def _close_lot(self, lot):
+        self.writer.add('IngredientBatch',
+                        ('LotID', 'FormulationID', 'ManufacturerID', 'Quantity', 'ExpirationDate', 'TotalQuantityOz',
+                         'ReceivedDate'),
+                        (lot['lot_id'], lot['form_id'], lot['mfg_id'],
+                         lot['remaining_oz'] / lot['pack_size'], lot['expiration'], lot['remaining_oz'],
+                         lot['received']))
+
+    def _consume(self, mfg_id, ing_id, need_oz, production_date):
+        # FEFO within a (manufacturer, ingredient): drain the open lot, then receive the next one
+        key = (mfg_id, ing_id)
+        used = []
+        while need_oz >= MIN_OZ:
+            lot = self._open_lots.get(key)
+            if lot is None or lot['expiration'] <= production_date or lot['remaining_oz'] < MIN_OZ:
+                if lot is not None:
+                    self._close_lot(lot)
+                lot = self._open_lot(mfg_id, ing_id, need_oz, production_date)
+                self._open_lots[key] = lot
+            qty = min(need_oz, lot['remaining_oz'])
+            lot['remaining_oz'] -= qty
+            need_oz -= qty
+            used.append((lot['lot_id'], qty, qty * lot['cost_per_oz']))
+        return used
+
+    def generate_production(self):
+        pb_cols = ('LotID', 'RecipeID', 'ProductionDate', 'ExpirationDate',
+                   'BatchQuantity', 'BatchCost', 'PerUnitCost')
+        link_cols = ('ProductLotID', 'IngredientLotID', 'QuantityUsed')
+        links = 0
+        while links < self.consumption_rows:
+            # Production dates advance with the share of consumption rows written so far
+            production_date = self.start_date + timedelta(days=self.days * links // self.consumption_rows)
+            product_id, mfg_id, user_id, batch_size = self.rng.choice(self.products)
+            created, versions = self.recipes[product_id]
+            recipe_id, bom = versions[max(0, bisect_right(created, production_date) - 1)]
+
+            lot_id = self._next_lot_id(f"{product_id}-{user_id}")
+            allocations = {}
+            for ing_id, qty_per_unit in bom:
+                for ing_lot_id, qty, cost in self._consume(mfg_id, ing_id, qty_per_unit * batch_size, production_date):
+                    used_qty, used_cost = allocations.get(ing_lot_id, (0, 0))
+                    allocations[ing_lot_id] = (used_qty + qty, used_cost + cost)
+            batch_cost = sum(cost for _, cost in allocations.values())
+
+            expiration = production_date + timedelta(days=self.rng.randint(30, 180))
+            self.writer.add('ProductBatch', pb_cols,
+                            (lot_id, recipe_id, production_date, expiration, batch_size,
+                             round(batch_cost, 2), round(batch_cost / batch_size, 4)))
+            for ing_lot_id, (qty, _) in allocations.items():
+                self.writer.add('ProductBatchIngredientBatch', link_cols, (lot_id, ing_lot_id, round(qty, 4)))
+            links += len(allocations)
+
+        # Whatever is left in the open lots is on-hand inventory
+        for lot in self._open_lots.values():
+            self._close_lot(lot)
+
+
+def reset_tables(cursor):
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+
+
+def drop_triggers(cursor, triggers):
+    for _, name in triggers:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def create_triggers(cursor, triggers):
+    for ddl, name in triggers:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(ddl)
+
+
+def finalize(connection, cursor):
+    # Same post-load steps as fill.sql, plus fresh statistics for realistic plans
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cursor.execute("SET UNIQUE_CHECKS = 1")
+    cursor.callproc('sp_sync_lot_sequences')
+    cursor.callproc('sp_refresh_current_formulations')
+    cursor.callproc('sp_refresh_formulation_expansion', [None])
+    cursor.callproc('sp_refresh_flattened_bom', [None])
+    cursor.callproc('sp_refresh_inventory_summary')
+    cursor.callproc('sp_refresh_supplier_spend')
+    cursor.callproc('sp_bump_change_counter', ['conflicts'])
+    cursor.callproc('sp_bump_change_counter', ['ingredients'])
+    connection.commit()
+    cursor.execute(f"ANALYZE TABLE {', '.join(TABLES)}")
+    cursor.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replace the database contents with deterministic synthetic data.")
+    parser.add_argument('--rows', type=int, default=100000,
+                        help="target number of ProductBatchIngredientBatch rows (default 100000)")
+    parser.add_argument('--seed', type=int, default=540, help="random seed (default 540)")
+    parser.add_argument('--days', type=int, default=730, help="days of production history (default 730)")
+    parser.add_argument('--end-date', type=date.fromisoformat, default=date.today(),
+                        help="last production date, YYYY-MM-DD (default today)")
+    parser.add_argument('--chunk-rows', type=int, default=5000, help="rows per multi-row INSERT")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--database', default='csc540_project')
+    args = parser.parse_args(argv)
+
+    password = os.environ.get('MYSQL_PWD')
+    if password is None:
+        password = input("Enter MySQL password: ")
+
+    try:
+        connection = mysql.connector.connect(host=args.host, port=args.port, user=args.user,
+                                             password=password, database=args.database)
+    except mysql.connector.Error as err:
+        print(f"Error: Cannot connect to database: {err}")
+        return 1
+
+    cursor = connection.cursor()
+    triggers = load_trigger_definitions()
+    started = time.monotonic()
+    try:
+        # Row triggers would rewrite the explicit LotIDs/UserIDs and double-count consumption
+        drop_triggers(cursor, triggers)
+        cursor.execute("SET UNIQUE_CHECKS = 0")
+        reset_tables(cursor)
+
+        writer = BulkWriter(connection, args.chunk_rows)
+        DataGenerator(writer, args.seed, args.rows, args.days, args.end_date).run()
+        print("Rows loaded:")
+        for table in reversed(TABLES):
+            if table in writer.counts:
+                print(f"  {table:<30} {writer.counts[table]:>12,}")
+    except mysql.connector.Error as err:
+        print(f"Database error during load: {err}")
+        connection.rollback()
+        return 1
+    finally:
+        create_triggers(cursor, triggers)
+
+    finalize(connection, cursor)
+    print(f"Done in {time.monotonic() - started:.1f}s")
+    cursor.close()
+    connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+CSC540 Database Project - Ingredient Catalog Module
+Food Manufacturing Inventory Management System
+Session-level ingredient names and types with a name-prefix index for draft editors
+"""
+
+from bisect import bisect_left
+
+INGREDIENTS_COUNTER = 'ingredients'
+MAX_LISTED = 25  # catalogs larger than this are searched by prefix instead of listed
+
+
+class IngredientCatalog:
+    def __init__(self):
+        self.version = None
+        self._entries = {}    # IngredientID -> (IngredientName, IsCompound)
+        self._by_name = []    # sorted (lowercase IngredientName, IngredientID)
+
+    def refresh_if_stale(self, cursor):
+        cursor.execute("""
+            SELECT Version FROM ChangeCounter WHERE CounterName = %s
+        """, (INGREDIENTS_COUNTER,))
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+
+        if version != self.version:
+            self.load(cursor, version)
+
+    def load(self, cursor, version):
+        cursor.execute("SELECT IngredientID, IngredientName, IsCompound FROM Ingredient")
+        entries = {ing_id: (ing_name, bool(is_compound))
+                   for ing_id, ing_name, is_compound in cursor.fetchall()}
+
+        self._entries = entries
+        self._by_name = sorted((name.lower(), ing_id) for ing_id, (name, _) in entries.items())
+        self.version = version
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, ingredient_id):
+        return ingredient_id in self._entries
+
+    def name(self, ingredient_id, default="UNKNOWN"):
+        entry = self._entries.get(ingredient_id)
+        return entry[0] if entry else default
+
+    def is_compound(self, ingredient_id):
+        entry = self._entries.get(ingredient_id)
+        return entry[1] if entry else False
+
+    def search(self, prefix='', atomic_only=False, limit=None):
+        # (IngredientID, IngredientName, IsCompound) in name order; binary search on the prefix
+        prefix = prefix.lower()
+        matches = []
+        for pos in range(bisect_left(self._by_name, (prefix,)), len(self._by_name)):
+            name, ing_id = self._by_name[pos]
+            if not name.startswith(prefix) or (limit is not None and len(matches) >= limit):
+                break
+            ing_name, is_compound = self._entries[ing_id]
+            if not (atomic_only and is_compound):
+                matches.append((ing_id, ing_name, is_compound))
+        return matches
+
+
+def print_ingredients(rows):
+    print(f"\n{'ID':<6} {'Ingredient Name':<30} {'Type':<10}")
+    print("-"*50)
+    for ing_id, name, is_compound in rows:
+        print(f"{ing_id:<6} {name:<30} {'Compound' if is_compound else 'Atomic':<10}")
+
+
+def choose_ingredient(catalog, prompt, atomic_only=False, show_list=True):
+    # Returns an IngredientID entered directly or found by name prefix; None on 0 / cancel
+    if show_list and len(catalog) <= MAX_LISTED:
+        print_ingredients(catalog.search(atomic_only=atomic_only))
+    elif show_list:
+        print(f"\n{len(catalog)} ingredients - enter an ID, or the start of a name to search.")
+
+    while True:
+        entry = input(prompt).strip()
+        if entry in ('', '0'):
+            return None
+
+        if entry.isdigit():
+            ing_id = int(entry)
+            if ing_id not in catalog:
+                print("Error: Unknown IngredientID.")
+            elif atomic_only and catalog.is_compound(ing_id):
+                print("Error: Only atomic ingredients can be used here.")
+            else:
+                return ing_id
+            continue
+
+        matches = catalog.search(entry, atomic_only=atomic_only, limit=MAX_LISTED + 1)
+        if not matches:
+            print(f"No ingredients start with '{entry}'.")
+        elif len(matches) == 1:
+            print(f"Selected {matches[0][1]} (ID {matches[0][0]})")
+            return matches[0][0]
+        else:
+            print_ingredients(matches[:MAX_LISTED])
+            if len(matches) > MAX_LISTED:
+                print(f"... more than {MAX_LISTED} matches, type more of the name.")
+
+
+# One catalog shared by every menu in this process
+_session_catalog = IngredientCatalog()
+
+
+def get_ingredient_catalog(cursor):
+    _session_catalog.refresh_if_stale(cursor)
+    return _session_catalog
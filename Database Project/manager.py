@@ -8,6 +8,8 @@ import mysql.connector
 from mysql.connector import errorcode
 import sys
 
+from db_pool import ConnectionPool, DEFAULT_POOL_SIZE
+
 # Import role menu modules
 from supplier_menu import SupplierMenu
 from manufacturer_menu import ManufacturerMenu
@@ -34,10 +36,11 @@ def validate_credentials():
     
     return db_config
 
-def connect_to_database(config):
+def connect_to_database(config, pool_size=DEFAULT_POOL_SIZE):
+    # Returns a shared connection pool; callers check out a connection per operation
     try:
-        connection = mysql.connector.connect(**config)
-        return connection
+        pool = ConnectionPool(config, pool_size=pool_size)
+        return pool
     except mysql.connector.Error as err:
         if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
             print('Error: Invalid database credentials')
@@ -97,14 +100,15 @@ def select_role_menu():
         except ValueError:
             print("Invalid input. Please enter a number.")
 
-def run_manufacturer_menu(connection, cursor, user_id):
+def run_manufacturer_menu(pool, user_id):
     # Get manufacturer ID for this user
-    cursor.execute("""
-        SELECT ManufacturerID
-        FROM Manufacturer
-        WHERE UserID = %s
-    """, (user_id,))
-    query_output = cursor.fetchone()
+    with pool.session() as (connection, cursor):
+        cursor.execute("""
+            SELECT ManufacturerID
+            FROM Manufacturer
+            WHERE UserID = %s
+        """, (user_id,))
+        query_output = cursor.fetchone()
 
     if query_output is None:
         print("\nError: No manufacturer record found for this user.")
@@ -113,18 +117,19 @@ def run_manufacturer_menu(connection, cursor, user_id):
 
     manufacturer_id = query_output[0]
 
-    manu_menu = ManufacturerMenu(connection, cursor, user_id, manufacturer_id)
+    manu_menu = ManufacturerMenu(pool, user_id, manufacturer_id)
     manu_menu.run()
 
-def run_supplier_menu(connection, cursor, user_id):
+def run_supplier_menu(pool, user_id):
     # Get supplier ID for this user
-    cursor.execute("""
-        SELECT SupplierID 
-        FROM Supplier 
-        WHERE UserID = %s
-    """, (user_id,))
-    
-    query_output = cursor.fetchone()
+    with pool.session() as (connection, cursor):
+        cursor.execute("""
+            SELECT SupplierID 
+            FROM Supplier 
+            WHERE UserID = %s
+        """, (user_id,))
+        query_output = cursor.fetchone()
+
     if query_output is None:
         print("\nError: No supplier record found for this user.")
         input("\nPress Enter to continue...")
@@ -133,17 +138,17 @@ def run_supplier_menu(connection, cursor, user_id):
     supplier_id = query_output[0]
     
     # Create and run supplier menu
-    supplier_menu = SupplierMenu(connection, cursor, user_id, supplier_id)
+    supplier_menu = SupplierMenu(pool, user_id, supplier_id)
     supplier_menu.run()
 
-def run_viewer_menu(connection, cursor, user_id):
+def run_viewer_menu(pool, user_id):
     # Create and run viewer menu
-    viewer_menu = ViewerMenu(connection, cursor, user_id)
+    viewer_menu = ViewerMenu(pool, user_id)
     viewer_menu.run()
 
-def run_query_menu(connection, cursor):
+def run_query_menu(pool):
     # Create and run query menu
-    query_menu = QueryMenu(connection, cursor)
+    query_menu = QueryMenu(pool)
     query_menu.run()
 
 def main():
@@ -151,17 +156,17 @@ def main():
     db_config = validate_credentials()
     
     # Connect to database
-    connection = connect_to_database(db_config)
-    if connection is None:
+    pool = connect_to_database(db_config)
+    if pool is None:
         print("Failed to connect to database. Exiting.")
         sys.exit(1)
     
-    cursor = connection.cursor()
     print("\nConnected to database successfully!")
     
     try:
         # Login
-        user_id, user_role = login(cursor)
+        with pool.session() as (connection, cursor):
+            user_id, user_role = login(cursor)
         
         # Main application loop
         while True:
@@ -175,7 +180,7 @@ def main():
                     print("Your role is:", user_role)
                     input("\nPress Enter to continue...")
                     continue
-                run_manufacturer_menu(connection, cursor, user_id)
+                run_manufacturer_menu(pool, user_id)
                 
             elif menu_choice == 2:
                 # Check if user can access supplier role
@@ -184,15 +189,15 @@ def main():
                     print("Your role is:", user_role)
                     input("\nPress Enter to continue...")
                     continue
-                run_supplier_menu(connection, cursor, user_id)
+                run_supplier_menu(pool, user_id)
                 
             elif menu_choice == 3:
                 # Anyone can access viewer menu
-                run_viewer_menu(connection, cursor, user_id)
+                run_viewer_menu(pool, user_id)
                 
             elif menu_choice == 4:
                 # Anyone can access query menu
-                run_query_menu(connection, cursor)
+                run_query_menu(pool)
             
             # Ask if user wants to continue or logout
             print("\n" + "="*60)
@@ -207,9 +212,8 @@ def main():
         print(f"\nAn unexpected error occurred: {e}")
     finally:
         # Clean up
-        cursor.close()
-        connection.close()
-        print("Database connection closed.")
+        pool.close()
+        print("Database connections closed.")
         print("Thank you for using the Inventory Management System!")
 
 if __name__ == "__main__":
@@ -4,13 +4,25 @@ Graduate Version - UPDATED to use stored procedures
 Food Manufacturing Inventory Management System
 """
 
+import json
+import time
 import mysql.connector
+from mysql.connector import errorcode
 from datetime import date, datetime, timedelta
+from capacity_planner import CapacityPlanner
+from conflict_index import get_conflict_index
+from ingredient_catalog import get_ingredient_catalog, choose_ingredient
+
+MAX_ALLOCATION_ATTEMPTS = 5   # commit attempts when lots are locked by other producers
+RETRY_BACKOFF_SECONDS = 0.2   # grows linearly with each attempt
+LOCK_CHUNK_LOTS = 8           # FEFO lots locked per round trip
+SCHEDULE_GROUP_SIZE = 10      # production schedule jobs inserted per transaction
 
 class ManufacturerMenu:
-    def __init__(self, connection, cursor, user_id, manufacturer_id):
-        self.connection = connection
-        self.cursor = cursor
+    def __init__(self, pool, user_id, manufacturer_id):
+        self.pool = pool
+        self.connection = None
+        self.cursor = None
         self.user_id = user_id
         self.manufacturer_id = manufacturer_id
 
@@ -55,34 +67,37 @@ class ManufacturerMenu:
                 print("Invalid input. Please enter a number.")
                 continue
 
-            try:
-                if choice == 1:
-                    self.manage_products()
-                elif choice == 2:
-                    self.maintain_recipes()
-                elif choice == 3:
-                    self.receive_ingredient_batches()
-                elif choice == 4:
-                    self.create_product_batch()
-                elif choice == 5:
-                    self.reports_menu()
-                elif choice == 6:
-                    self.recall_traceability_menu()
-                elif choice == 7:
-                    self.view_ingredient_inventory()
-                elif choice == 8:
-                    self.view_product_batches()
-                elif choice == 9:  
-                    print("\nReturning to role selection...")
-                    break
-                else:
-                    print("Invalid choice. Please enter 1-9.")  
-            except mysql.connector.Error as err:
-                print(f"Database error: {err}")
-                self.connection.rollback()
-            except Exception as e:
-                print(f"Unexpected error: {e}")
-                self.connection.rollback()
+            # Check out a pooled connection for this operation only
+            with self.pool.session() as (connection, cursor):
+                self.connection, self.cursor = connection, cursor
+                try:
+                    if choice == 1:
+                        self.manage_products()
+                    elif choice == 2:
+                        self.maintain_recipes()
+                    elif choice == 3:
+                        self.receive_ingredient_batches()
+                    elif choice == 4:
+                        self.create_product_batch()
+                    elif choice == 5:
+                        self.reports_menu()
+                    elif choice == 6:
+                        self.recall_traceability_menu()
+                    elif choice == 7:
+                        self.view_ingredient_inventory()
+                    elif choice == 8:
+                        self.view_product_batches()
+                    elif choice == 9:  
+                        print("\nReturning to role selection...")
+                        break
+                    else:
+                        print("Invalid choice. Please enter 1-9.")  
+                except mysql.connector.Error as err:
+                    print(f"Database error: {err}")
+                    self.connection.rollback()
+                except Exception as e:
+                    print(f"Unexpected error: {e}")
+                    self.connection.rollback()
 
     # 1) Manage Products
     def manage_products(self):
@@ -410,15 +425,12 @@ class ManufacturerMenu:
         while True:
             # Display current draft
             print("\n--- Current Recipe Draft ---")
+            catalog = get_ingredient_catalog(self.cursor)
             if draft_bom:
                 print(f"{'IngredientID':<12} {'Name':<30} {'Qty per Unit (oz)':<18}")
                 print("-"*65)
                 for ing_id, qty in draft_bom.items():
-                    self.cursor.execute("SELECT IngredientName FROM Ingredient WHERE IngredientID = %s",
-                                        (ing_id,))
-                    name_row = self.cursor.fetchone()
-                    name = name_row[0] if name_row else "UNKNOWN"
-                    print(f"{ing_id:<12} {name:<30} {qty:<18.3f}")
+                    print(f"{ing_id:<12} {catalog.name(ing_id):<30} {qty:<18.3f}")
             else:
                 print("No ingredients in this draft yet.")
 
@@ -431,26 +443,18 @@ class ManufacturerMenu:
             choice = input("Selection: ").strip()
             if choice == "1":
                 # Add / update ingredient
-                self.cursor.execute("""
-                    SELECT IngredientID, IngredientName, IsCompound
-                    FROM Ingredient
-                    ORDER BY IngredientName
-                """)
-                print(f"\n{'ID':<6} {'Ingredient Name':<30} {'Type':<10}")
-                print("-"*50)
-                for ing_id, name, is_comp in self.cursor.fetchall():
-                    t = "Compound" if is_comp else "Atomic"
-                    print(f"{ing_id:<6} {name:<30} {t:<10}")
-
-                try:
-                    ing_id = int(input("\nEnter IngredientID to add/update (0 to cancel): "))
-                except ValueError:
-                    print("Invalid IngredientID.")
-                    continue
-                if ing_id == 0:
+                ing_id = choose_ingredient(
+                    catalog, "\nEnter IngredientID or name to add/update (0 to cancel): ")
+                if ing_id is None:
                     continue
 
                 qty = self.validate_positive_number("Quantity per unit (oz): ", float)
+
+                # Incremental do-not-combine check against the rest of the draft
+                index = get_conflict_index(self.cursor)
+                others = [i for i in draft_bom if i != ing_id]
+                for c in index.conflicts_with(index.expand_ingredients(others), ing_id):
+                    print(f"WARNING: {c[1]} should not be combined with {c[3]}")
                 draft_bom[ing_id] = qty
 
             elif choice == "2":
@@ -483,6 +487,8 @@ class ManufacturerMenu:
     def _commit_recipe_version(self, product_id, draft_bom):
         print("\nCommitting new recipe version...")
         try:
+            conflicts = get_conflict_index(self.cursor).recipe_conflicts(draft_bom)
+
             self.ensure_clean_transaction()
             self.connection.start_transaction()
 
@@ -501,26 +507,19 @@ class ManufacturerMenu:
                     VALUES (%s, %s, %s)
                 """, (recipe_id, ing_id, qty))
 
-            # Check for incompatibilities
-            has_conflicts, conflicts = self.check_recipe_conflicts(recipe_id)
-
-            # Check for conflicts
-            self.cursor.callproc('sp_get_recipe_conflicts', [recipe_id])
-
-            for result in self.cursor.stored_results():
-                conflicts = result.fetchall()
-                if conflicts:
-                    print("\n" + "="*70)
-                    print("WARNING: Do-Not-Combine Conflicts Detected")
-                    print("="*70)
-                    print("The following ingredient pairs should not be combined:")
-                    print(f"\n{'Ingredient 1':<30} {'Ingredient 2':<30}")
-                    print("-"*65)
-                    for c in conflicts:
-                        print(f"{c[1]:<30} {c[3]:<30}")
-                    print("\nThis recipe may pose health risks!")
-                else:
-                    print("\nNo ingredient conflicts detected")
+            # Check for conflicts (session conflict index, same rules as sp_get_recipe_conflicts)
+            if conflicts:
+                print("\n" + "="*70)
+                print("WARNING: Do-Not-Combine Conflicts Detected")
+                print("="*70)
+                print("The following ingredient pairs should not be combined:")
+                print(f"\n{'Ingredient 1':<30} {'Ingredient 2':<30}")
+                print("-"*65)
+                for c in conflicts:
+                    print(f"{c[1]:<30} {c[3]:<30}")
+                print("\nThis recipe may pose health risks!")
+            else:
+                print("\nNo ingredient conflicts detected")
 
             # No conflicts - proceed with commit
             self.connection.commit()
@@ -643,7 +642,452 @@ class ManufacturerMenu:
             print("Recipe is safe to use in production.")
 
     # 3) Create Product Batch
+    def check_recipe_inventory(self, recipe_id, batch_quantity):
+        self.cursor.callproc('sp_validate_recipe_inventory',
+                             [recipe_id, batch_quantity, self.manufacturer_id])
+
+        lines = []
+        for result in self.cursor.stored_results():
+            lines = result.fetchall()
+
+        return [(ing_name, float(shortfall_oz))
+                for _, ing_name, _, _, shortfall_oz in lines
+                if float(shortfall_oz) > 0]
+
+    def evaluate_health_risk(self, lot_ids):
+        self.cursor.callproc('sp_evaluate_health_risk_for_allocated_lots', [json.dumps(lot_ids)])
+
+        violations = []
+        for result in self.cursor.stored_results():
+            violations = result.fetchall()
+        return violations
+
+    def _lock_fefo_lots(self, formulations, needed_oz):
+        # Locks this manufacturer's usable lots of the given formulations in FEFO order, a few at a time,
+        #  until they cover needed_oz. Lots another transaction holds are skipped, not waited for.
+        placeholders = ','.join(['%s'] * len(formulations))
+        lots = []
+        available_oz = 0.0
+        after = None
+        while available_oz < needed_oz:
+            keyset = ""
+            params = [self.manufacturer_id] + list(formulations)
+            if after:
+                keyset = "AND (ExpirationDate > %s OR (ExpirationDate = %s AND LotID > %s))"
+                params += [after[0], after[0], after[1]]
+            self.cursor.execute(f"""
+                SELECT LotID, TotalQuantityOz, FormulationID, ExpirationDate
+                FROM IngredientBatch
+                WHERE ManufacturerID = %s
+                AND FormulationID IN ({placeholders})
+                AND TotalQuantityOz > 0
+                AND ExpirationDate >= CURDATE()
+                {keyset}
+                ORDER BY ExpirationDate, LotID
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, params + [LOCK_CHUNK_LOTS])
+            rows = self.cursor.fetchall()
+
+            for lot_id, total_oz, form_id, _ in rows:
+                unit_price, pack_size = formulations[form_id]
+                lots.append((lot_id, total_oz, unit_price, pack_size))
+                available_oz += float(total_oz)
+            if len(rows) < LOCK_CHUNK_LOTS:
+                break
+            after = (rows[-1][3], rows[-1][0])
+
+        return lots
+
+    def lock_fefo_allocations(self, recipe_id, batch_quantity):
+        # Same plan as allocate_ingredients_fefo, but built from row-locked lots inside the
+        #  commit transaction, so the quantities cannot change before the consumption rows land
+        self.cursor.execute("""
+            SELECT rb.IngredientID, i.IngredientName, rb.Quantity
+            FROM RecipeBOM rb
+            INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
+            WHERE rb.RecipeID = %s
+            ORDER BY rb.IngredientID
+        """, (recipe_id,))
+        requirements = self.cursor.fetchall()
+        if not requirements:
+            return (True, [], 0, "Success")
+
+        placeholders = ','.join(['%s'] * len(requirements))
+        self.cursor.execute(f"""
+            SELECT IngredientID, FormulationID, UnitPrice, PackSize
+            FROM Formulation
+            WHERE IngredientID IN ({placeholders})
+        """, [ing_id for ing_id, _, _ in requirements])
+        formulations = {}  # IngredientID -> {FormulationID: (UnitPrice, PackSize)}
+        for ing_id, form_id, unit_price, pack_size in self.cursor.fetchall():
+            formulations.setdefault(ing_id, {})[form_id] = (unit_price, pack_size)
+
+        allocations = []
+        total_cost = 0
+
+        for ing_id, ing_name, qty_per_unit in requirements:
+            needed_oz = float(qty_per_unit) * batch_quantity
+            lots = self._lock_fefo_lots(formulations[ing_id], needed_oz) if ing_id in formulations else []
+
+            ingredient_allocations, shortfall = self._split_across_lots(needed_oz, lots)
+            if shortfall > 0:
+                return (False, None, 0,
+                    f"Insufficient unlocked inventory for {ing_name}. Need {shortfall:.2f} more oz.")
+
+            allocations.extend(ingredient_allocations)
+            total_cost += sum(cost for _, _, cost in ingredient_allocations)
+
+        return (True, allocations, total_cost, "Success")
+
+    def lock_manual_allocations(self, allocations):
+        # Locks the chosen lots (waiting for other transactions) and re-checks they still cover the plan
+        needed = {}
+        for lot_id, qty_used, _ in allocations:
+            needed[lot_id] = needed.get(lot_id, 0.0) + qty_used
+
+        placeholders = ','.join(['%s'] * len(needed))
+        self.cursor.execute(f"""
+            SELECT LotID, TotalQuantityOz
+            FROM IngredientBatch
+            WHERE LotID IN ({placeholders})
+            AND ManufacturerID = %s
+            AND ExpirationDate >= CURDATE()
+            FOR UPDATE
+        """, list(needed) + [self.manufacturer_id])
+        locked = dict(self.cursor.fetchall())
+
+        for lot_id, qty_used in needed.items():
+            if lot_id not in locked:
+                return (False, None, 0, f"Lot {lot_id} is no longer usable.")
+            if float(locked[lot_id]) < qty_used:
+                return (False, None, 0,
+                    f"Lot {lot_id} now has only {float(locked[lot_id]):.2f} oz left.")
+
+        return (True, allocations, sum(cost for _, _, cost in allocations), "Success")
+
+    def commit_product_batch(self, recipe_id, batch_qty, prod_date_str, exp_date_str,
+                             allocations=None):
+        # allocations=None re-plans FEFO under row locks and retries on contention;
+        #  manual allocations are locked and re-checked once.
+        # Returns (success, product LotID, allocations used, total cost, message)
+        message = "Could not allocate ingredients."
+        for attempt in range(1, MAX_ALLOCATION_ATTEMPTS + 1):
+            self.ensure_clean_transaction()
+            # READ COMMITTED: locking reads see the latest quantities and release lots they skip
+            self.connection.start_transaction(isolation_level='READ COMMITTED')
+            try:
+                if allocations is None:
+                    success, locked, total_cost, message = self.lock_fefo_allocations(recipe_id, batch_qty)
+                else:
+                    success, locked, total_cost, message = self.lock_manual_allocations(allocations)
+
+                if success and not locked:
+                    self.connection.rollback()
+                    return (False, None, None, 0, "This recipe has no ingredients to allocate.")
+
+                if success:
+                    # Re-planned lots may differ from the preview, so check them again
+                    violations = self.evaluate_health_risk([lot_id for lot_id, _, _ in locked])
+                    if violations:
+                        self.connection.rollback()
+                        pairs = ', '.join(f"{v[1]} + {v[3]}" for v in violations)
+                        return (False, None, None, 0, f"Health risk violation, production blocked: {pairs}")
+
+                    # Header + all consumption rows in one call; the generated LotID comes back as OUT
+                    allocations_json = json.dumps([
+                        {"ibatch_id": lot_id, "ibatch_quantity_used": qty_used}
+                        for lot_id, qty_used, _ in locked
+                    ])
+                    results = self.cursor.callproc(
+                        'sp_create_product_batch',
+                        [recipe_id, batch_qty, prod_date_str, exp_date_str,
+                         round(total_cost, 2), allocations_json, None])
+
+                    self.connection.commit()
+                    return (True, results[6], locked, total_cost, "Success")
+
+                self.connection.rollback()
+                if allocations is not None:
+                    return (False, None, None, 0, message)
+            except mysql.connector.Error as err:
+                self.connection.rollback()
+                if err.errno not in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT):
+                    raise
+                message = f"Database error: {err}"
+
+            # Another transaction holds the lots we need; give it time to finish
+            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+        return (False, None, None, 0, f"{message} (gave up after {MAX_ALLOCATION_ATTEMPTS} attempts)")
+
+    def produce_schedule(self, jobs, group_size=SCHEDULE_GROUP_SIZE):
+        # jobs: [(RecipeID, batch quantity in units, production date, expiration date), ...]
+        # Jobs are planned FEFO in schedule order, group_size at a time, against one locked inventory
+        #  snapshot per group, and each group is inserted in one transaction.
+        # Returns one (success, product LotID, total cost, message) per job, in job order
+        results = [None] * len(jobs)
+
+        recipe_ids = sorted({job[0] for job in jobs})
+        recipes = {}  # RecipeID -> (lot prefix, [(IngredientID, IngredientName, oz per unit), ...])
+        if recipe_ids:
+            placeholders = ','.join(['%s'] * len(recipe_ids))
+            self.cursor.execute(f"""
+                SELECT r.RecipeID, CONCAT(p.ProductID, '-', m.UserID)
+                FROM Recipe r
+                INNER JOIN Product p ON r.ProductID = p.ProductID
+                INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
+                WHERE r.RecipeID IN ({placeholders}) AND p.ManufacturerID = %s
+            """, recipe_ids + [self.manufacturer_id])
+            recipes = {recipe_id: (prefix, []) for recipe_id, prefix in self.cursor.fetchall()}
+
+            self.cursor.execute(f"""
+                SELECT rb.RecipeID, rb.IngredientID, i.IngredientName, rb.Quantity
+                FROM RecipeBOM rb
+                INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
+                WHERE rb.RecipeID IN ({placeholders})
+                ORDER BY rb.RecipeID, rb.IngredientID
+            """, recipe_ids)
+            for recipe_id, ing_id, ing_name, qty_per_unit in self.cursor.fetchall():
+                if recipe_id in recipes:
+                    recipes[recipe_id][1].append((ing_id, ing_name, float(qty_per_unit)))
+            self.connection.commit()
+
+        pending = []
+        for position, (recipe_id, batch_qty, prod_date, exp_date) in enumerate(jobs):
+            if recipe_id not in recipes:
+                results[position] = (False, None, 0, f"Recipe {recipe_id} not found or not owned by you.")
+            elif batch_qty <= 0:
+                results[position] = (False, None, 0, "Batch quantity must be positive.")
+            elif exp_date <= prod_date:
+                results[position] = (False, None, 0, "Expiration must be after production date.")
+            elif not recipes[recipe_id][1]:
+                results[position] = (False, None, 0, "This recipe has no ingredients to allocate.")
+            else:
+                pending.append(position)
+
+        for start in range(0, len(pending), group_size):
+            group = pending[start:start + group_size]
+            for position, result in self._produce_schedule_group(jobs, group, recipes).items():
+                results[position] = result
+
+        return results
+
+    def _produce_schedule_group(self, jobs, group, recipes):
+        # Lots other producers hold are skipped, not waited for, so jobs that came up short while
+        #  lots were skipped are retried with the same backoff as commit_product_batch
+        results = {}
+        for attempt in range(1, MAX_ALLOCATION_ATTEMPTS + 1):
+            self.ensure_clean_transaction()
+            self.connection.start_transaction(isolation_level='READ COMMITTED')
+            try:
+                outcomes, planned, contended = self._plan_schedule_group(jobs, group, recipes)
+                if planned:
+                    for position, lot_id in self._insert_schedule_batches(jobs, planned, recipes).items():
+                        _, total_cost = planned[position]
+                        outcomes[position] = (True, lot_id, total_cost, "Success")
+                self.connection.commit()
+                results.update(outcomes)
+                if not contended:
+                    return results
+                group = contended
+            except mysql.connector.Error as err:
+                self.connection.rollback()
+                self.cursor.execute("SET @csc540_bulk_consumption = NULL")
+                if err.errno not in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT):
+                    # One job broke the group insert; commit each on its own so only that job fails
+                    results.update(self._produce_schedule_jobs_singly(jobs, group))
+                    return results
+                for position in group:
+                    results[position] = (False, None, 0, f"Database error: {err}")
+
+            # Another transaction holds the lots we need; give it time to finish
+            time.sleep(RETRY_BACKOFF_SECONDS * attempt)
+
+        for position in group:
+            message = results[position][3]
+            results[position] = (False, None, 0, f"{message} (gave up after {MAX_ALLOCATION_ATTEMPTS} attempts)")
+        return results
+
+    def _has_skipped_lots(self, formulations, locked_count):
+        # A plain read sees every usable lot, including those another transaction has locked
+        placeholders = ','.join(['%s'] * len(formulations))
+        self.cursor.execute(f"""
+            SELECT COUNT(*)
+            FROM IngredientBatch
+            WHERE ManufacturerID = %s
+            AND FormulationID IN ({placeholders})
+            AND TotalQuantityOz > 0
+            AND ExpirationDate >= CURDATE()
+        """, [self.manufacturer_id] + list(formulations))
+        return self.cursor.fetchone()[0] > locked_count
+
+    def _plan_schedule_group(self, jobs, group, recipes):
+        # Locks FEFO lots covering the whole group, then allocates the jobs one after another
+        #  from what the earlier jobs left, with the health check done in memory on the session index
+        needed = {}  # IngredientID -> oz for the whole group
+        for position in group:
+            recipe_id, batch_qty = jobs[position][:2]
+            for ing_id, _, qty_per_unit in recipes[recipe_id][1]:
+                needed[ing_id] = needed.get(ing_id, 0.0) + qty_per_unit * batch_qty
+
+        placeholders = ','.join(['%s'] * len(needed))
+        self.cursor.execute(f"""
+            SELECT IngredientID, FormulationID, UnitPrice, PackSize
+            FROM Formulation
+            WHERE IngredientID IN ({placeholders})
+        """, list(needed))
+        formulations = {}  # IngredientID -> {FormulationID: (UnitPrice, PackSize)}
+        for ing_id, form_id, unit_price, pack_size in self.cursor.fetchall():
+            formulations.setdefault(ing_id, {})[form_id] = (unit_price, pack_size)
+
+        snapshot = {ing_id: self._lock_fefo_lots(formulations[ing_id], needed_oz)
+                    for ing_id, needed_oz in needed.items() if ing_id in formulations}
+        remaining = {lot_id: float(total_oz)
+                     for lots in snapshot.values() for lot_id, total_oz, _, _ in lots}
+
+        lot_formulations = {}
+        if remaining:
+            placeholders = ','.join(['%s'] * len(remaining))
+            self.cursor.execute(f"""
+                SELECT LotID, FormulationID FROM IngredientBatch WHERE LotID IN ({placeholders})
+            """, list(remaining))
+            lot_formulations = dict(self.cursor.fetchall())
+
+        index = get_conflict_index(self.cursor)
+        results = {}
+        planned = {}  # position -> (allocations, total cost)
+        contended = []  # positions short of an ingredient some of whose lots were skipped
+        skipped = {}  # IngredientID -> whether other transactions hold some of its usable lots
+        for position in group:
+            recipe_id, batch_qty = jobs[position][:2]
+            allocations = []
+            used_lots = []
+            failure = None
+            for ing_id, ing_name, qty_per_unit in recipes[recipe_id][1]:
+                lots = [(lot_id, remaining[lot_id], unit_price, pack_size)
+                        for lot_id, _, unit_price, pack_size in snapshot.get(ing_id, [])
+                        if remaining[lot_id] > 0]
+                ingredient_allocations, shortfall = self._split_across_lots(qty_per_unit * batch_qty, lots)
+                if shortfall > 0:
+                    failure = f"Insufficient unlocked inventory for {ing_name}. Need {shortfall:.2f} more oz."
+                    # A short ingredient had all of its unlocked lots locked, so any others are held elsewhere
+                    if ing_id not in skipped:
+                        skipped[ing_id] = ing_id in formulations and self._has_skipped_lots(
+                            formulations[ing_id], len(snapshot[ing_id]))
+                    if skipped[ing_id]:
+                        contended.append(position)
+                    break
+                allocations.extend(ingredient_allocations)
+                used_lots.extend((ing_id, lot_formulations[lot_id]) for lot_id, _, _ in ingredient_allocations)
+
+            if failure is None:
+                violations = index.lot_conflicts(used_lots)
+                if violations:
+                    pairs = ', '.join(f"{v[1]} + {v[3]}" for v in violations)
+                    failure = f"Health risk violation, production blocked: {pairs}"
+
+            if failure is not None:
+                results[position] = (False, None, 0, failure)
+                continue
+            for lot_id, qty_used, _ in allocations:
+                remaining[lot_id] -= qty_used
+            planned[position] = (allocations, sum(cost for _, _, cost in allocations))
+
+        return results, planned, contended
+
+    def _insert_schedule_batches(self, jobs, planned, recipes):
+        # LotIDs for every planned batch, a block per product, then the headers and consumption
+        #  rows in two executemany inserts and one set-based draw-down
+        by_prefix = {}
+        for position in planned:
+            by_prefix.setdefault(recipes[jobs[position][0]][0], []).append(position)
+
+        lot_ids = {}
+        for prefix, positions in by_prefix.items():
+            reserved = self.cursor.callproc('sp_reserve_lot_ids', [prefix, len(positions), None])
+            for position, lot_id in zip(positions, json.loads(reserved[2])):
+                lot_ids[position] = lot_id
+
+        headers = []
+        for position, (_, total_cost) in planned.items():
+            recipe_id, batch_qty, prod_date, exp_date = jobs[position]
+            headers.append((lot_ids[position], recipe_id, batch_qty, prod_date, exp_date,
+                            round(total_cost, 2), round(total_cost, 2) / batch_qty))
+        self.cursor.executemany("""
+            INSERT INTO ProductBatch (LotID, RecipeID, BatchQuantity, ProductionDate,
+                                      ExpirationDate, BatchCost, PerUnitCost)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, headers)
+
+        self.cursor.execute("SET @csc540_bulk_consumption = 1")
+        self.cursor.executemany("""
+            INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
+            VALUES (%s, %s, %s)
+        """, [(lot_ids[position], lot_id, qty_used)
+              for position, (allocations, _) in planned.items()
+              for lot_id, qty_used, _ in allocations])
+        self.cursor.callproc('sp_apply_batch_consumption', [json.dumps(list(lot_ids.values()))])
+
+        return lot_ids
+
+    def _produce_schedule_jobs_singly(self, jobs, group):
+        results = {}
+        for position in group:
+            recipe_id, batch_qty, prod_date, exp_date = jobs[position]
+            try:
+                success, lot_id, _, total_cost, message = self.commit_product_batch(
+                    recipe_id, batch_qty, prod_date.strftime("%Y-%m-%d"), exp_date.strftime("%Y-%m-%d"))
+            except mysql.connector.Error as err:
+                self.ensure_clean_transaction()
+                success, lot_id, total_cost, message = False, None, 0, f"Database error: {err}"
+            results[position] = (success, lot_id, total_cost, message)
+        return results
+
     def allocate_ingredients_fefo(self, recipe_id, batch_quantity):
+        # Whole FEFO plan (every BOM line and lot) comes back in one round trip
+        self.cursor.callproc('sp_get_fefo_allocation_plan',
+                             [recipe_id, batch_quantity, self.manufacturer_id])
+
+        plan = []
+        for result in self.cursor.stored_results():
+            plan = result.fetchall()
+
+        allocations = []
+        total_cost = 0
+
+        for ing_id, ing_name, needed_oz, lot_id, qty_to_use, cost, shortfall_oz in plan:
+            if lot_id is None:
+                return (False, None, 0,
+                    f"No available inventory for {ing_name}")
+
+            if float(shortfall_oz) > 0:
+                return (False, None, 0,
+                    f"Insufficient inventory for {ing_name}. Need {float(shortfall_oz):.2f} more oz.")
+
+            cost = float(cost)
+            allocations.append((lot_id, float(qty_to_use), cost))
+            total_cost += cost
+
+        return (True, allocations, total_cost, "Success")
+    
+    def _split_across_lots(self, needed_oz, lots):
+        # Take consecutive lots while the running total of earlier lots is still short
+        allocations = []
+        consumed_before = 0.0
+
+        for lot_id, available_oz, unit_price, pack_size in lots:
+            if consumed_before >= needed_oz:
+                break
+            available_oz = float(available_oz)
+            qty_to_use = min(available_oz, needed_oz - consumed_before)
+            cost = (qty_to_use / float(pack_size)) * float(unit_price)
+            allocations.append((lot_id, qty_to_use, cost))
+            consumed_before += available_oz
+
+        return allocations, max(needed_oz - consumed_before, 0)
+
+    def allocate_ingredients_manual(self, recipe_id, batch_quantity):
         self.cursor.execute("""
             SELECT rb.IngredientID, i.IngredientName, rb.Quantity
             FROM RecipeBOM rb
@@ -651,13 +1095,13 @@ class ManufacturerMenu:
             WHERE rb.RecipeID = %s
         """, (recipe_id,))
         requirements = self.cursor.fetchall()
-        
-        allocations = [] 
+
+        allocations = []
         total_cost = 0
-        
+
         for ing_id, ing_name, qty_per_unit in requirements:
-            needed_oz = float(qty_per_unit) * batch_quantity 
-            
+            needed_oz = float(qty_per_unit) * batch_quantity
+
             self.cursor.execute("""
                 SELECT 
                     ib.LotID,
@@ -672,54 +1116,48 @@ class ManufacturerMenu:
                 AND ib.ExpirationDate >= CURDATE()
                 ORDER BY ib.ExpirationDate ASC, ib.LotID ASC
             """, (ing_id, self.manufacturer_id))
-            
+
             available_batches = self.cursor.fetchall()
-            
+
             if not available_batches:
-                return (False, None, 0, 
+                return (False, None, 0,
                     f"No available inventory for {ing_name}")
 
-            remaining_needed = needed_oz
-            ingredient_allocations = []
-            
-            for lot_id, available_oz, unit_price, pack_size in available_batches:
-                if remaining_needed <= 0:
-                    break
-                
-                available_oz = float(available_oz)
-                unit_price = float(unit_price)
-                pack_size = float(pack_size)
-                
-                if available_oz >= remaining_needed:
-                    qty_to_use = remaining_needed
-                    cost = (qty_to_use / pack_size) * unit_price
-                    ingredient_allocations.append((lot_id, qty_to_use, cost))
-                    total_cost += cost
-                    remaining_needed = 0
-                    break
-                else:
-                    qty_to_use = available_oz
-                    cost = (qty_to_use / pack_size) * unit_price
-                    ingredient_allocations.append((lot_id, qty_to_use, cost))
-                    total_cost += cost
-                    remaining_needed -= available_oz
-            
-            if remaining_needed > 0:
-                return (False, None, 0, 
-                    f"Insufficient inventory for {ing_name}. Need {remaining_needed:.2f} more oz.")
-            
+            print(f"\nSelect ingredient batch(es) for {ing_name} (need {needed_oz:.2f} oz):")
+            print(f"{'#':<4} {'Lot ID':<20} {'Available (oz)':<15} {'$/Pack':<8} {'Pack Size':<10}")
+            print("-"*60)
+            for idx, (lot_id, available_oz, unit_price, pack_size) in enumerate(available_batches, 1):
+                print(f"{idx:<4} {lot_id:<20} {available_oz:<15.2f} ${unit_price:<7.2f} {pack_size:<10.2f}")
+
+            selection = input("\nBatch numbers to use, in order (comma-separated, e.g., 1,3): ").strip()
+            try:
+                selected_indices = [int(x.strip()) for x in selection.split(',')]
+            except ValueError:
+                return (False, None, 0, "Invalid selection.")
+
+            if any(i < 1 or i > len(available_batches) for i in selected_indices):
+                return (False, None, 0, "Invalid selection.")
+
+            # Drop repeated numbers but keep the order the lots were chosen in
+            chosen = [available_batches[i - 1] for i in dict.fromkeys(selected_indices)]
+
+            ingredient_allocations, shortfall = self._split_across_lots(needed_oz, chosen)
+            if shortfall > 0:
+                return (False, None, 0,
+                    f"Selected lots for {ing_name} are short by {shortfall:.2f} oz.")
+
             allocations.extend(ingredient_allocations)
-        
+            total_cost += sum(cost for _, _, cost in ingredient_allocations)
+
         return (True, allocations, total_cost, "Success")
-    
+
     def create_product_batch(self):
         print("\n" + "-"*60)
         print("CREATE PRODUCT BATCH")
         print("-"*60)
 
         print("Select ingredient batches manually?")
-        manual_selection = input("(Y/N): ").strip() == "Y"
-        print(manual_selection)
+        manual_selection = input("(Y/N): ").strip().upper() == "Y"
 
         product_id = self._select_product()
         if product_id is None:
@@ -773,6 +1211,14 @@ class ManufacturerMenu:
         batch_qty = num_batches * default_batch
         print(f"Total units to produce: {batch_qty}")
 
+        # Cheap on-hand check before any lots are picked
+        shortfalls = self.check_recipe_inventory(recipe_id, batch_qty)
+        if shortfalls:
+            print("\nInsufficient inventory for this run:")
+            for ing_name, shortfall_oz in shortfalls:
+                print(f"  {ing_name}: need {shortfall_oz:.2f} more oz")
+            return
+
         # Dates
         prod_date_str = input("Production date (YYYY-MM-DD, blank for today): ").strip()
         if prod_date_str:
@@ -794,104 +1240,28 @@ class ManufacturerMenu:
             print("Error: Expiration must be after production date.")
             return
 
-        if not manual_selection:
-            # FEFO
-            results = self.cursor.callproc(
-                'AddProductBatch', [recipe_id,self.manufacturer_id,batch_qty,prod_date_str,exp_date_str,None,'',0,''])
-            if not results[7]:
-                print("\nFailed to create product batch:")
-                print(f"Reason: {results[8]}")
-            else:
-                print(f"\nSuccessfully created product batch {results[6]}")
-            return
-
-        # Manual selection
-        ingredient_allocations = []
-        quantity_allocations = []
-
-        self.cursor.execute("""
-            SELECT rb.IngredientID, i.IngredientName, rb.Quantity
-            FROM RecipeBOM rb
-            INNER JOIN Ingredient i ON rb.IngredientID = i.IngredientID
-            WHERE rb.RecipeID = %s
-        """, (recipe_id,))
-        requirements = self.cursor.fetchall()
-
-        for ing_id, ing_name, qty_per_unit in requirements:
-            needed_oz = float(qty_per_unit) * batch_qty
-
-            self.cursor.execute("""
-                SELECT 
-                    ib.LotID,
-                    ib.TotalQuantityOz,
-                    f.UnitPrice,
-                    f.PackSize
-                FROM IngredientBatch ib
-                INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
-                WHERE f.IngredientID = %s
-                AND ib.ManufacturerID = %s
-                AND ib.TotalQuantityOz > 0
-                AND ib.ExpirationDate >= CURDATE()
-                ORDER BY ib.ExpirationDate ASC, ib.LotID ASC
-            """, (ing_id, self.manufacturer_id))
-
-            available_batches = self.cursor.fetchall()
-
-            if not available_batches:
-                return (False, None, 0, 
-                    f"No available inventory for {ing_name}")
-
-            print(f"\nSelect ingredient batch for ingredient {ing_name}:")
-            idx = 1
-            for lot_id, available_oz, unit_price, pack_size in available_batches:
-                print(idx,lot_id,available_oz,unit_price,pack_size)
-                idx+=1
-            try:
-                select = int(input("\nIngredient batch to use: "))
-            except:
-                print("\nInvalid selection.")
-                return
-            if select > len(available_batches):
-                print("\nInvalid selection.")
-                return
-            
-            ingredient_allocations.append(available_batches[select-1][0])
-            quantity_allocations.append(needed_oz)
-        
-        import json
-        manual_json = json.dumps([
-            {
-                "ibatch_id":ibatch_id,
-                "ibatch_quantity_used": ibatch_quantity_used
-            }
-            for ibatch_id, ibatch_quantity_used in zip(ingredient_allocations, quantity_allocations)
-        ])
-        
-        results = self.cursor.callproc(
-            'AddProductBatch', [recipe_id,self.manufacturer_id,batch_qty,prod_date_str,exp_date_str,manual_json,'',0,''])
-        if not results[7]:
-            print("\nFailed to create product batch:")
-            print(f"Reason: {results[8]}")
+        # Allocate ingredients - both modes may split a requirement across lots
+        if manual_selection:
+            success, allocations, total_cost, message = self.allocate_ingredients_manual(
+                recipe_id, batch_qty
+            )
         else:
-            print(f"\nSuccessfully created product batch {results[6]}")
-        return
-
+            print("\nAllocating ingredients using FEFO...")
+            success, allocations, total_cost, message = self.allocate_ingredients_fefo(
+                recipe_id, batch_qty
+            )
 
-        # FEFO Allocation
-        print("\nAllocating ingredients using FEFO (whole batches only)...")
-        
-        success, allocations, total_cost, message = self.allocate_ingredients_fefo(
-            recipe_id, batch_qty
-        )
-                
-        # After allocation is successful
         if not success:
             print(f"\n{message}")
             return
 
+        if not allocations:
+            print("\nThis recipe has no ingredients to allocate.")
+            return
+
         # Show allocation plan
         print("\n" + "="*70)
-        print("ALLOCATION PLAN (FEFO)")
+        print("ALLOCATION PLAN (MANUAL)" if manual_selection else "ALLOCATION PLAN (FEFO)")
         print("="*70)
         print(f"{'Ingredient Lot':<20} {'Quantity (oz)':<15} {'Cost':<10}")
         print("-"*50)
@@ -902,25 +1272,20 @@ class ManufacturerMenu:
         print(f"Per-Unit Cost: ${total_cost / batch_qty:.4f}")
         print("="*70)
 
-        lot_ids_str = ','.join([lot_id for lot_id, _, _ in allocations])
-
         try:
-            self.cursor.callproc('sp_evaluate_health_risk_for_allocated_lots', [lot_ids_str])
-            
-            for result in self.cursor.stored_results():
-                violations = result.fetchall()
-                if violations:
-                    print("\n" + "="*70)
-                    print("HEALTH RISK VIOLATION - BATCH CANNOT BE PRODUCED")
-                    print("="*70)
-                    print("The allocated ingredient lots contain do-not-combine conflicts:")
-                    print(f"\n{'Ingredient 1':<30} {'Ingredient 2':<30}")
-                    print("-"*65)
-                    for v in violations:
-                        print(f"{v[1]:<30} {v[3]:<30}")
-                    print("\nProduction blocked for safety reasons!")
-                    print("="*70)
-                    return 
+            violations = self.evaluate_health_risk([lot_id for lot_id, _, _ in allocations])
+            if violations:
+                print("\n" + "="*70)
+                print("HEALTH RISK VIOLATION - BATCH CANNOT BE PRODUCED")
+                print("="*70)
+                print("The allocated ingredient lots contain do-not-combine conflicts:")
+                print(f"\n{'Ingredient 1':<30} {'Ingredient 2':<30}")
+                print("-"*65)
+                for v in violations:
+                    print(f"{v[1]:<30} {v[3]:<30}")
+                print("\nProduction blocked for safety reasons!")
+                print("="*70)
+                return 
             
             print("No health risk violations detected - safe to proceed")
             
@@ -934,41 +1299,19 @@ class ManufacturerMenu:
             return
 
         try:
-            self.ensure_clean_transaction()
-            self.connection.start_transaction()
-            
-            # Create product batch
-            self.cursor.execute("""
-                INSERT INTO ProductBatch (RecipeID, BatchQuantity, ProductionDate, 
-                                        ExpirationDate, BatchCost, PerUnitCost)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (recipe_id, batch_qty, prod_date_str, exp_date_str, 
-                total_cost, total_cost / batch_qty))
-            
-            self.cursor.execute("""
-                SELECT LotID FROM ProductBatch 
-                WHERE RecipeID = %s 
-                AND ProductionDate = %s
-                AND ExpirationDate = %s
-                AND BatchCost = %s
-                AND BatchQuantity = %s
-                ORDER BY LotID DESC 
-                LIMIT 1
-            """, (recipe_id, prod_date_str, exp_date_str, total_cost, batch_qty))
-            
-            result = self.cursor.fetchone()
-            if not result:
-                raise Exception("Failed to retrieve generated LotID")
-            
-            product_lot_id = result[0]
-            
-            for lot_id, qty_used, cost in allocations:
-                self.cursor.execute("""
-                    INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
-                    VALUES (%s, %s, %s)
-                """, (product_lot_id, lot_id, qty_used))
-            
-            self.connection.commit()
+            # FEFO is re-planned under row locks at commit; manual lots are locked and re-checked
+            success, product_lot_id, committed, total_cost, message = self.commit_product_batch(
+                recipe_id, batch_qty, prod_date_str, exp_date_str,
+                allocations if manual_selection else None
+            )
+            if not success:
+                print(f"\nProduction failed: {message}")
+                return
+
+            if [(l, round(q, 4)) for l, q, _ in committed] != [(l, round(q, 4)) for l, q, _ in allocations]:
+                print("\nInventory changed while confirming - lots actually used:")
+                for lot_id, qty, cost in committed:
+                    print(f"  {lot_id:<20} {qty:<15.2f} ${cost:<9.2f}")
             
             print(f"\nProduct batch created successfully!")
             print(f"Product Lot ID: {product_lot_id}")
@@ -989,7 +1332,10 @@ class ManufacturerMenu:
             print("1) Nearly Out of Stock Items")
             print("2) Almost Expired Ingredient Lots")
             print("3) Batch Cost Summary")
-            print("4) Back to Main Menu")
+            print("4) Supplier Spend by Month")
+            print("5) Top Spend by Supplier / Ingredient")
+            print("6) Production Capacity")
+            print("7) Back to Main Menu")
             print("-"*60)
 
             try:
@@ -1005,6 +1351,12 @@ class ManufacturerMenu:
             elif choice == 3:
                 self.report_batch_cost_summary()
             elif choice == 4:
+                self.report_supplier_spend_by_month()
+            elif choice == 5:
+                self.report_top_spend()
+            elif choice == 6:
+                self.report_production_capacity()
+            elif choice == 7:
                 break
             else:
                 print("Invalid choice.")
@@ -1045,6 +1397,16 @@ class ManufacturerMenu:
             days_threshold = 10
         
         try:
+            # Per-day totals first, from the expiry buckets; the lots themselves follow
+            self.cursor.callproc('sp_report_expiry_buckets', [self.manufacturer_id, days_threshold])
+            for result in self.cursor.stored_results():
+                rows = result.fetchall()
+                if rows:
+                    print(f"\n{'Expires':<12} {'Days Left':<10} {'Ingredients':<12} {'Lots':<8} {'Qty (oz)':<12}")
+                    print("-"*58)
+                    for r in rows:
+                        print(f"{str(r[0]):<12} {r[1]:<10} {r[2]:<12} {int(r[3]):<8} {r[4]:<12.2f}")
+
             self.cursor.callproc('sp_report_almost_expired', 
                                 [self.manufacturer_id, days_threshold])
             
@@ -1064,6 +1426,129 @@ class ManufacturerMenu:
         except mysql.connector.Error as err:
             print(f"Database error: {err}")
 
+    def _ask_month_range(self):
+        # Any day within the month selects it; blank leaves that end open
+        bounds = []
+        for label in ("From month", "To month"):
+            entry = input(f"{label} (YYYY-MM, blank for no limit): ").strip()
+            if not entry:
+                bounds.append(None)
+                continue
+            try:
+                bounds.append(datetime.strptime(entry, "%Y-%m").date())
+            except ValueError:
+                print("Invalid month, leaving it open.")
+                bounds.append(None)
+        return bounds
+
+    def report_supplier_spend_by_month(self):
+        print("\n--- Supplier Spend by Month ---")
+        month_from, month_to = self._ask_month_range()
+
+        try:
+            self.cursor.callproc('sp_report_supplier_spend_by_month',
+                                 [self.manufacturer_id, month_from, month_to])
+
+            for result in self.cursor.stored_results():
+                rows = result.fetchall()
+                if rows:
+                    print(f"\n{'Month':<9} {'SupID':<6} {'Supplier':<20} {'Lots':<6} "
+                          f"{'Bought (oz)':<12} {'Bought ($)':<12} {'Used (oz)':<12} {'Used ($)':<12}")
+                    print("-"*95)
+                    for r in rows:
+                        print(f"{r[0].strftime('%Y-%m'):<9} {r[1]:<6} {r[2]:<20} {int(r[3]):<6} "
+                              f"{r[4]:<12.2f} {r[5]:<12.2f} {r[6]:<12.2f} {r[7]:<12.2f}")
+                    print(f"\nTotal purchased: ${sum(r[5] for r in rows):.2f}, "
+                          f"total consumed: ${sum(r[7] for r in rows):.2f}")
+                else:
+                    print("\nNo supplier spend in that range.")
+
+        except mysql.connector.Error as err:
+            print(f"Database error: {err}")
+
+    def report_top_spend(self):
+        print("\n--- Top Spend ---")
+        group_by = 'INGREDIENT' if input("Group by (S)upplier or (I)ngredient [S]: ").strip().upper() == 'I' \
+            else 'SUPPLIER'
+        limit = input("How many (default 10): ").strip()
+        try:
+            limit = int(limit) if limit else 10
+        except ValueError:
+            print("Invalid input, using 10.")
+            limit = 10
+        month_from, month_to = self._ask_month_range()
+
+        try:
+            self.cursor.callproc('sp_report_top_spend',
+                                 [self.manufacturer_id, month_from, month_to, group_by, limit])
+
+            for result in self.cursor.stored_results():
+                rows = result.fetchall()
+                if rows:
+                    print(f"\n{'#':<4} {'ID':<6} {group_by.title():<25} {'Lots':<6} "
+                          f"{'Bought ($)':<12} {'Used ($)':<12}")
+                    print("-"*70)
+                    for i, r in enumerate(rows, 1):
+                        print(f"{i:<4} {r[0]:<6} {r[1]:<25} {int(r[2]):<6} {r[3]:<12.2f} {r[4]:<12.2f}")
+                else:
+                    print("\nNo supplier spend in that range.")
+
+        except mysql.connector.Error as err:
+            print(f"Database error: {err}")
+
+    def report_production_capacity(self):
+        print("\n--- Production Capacity ---")
+        as_of = input("Production date (YYYY-MM-DD, blank for today): ").strip()
+        try:
+            as_of = datetime.strptime(as_of, "%Y-%m-%d").date() if as_of else date.today()
+        except ValueError:
+            print("Invalid date, using today.")
+            as_of = date.today()
+
+        try:
+            planner = CapacityPlanner(self.manufacturer_id)
+            planner.load(self.cursor, as_of)
+        except mysql.connector.Error as err:
+            print(f"Database error: {err}")
+            return
+
+        rows = planner.capacity()
+        if not rows:
+            print("\nYou have no products with recipes.")
+            return
+
+        print("\nEach product on its own, from stock still in date on " + as_of.strftime('%Y-%m-%d') + ":")
+        print(f"\n{'ProdID':<8} {'Product':<25} {'RecipeID':<10} {'Max Units':<10} {'Limited By':<25}")
+        print("-"*80)
+        for product_id, product_name, recipe_id, max_units, limiting in rows:
+            print(f"{product_id:<8} {product_name:<25} {recipe_id:<10} {max_units:<10} {limiting or '-':<25}")
+
+        # What-if: the listed products in priority order, or one batch of each in turn
+        print("\nPlan a mix: enter ProductID:batches pairs in priority order (e.g. 3:2, 5:1),")
+        entry = input("or leave blank to share the stock one batch at a time: ").strip()
+        demands = None
+        if entry:
+            try:
+                demands = [(int(product_id), int(batches))
+                           for product_id, batches in (pair.split(':') for pair in entry.split(','))]
+            except ValueError:
+                print("Invalid input, sharing the stock instead.")
+
+        mix, leftover = planner.plan_mix(demands)
+        if mix:
+            print(f"\n{'ProdID':<8} {'Product':<25} {'Batches':<10} {'Units':<10}")
+            print("-"*55)
+            for product_id, product_name, batches, units in mix:
+                print(f"{product_id:<8} {product_name:<25} {batches:<10} {units:<10}")
+        else:
+            print("\nNothing can be produced from the current stock.")
+
+        print(f"\n{'IngID':<6} {'Ingredient':<25} {'Left (oz)':<12} {'Next Expiry':<12}")
+        print("-"*57)
+        for ing_id, (oz, next_expiration) in sorted(leftover.items()):
+            print(f"{ing_id:<6} {planner.ingredient_name(ing_id):<25} {oz:<12.2f} "
+                  f"{next_expiration.strftime('%Y-%m-%d') if next_expiration else '-':<12}")
+
     def report_batch_cost_summary(self):
         print("\n--- Batch Cost Summary ---")
         
@@ -1156,7 +1641,8 @@ class ManufacturerMenu:
         print("-"*60)
         print("1) Trace by Ingredient ID")
         print("2) Trace by Ingredient Lot ID")
-        print("3) Back to Main Menu")
+        print("3) Bulk Recall (multiple lots / supplier / formulation version)")
+        print("4) Back to Main Menu")
         print("-"*60)
 
         try:
@@ -1170,6 +1656,8 @@ class ManufacturerMenu:
         elif choice == 2:
             self.trace_recall_by_lot()
         elif choice == 3:
+            self.bulk_recall()
+        elif choice == 4:
             return
         else:
             print("Invalid choice.")
@@ -1267,6 +1755,59 @@ class ManufacturerMenu:
         except mysql.connector.Error as err:
             print(f"Database error: {err}")
 
+    def bulk_recall(self):
+        print("\n--- Bulk Recall ---")
+        print("Suspect lots may be listed directly and/or taken from a supplier or formulation version.")
+
+        lot_ids = [x.strip() for x in input("Ingredient Lot IDs (comma-separated, blank for none): ").split(',')
+                   if x.strip()]
+        try:
+            supplier = input("Recall every lot from Supplier ID (blank for none): ").strip()
+            supplier_id = int(supplier) if supplier else None
+            formulation = input("Recall every lot of Formulation ID (blank for none): ").strip()
+            formulation_id = int(formulation) if formulation else None
+        except ValueError:
+            print("Invalid ID.")
+            return
+
+        if not lot_ids and supplier_id is None and formulation_id is None:
+            print("Error: At least one lot, supplier or formulation is required.")
+            return
+
+        # Date range (default: everything produced so far)
+        date_from = None
+        date_to = None
+        custom = input("Limit to a production date range? (Y/N): ").strip().upper()
+        if custom == 'Y':
+            from_str = input("Start date (YYYY-MM-DD): ").strip()
+            to_str = input("End date (YYYY-MM-DD): ").strip()
+            try:
+                date_from = datetime.strptime(from_str, "%Y-%m-%d").date()
+                date_to = datetime.strptime(to_str, "%Y-%m-%d").date()
+            except ValueError:
+                print("Invalid date format.")
+                return
+
+        try:
+            self.cursor.callproc('sp_bulk_recall',
+                                [json.dumps(lot_ids), supplier_id, formulation_id, date_from, date_to])
+
+            for result in self.cursor.stored_results():
+                rows = result.fetchall()
+                if rows:
+                    print(f"\n{len(rows)} affected product batch(es) found!")
+                    print(f"\n{'Product Lot':<20} {'ProdID':<8} {'Product':<25} {'MfgID':<6} "
+                          f"{'Prod Date':<12} {'Quantity':<10} {'Suspect Lots':<40}")
+                    print("-"*125)
+                    for r in rows:
+                        print(f"{r[0]:<20} {r[1]:<8} {r[2]:<25} {r[3]:<6} "
+                              f"{str(r[4]):<12} {r[5]:<10} {r[7]:<40}")
+                else:
+                    print("\nNo affected product batches found.")
+
+        except mysql.connector.Error as err:
+            print(f"Database error: {err}")
+
     # 6) View ingredient inventory for this manufacturer
     def view_ingredient_inventory(self):
         print("\n--- My Ingredient Inventory ---")
@@ -1307,6 +1848,21 @@ class ManufacturerMenu:
         except mysql.connector.Error as err:
             print(f"Database error: {err}")
 
+    def claim_ingredient_batches(self, lot_ids):
+        # Lots already claimed, expired or empty are left alone
+        placeholders = ','.join(['%s'] * len(lot_ids))
+        self.cursor.execute(f"""
+            UPDATE IngredientBatch
+            SET ManufacturerID = %s, ReceivedDate = CURDATE()
+            WHERE LotID IN ({placeholders}) AND ManufacturerID IS NULL
+            AND ExpirationDate >= CURDATE()
+            AND TotalQuantityOz > 0
+        """, [self.manufacturer_id] + lot_ids)
+        received = self.cursor.rowcount
+
+        self.connection.commit()
+        return received
+
     def receive_ingredient_batches(self):
         print("\n" + "-"*60)
         print("RECEIVE INGREDIENT BATCHES")
@@ -1375,16 +1931,9 @@ class ManufacturerMenu:
             lot_ids = [available_batches[idx - 1][0] for idx in selected_indices]
             
             try:
-                placeholders = ','.join(['%s'] * len(lot_ids))
-                self.cursor.execute(f"""
-                    UPDATE IngredientBatch
-                    SET ManufacturerID = %s
-                    WHERE LotID IN ({placeholders}) AND ManufacturerID IS NULL
-                """, [self.manufacturer_id] + lot_ids)
-                
-                self.connection.commit()
+                received = self.claim_ingredient_batches(lot_ids)
                 
-                print(f"\nSuccessfully received {self.cursor.rowcount} ingredient batch(es)!")
+                print(f"\nSuccessfully received {received} ingredient batch(es)!")
                 print("These batches are now in your inventory.")
                 
             except mysql.connector.Error as err:
@@ -5,10 +5,20 @@ CSC540 Database Project - Query Menu Module
 
 import mysql.connector
 
+# Query number -> (procedure, arguments) for the five required queries
+QUERIES = {
+    1: ('sp_query_last_batch_ingredients', [100, 'MFG001']),
+    2: ('sp_query_supplier_spending', [2]),
+    3: ('sp_query_product_unit_cost', ['100-MFG001-B0901']),
+    4: ('sp_query_conflicting_ingredients', ['100-MFG001-B0901']),
+    5: ('sp_query_manufacturers_not_supplied', [21]),
+}
+
 class QueryMenu:
-    def __init__(self, connection, cursor):
-        self.connection = connection
-        self.cursor = cursor
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+        self.cursor = None
 
     def run(self):
         while True:
@@ -29,25 +39,28 @@ class QueryMenu:
                 print("Invalid input. Please enter a number.")
                 continue
 
-            try:
-                if choice == 1:
-                    self.query1_last_batch_ingredients()
-                elif choice == 2:
-                    self.query2_supplier_spending()
-                elif choice == 3:
-                    self.query3_product_unit_cost()
-                elif choice == 4:
-                    self.query4_conflicting_ingredients()
-                elif choice == 5:
-                    self.query5_manufacturers_not_supplied()
-                elif choice == 6:
-                    break
-                else:
-                    print("Invalid choice. Please enter 1-6.")
-            except mysql.connector.Error as err:
-                print(f"Database error: {err}")
-            except Exception as e:
-                print(f"Unexpected error: {e}")
+            # Check out a pooled connection for this operation only
+            with self.pool.session() as (connection, cursor):
+                self.connection, self.cursor = connection, cursor
+                try:
+                    if choice == 1:
+                        self.query1_last_batch_ingredients()
+                    elif choice == 2:
+                        self.query2_supplier_spending()
+                    elif choice == 3:
+                        self.query3_product_unit_cost()
+                    elif choice == 4:
+                        self.query4_conflicting_ingredients()
+                    elif choice == 5:
+                        self.query5_manufacturers_not_supplied()
+                    elif choice == 6:
+                        break
+                    else:
+                        print("Invalid choice. Please enter 1-6.")
+                except mysql.connector.Error as err:
+                    print(f"Database error: {err}")
+                except Exception as e:
+                    print(f"Unexpected error: {e}")
 
     # Query 1: Last Batch Ingredients
     def query1_last_batch_ingredients(self):
@@ -59,7 +72,7 @@ class QueryMenu:
         print("-"*70)
         
         try:
-            self.cursor.callproc('sp_query_last_batch_ingredients', [100, 'MFG001'])
+            self.cursor.callproc(*QUERIES[1])
             
             for result in self.cursor.stored_results():
                 rows = result.fetchall()
@@ -93,7 +106,7 @@ class QueryMenu:
         print("-"*70)
         
         try:
-            self.cursor.callproc('sp_query_supplier_spending', [2])
+            self.cursor.callproc(*QUERIES[2])
             
             for result in self.cursor.stored_results():
                 rows = result.fetchall()
@@ -123,7 +136,7 @@ class QueryMenu:
         print("-"*70)
         
         try:
-            self.cursor.callproc('sp_query_product_unit_cost', ['100-MFG001-B0901'])
+            self.cursor.callproc(*QUERIES[3])
             
             for result in self.cursor.stored_results():
                 rows = result.fetchall()
@@ -153,7 +166,7 @@ class QueryMenu:
         print("-"*70)
         
         try:
-            self.cursor.callproc('sp_query_conflicting_ingredients', ['100-MFG001-B0901'])
+            self.cursor.callproc(*QUERIES[4])
             
             for result in self.cursor.stored_results():
                 rows = result.fetchall()
@@ -179,7 +192,7 @@ class QueryMenu:
         print("-"*70)
         
         try:
-            self.cursor.callproc('sp_query_manufacturers_not_supplied', [21])
+            self.cursor.callproc(*QUERIES[5])
             
             for result in self.cursor.stored_results():
                 rows = result.fetchall()
@@ -0,0 +1,234 @@
+"""
+CSC540 Database Project - Concurrent Allocation Stress Test
+Food Manufacturing Inventory Management System
+Many producers drawing on the same ingredient lots at once; verifies that no consumption is lost
+and no lot is oversubscribed
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+
+import mysql.connector
+
+from manufacturer_menu import ManufacturerMenu
+
+TOLERANCE_OZ = 0.01  # quantities are FLOAT columns
+
+
+def pick_recipe(cursor, recipe_id=None):
+    # The given recipe, or the one with the most production history
+    cursor.execute(f"""
+        SELECT r.RecipeID, p.ManufacturerID, m.UserID
+        FROM Recipe r
+        INNER JOIN Product p ON r.ProductID = p.ProductID
+        INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
+        WHERE {'r.RecipeID = %s' if recipe_id else 'TRUE'}
+        AND EXISTS (SELECT 1 FROM RecipeBOM rb WHERE rb.RecipeID = r.RecipeID)
+        ORDER BY (SELECT COUNT(*) FROM ProductBatch pb WHERE pb.RecipeID = r.RecipeID) DESC, r.RecipeID
+        LIMIT 1
+    """, (recipe_id,) if recipe_id else ())
+    row = cursor.fetchone()
+    if row is None:
+        raise SystemExit("Error: No recipe with ingredients found. Load data first.")
+    return row
+
+
+def snapshot_lots(cursor, recipe_id, manufacturer_id):
+    # LotID -> (TotalQuantityOz, Quantity) for every lot the recipe could draw on
+    cursor.execute("""
+        SELECT ib.LotID, ib.TotalQuantityOz, ib.Quantity
+        FROM IngredientBatch ib
+        INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+        INNER JOIN RecipeBOM rb ON rb.IngredientID = f.IngredientID AND rb.RecipeID = %s
+        WHERE ib.ManufacturerID = %s
+    """, (recipe_id, manufacturer_id))
+    return {lot_id: (float(total_oz), float(qty)) for lot_id, total_oz, qty in cursor.fetchall()}
+
+
+def possible_runs(cursor, recipe_id, manufacturer_id, units):
+    cursor.callproc('sp_validate_recipe_inventory', [recipe_id, units, manufacturer_id])
+    lines = []
+    for result in cursor.stored_results():
+        lines = result.fetchall()
+    return min(int(float(on_hand) // float(needed)) if float(needed) > 0 else sys.maxsize
+               for _, _, needed, on_hand, _ in lines)
+
+
+def worker(config, recipe_id, manufacturer_id, user_id, units, runs, results, lock):
+    connection = mysql.connector.connect(**config)
+    menu = ManufacturerMenu(None, user_id, manufacturer_id)
+    menu.connection, menu.cursor = connection, connection.cursor()
+    today = date.today()
+    try:
+        for _ in range(runs):
+            started = time.monotonic()
+            try:
+                success, lot_id, _, _, message = menu.commit_product_batch(
+                    recipe_id, units, today.strftime("%Y-%m-%d"),
+                    (today + timedelta(days=30)).strftime("%Y-%m-%d"))
+            except mysql.connector.Error as err:
+                success, lot_id, message = False, None, f"Database error: {err}"
+            with lock:
+                results.append((success, lot_id, message, time.monotonic() - started))
+    finally:
+        menu.cursor.close()
+        connection.close()
+
+
+def check_invariants(cursor, recipe_id, manufacturer_id, units, before, created):
+    # Every lot must have lost exactly what the new batches recorded against it, and never go negative
+    problems = []
+    after = snapshot_lots(cursor, recipe_id, manufacturer_id)
+
+    consumed = {}
+    if created:
+        placeholders = ','.join(['%s'] * len(created))
+        cursor.execute(f"""
+            SELECT IngredientLotID, SUM(QuantityUsed)
+            FROM ProductBatchIngredientBatch
+            WHERE ProductLotID IN ({placeholders})
+            GROUP BY IngredientLotID
+        """, created)
+        consumed = {lot_id: float(total) for lot_id, total in cursor.fetchall()}
+
+    for lot_id, (total_before, _) in before.items():
+        total_after = after[lot_id][0]
+        used = consumed.pop(lot_id, 0.0)
+        if total_after < -TOLERANCE_OZ:
+            problems.append(f"{lot_id}: negative quantity {total_after:.4f} oz")
+        if abs((total_before - total_after) - used) > TOLERANCE_OZ:
+            problems.append(f"{lot_id}: lost update - dropped {total_before - total_after:.4f} oz "
+                            f"but batches recorded {used:.4f} oz")
+    for lot_id in consumed:
+        problems.append(f"{lot_id}: consumed but outside the recipe's candidate lots")
+
+    if created:
+        # Each batch must carry its full requirement for every BOM line
+        cursor.execute(f"""
+            SELECT pbib.ProductLotID, rb.IngredientID, rb.Quantity * %s AS NeededOz,
+                   COALESCE(SUM(pbib.QuantityUsed), 0) AS UsedOz
+            FROM RecipeBOM rb
+            CROSS JOIN ProductBatch pb
+            LEFT JOIN (
+                ProductBatchIngredientBatch pbib
+                INNER JOIN IngredientBatch ib ON pbib.IngredientLotID = ib.LotID
+                INNER JOIN Formulation f ON ib.FormulationID = f.FormulationID
+            ) ON pbib.ProductLotID = pb.LotID AND f.IngredientID = rb.IngredientID
+            WHERE rb.RecipeID = %s AND pb.LotID IN ({placeholders})
+            GROUP BY pbib.ProductLotID, rb.IngredientID, rb.Quantity
+        """, [units, recipe_id] + created)
+        for product_lot, ing_id, needed_oz, used_oz in cursor.fetchall():
+            if abs(float(needed_oz) - float(used_oz)) > TOLERANCE_OZ:
+                problems.append(f"{product_lot}: ingredient {ing_id} got {float(used_oz):.4f} oz, "
+                                f"needs {float(needed_oz):.4f} oz")
+    return problems
+
+
+def restore(connection, cursor, before, created):
+    # Put the lots back and remove the batches this run created (consumption rows cascade)
+    #  The cascade fires no triggers, so the spend rollup is rebuilt to drop their consumption.
+    #  The invariant checks leave a read transaction open; end it before starting this one
+    connection.rollback()
+    connection.start_transaction()
+    cursor.executemany("""
+        UPDATE IngredientBatch
+        SET TotalQuantityOz = %s, Quantity = %s
+        WHERE LotID = %s
+    """, [(total_oz, qty, lot_id) for lot_id, (total_oz, qty) in before.items()])
+    if created:
+        placeholders = ','.join(['%s'] * len(created))
+        cursor.execute(f"DELETE FROM ProductBatch WHERE LotID IN ({placeholders})", created)
+        cursor.callproc('sp_refresh_supplier_spend')
+    connection.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run concurrent product batch allocations against the same lots and check for lost updates.")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent producers (default 8)")
+    parser.add_argument('--runs', type=int, default=25, help="batches each producer attempts (default 25)")
+    parser.add_argument('--units', type=int, default=1, help="units per batch (default 1)")
+    parser.add_argument('--recipe-id', type=int, help="recipe to produce (default: busiest recipe)")
+    parser.add_argument('--keep', action='store_true', help="keep the batches instead of restoring the lots")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3306)
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--database', default='csc540_project')
+    args = parser.parse_args(argv)
+
+    password = os.environ.get('MYSQL_PWD')
+    if password is None:
+        password = input("Enter MySQL password: ")
+    config = {'host': args.host, 'port': args.port, 'user': args.user,
+              'password': password, 'database': args.database}
+
+    try:
+        connection = mysql.connector.connect(**config)
+    except mysql.connector.Error as err:
+        print(f"Error: Cannot connect to database: {err}")
+        return 1
+    cursor = connection.cursor()
+
+    recipe_id, manufacturer_id, user_id = pick_recipe(cursor, args.recipe_id)
+    before = snapshot_lots(cursor, recipe_id, manufacturer_id)
+    capacity = possible_runs(cursor, recipe_id, manufacturer_id, args.units)
+    attempts = args.workers * args.runs
+    connection.commit()
+
+    print(f"Recipe {recipe_id} (manufacturer {user_id}), {args.units} unit(s) per batch, "
+          f"{len(before)} candidate lots")
+    print(f"{args.workers} workers x {args.runs} runs = {attempts} attempts; stock covers about {capacity}")
+    if attempts > capacity:
+        print("Attempts beyond the stock are expected to fail with insufficient inventory.")
+
+    results = []
+    lock = threading.Lock()
+    threads = [threading.Thread(target=worker,
+                                args=(config, recipe_id, manufacturer_id, user_id,
+                                      args.units, args.runs, results, lock))
+               for _ in range(args.workers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    created = [lot_id for success, lot_id, _, _ in results if success]
+    failures = {}
+    for success, _, message, _ in results:
+        if not success:
+            failures[message] = failures.get(message, 0) + 1
+    latencies = sorted(duration for _, _, _, duration in results)
+
+    print(f"\n{len(created)} batches created, {attempts - len(created)} failed, in {elapsed:.1f}s "
+          f"({len(results) / elapsed:.1f} attempts/s)")
+    if latencies:
+        print(f"Latency p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms")
+    for message, count in sorted(failures.items(), key=lambda item: -item[1]):
+        print(f"  {count:>5} x {message}")
+
+    connection.commit()  # fresh snapshot for the checks
+    problems = check_invariants(cursor, recipe_id, manufacturer_id, args.units, before, created)
+    if not args.keep:
+        restore(connection, cursor, before, created)
+        print("Lots restored and test batches removed.")
+    cursor.close()
+    connection.close()
+
+    if problems:
+        print("\nINVARIANT VIOLATIONS:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    print("\nNo lost updates or oversubscribed lots.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,11 +5,16 @@ Graduate Version - UPDATED with Batch Viewing and Versioned Formulations
 
 import mysql.connector
 from datetime import date, datetime, timedelta
+from conflict_index import get_conflict_index
+from ingredient_catalog import get_ingredient_catalog, choose_ingredient, print_ingredients
+
+MIN_SHELF_LIFE_DAYS = 90  # new ingredient lots must expire at least this far out
 
 class SupplierMenu:
-    def __init__(self, connection, cursor, user_id, supplier_id):
-        self.connection = connection
-        self.cursor = cursor
+    def __init__(self, pool, user_id, supplier_id):
+        self.pool = pool
+        self.connection = None
+        self.cursor = None
         self.user_id = user_id
         self.supplier_id = supplier_id
     
@@ -53,28 +58,36 @@ class SupplierMenu:
             
             try:
                 choice = int(input("\nSelection: "))
-                if choice == 1:
-                    self.manage_ingredients()
-                elif choice == 2:
-                    self.maintain_formulations()
-                elif choice == 3:
-                    self.create_ingredient_batch()
-                elif choice == 4:
-                    self.view_ingredient_batches()
-                elif choice == 5:
-                    self.manage_do_not_combine()
-                elif choice == 6:
-                    self.view_my_ingredients()
-                elif choice == 7:
-                    print("\nLogging out...")
-                    break
-                else:
-                    print("Invalid choice. Please enter 1-7.")
             except ValueError:
                 print("Invalid input. Please enter a number.")
-            except Exception as e:
-                print(f"An error occurred: {e}")
-                self.connection.rollback()
+                continue
+
+            # Check out a pooled connection for this operation only
+            with self.pool.session() as (connection, cursor):
+                self.connection, self.cursor = connection, cursor
+                try:
+                    if choice == 1:
+                        self.manage_ingredients()
+                    elif choice == 2:
+                        self.maintain_formulations()
+                    elif choice == 3:
+                        self.create_ingredient_batch()
+                    elif choice == 4:
+                        self.view_ingredient_batches()
+                    elif choice == 5:
+                        self.manage_do_not_combine()
+                    elif choice == 6:
+                        self.view_my_ingredients()
+                    elif choice == 7:
+                        print("\nLogging out...")
+                        break
+                    else:
+                        print("Invalid choice. Please enter 1-7.")
+                except ValueError:
+                    print("Invalid input. Please enter a number.")
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    self.connection.rollback()
     
     def manage_ingredients(self):
         print("\n" + "-"*60)
@@ -141,19 +154,9 @@ class SupplierMenu:
     def view_all_ingredients(self):
         print("\n--- All Ingredients ---")
         try:
-            self.cursor.execute("""
-                SELECT IngredientID, IngredientName, IsCompound
-                FROM Ingredient
-                ORDER BY IngredientName
-            """)
-            
-            results = self.cursor.fetchall()
+            results = get_ingredient_catalog(self.cursor).search()
             if results:
-                print(f"\n{'ID':<6} {'Name':<30} {'Type':<10}")
-                print("-" * 50)
-                for row in results:
-                    ing_type = "Compound" if row[2] else "Atomic"
-                    print(f"{row[0]:<6} {row[1]:<30} {ing_type:<10}")
+                print_ingredients(results)
             else:
                 print("No ingredients found.")
                 
@@ -161,11 +164,8 @@ class SupplierMenu:
             print(f"Database error: {err}")
 
     def check_formulation_conflicts(self, formulation_id):
-        self.cursor.callproc('sp_get_formulation_conflicts', [formulation_id])
-        
-        conflicts = []
-        for result in self.cursor.stored_results():
-            conflicts = result.fetchall()
+        # Same pairs as sp_get_formulation_conflicts, answered from the session conflict index
+        conflicts = get_conflict_index(self.cursor).formulation_conflicts(formulation_id)
         
         return (len(conflicts) > 0, conflicts)
     
@@ -200,46 +200,17 @@ class SupplierMenu:
         print("\n--- Create New Formulation Version ---")
 
         try:
-            # Show all ingredients
-            self.cursor.execute("""
-                SELECT IngredientID, IngredientName, IsCompound
-                FROM Ingredient
-                ORDER BY IngredientName
-            """)
-            ingredients = self.cursor.fetchall()
-
-            if not ingredients:
+            catalog = get_ingredient_catalog(self.cursor)
+            if not len(catalog):
                 print("No ingredients found. Add ingredients first.")
                 return
 
-            print(f"\n{'ID':<6} {'Ingredient Name':<30} {'Type':<10}")
-            print("-" * 50)
-            for ing_id, ing_name, is_comp in ingredients:
-                ing_type = "Compound" if is_comp else "Atomic"
-                print(f"{ing_id:<6} {ing_name:<30} {ing_type:<10}")
-
-            try:
-                ingredient_id = int(input("\nEnter Ingredient ID (0 to cancel): "))
-            except ValueError:
-                print("Error: Invalid ingredient ID.")
-                return
-
-            if ingredient_id == 0:
-                return
-
-            # Look up ingredient
-            self.cursor.execute("""
-                SELECT IngredientName, IsCompound
-                FROM Ingredient WHERE IngredientID = %s
-            """, (ingredient_id,))
-            row = self.cursor.fetchone()
-
-            if not row:
-                print("Error: Invalid ingredient ID.")
+            ingredient_id = choose_ingredient(catalog, "\nEnter Ingredient ID or name (0 to cancel): ")
+            if ingredient_id is None:
                 return
 
-            ingredient_name, is_compound = row
-            is_compound = bool(is_compound)
+            ingredient_name = catalog.name(ingredient_id)
+            is_compound = catalog.is_compound(ingredient_id)
 
             # Get pack size and unit price
             pack_size = self.validate_positive_number("Pack Size (oz per package): ", float)
@@ -290,16 +261,12 @@ class SupplierMenu:
                 print("\n--- Current Draft ---")
                 print(f"Pack Size: {pack_size:.1f} oz, Unit Price: ${unit_price:.2f}")
 
+                catalog = get_ingredient_catalog(self.cursor)
                 if draft_materials:
                     print(f"\n{'MaterialID':<12} {'Name':<30} {'Qty (oz)':<10}")
                     print("-" * 55)
                     for mid, qty in draft_materials.items():
-                        self.cursor.execute("""
-                            SELECT IngredientName FROM Ingredient WHERE IngredientID = %s
-                        """, (mid,))
-                        name_row = self.cursor.fetchone()
-                        name = name_row[0] if name_row else "UNKNOWN"
-                        print(f"{mid:<12} {name:<30} {qty:<10.2f}")
+                        print(f"{mid:<12} {catalog.name(mid):<30} {qty:<10.2f}")
                 else:
                     print("\nNo materials in draft yet.")
 
@@ -318,30 +285,23 @@ class SupplierMenu:
 
                 if choice == 1:
                     # Add/update material
-                    self.cursor.execute("""
-                        SELECT IngredientID, IngredientName
-                        FROM Ingredient
-                        WHERE IsCompound = FALSE
-                        ORDER BY IngredientName
-                    """)
-                    atoms = self.cursor.fetchall()
-                    
-                    if not atoms:
+                    if not catalog.search(atomic_only=True, limit=1):
                         print("No atomic ingredients available.")
                         continue
 
-                    print(f"\n{'ID':<6} {'Name':<30}")
-                    print("-" * 40)
-                    for mid, mname in atoms:
-                        print(f"{mid:<6} {mname:<30}")
+                    mat_id = choose_ingredient(
+                        catalog, "\nMaterial Ingredient ID or name (0 to cancel): ", atomic_only=True)
+                    if mat_id is None:
+                        continue
 
-                    try:
-                        mat_id = int(input("\nMaterial Ingredient ID: "))
-                        qty = self.validate_positive_number("Quantity (oz): ", float)
-                        draft_materials[mat_id] = qty
-                        print("Material added/updated in draft.")
-                    except ValueError:
-                        print("Invalid input.")
+                    qty = self.validate_positive_number("Quantity (oz): ", float)
+
+                    # Incremental do-not-combine check against the rest of the draft
+                    others = [m for m in draft_materials if m != mat_id]
+                    for c in get_conflict_index(self.cursor).conflicts_with(others, mat_id):
+                        print(f"WARNING: {c[1]} should not be combined with {c[3]}")
+                    draft_materials[mat_id] = qty
+                    print("Material added/updated in draft.")
 
                 elif choice == 2:
                     # Remove material
@@ -382,6 +342,8 @@ class SupplierMenu:
 
     def commit_formulation_version(self, ingredient_id, pack_size, unit_price, materials):
         try:
+            conflicts = get_conflict_index(self.cursor).conflicts(materials)
+
             self.ensure_clean_transaction()
             self.connection.start_transaction()
 
@@ -418,23 +380,22 @@ class SupplierMenu:
                     VALUES (%s, %s, %s)
                 """, (formulation_id, mat_id, qty))
 
-            # Check for conflicts
-            self.cursor.callproc('sp_get_formulation_conflicts', [formulation_id])
+            # Re-expand this ingredient and every compound that contains it (rejects cycles)
+            self.cursor.callproc('sp_refresh_formulation_expansion', [ingredient_id])
 
-            for result in self.cursor.stored_results():
-                conflicts = result.fetchall()
-                if conflicts:
-                    print("\n" + "="*70)
-                    print("WARNING: Do-Not-Combine Conflicts Detected")
-                    print("="*70)
-                    print("The following material pairs should not be combined:")
-                    print(f"\n{'Ingredient 1':<30} {'Ingredient 2':<30}")
-                    print("-"*65)
-                    for c in conflicts:
-                        print(f"{c[1]:<30} {c[3]:<30}")
-                    print("\nThis formulation may pose health risks!")
-                else:
-                    print("\nNo ingredient conflicts detected")
+            # Check for conflicts (session conflict index, same rules as sp_get_formulation_conflicts)
+            if conflicts:
+                print("\n" + "="*70)
+                print("WARNING: Do-Not-Combine Conflicts Detected")
+                print("="*70)
+                print("The following material pairs should not be combined:")
+                print(f"\n{'Ingredient 1':<30} {'Ingredient 2':<30}")
+                print("-"*65)
+                for c in conflicts:
+                    print(f"{c[1]:<30} {c[3]:<30}")
+                print("\nThis formulation may pose health risks!")
+            else:
+                print("\nNo ingredient conflicts detected")
 
             # Success
             self.connection.commit()
@@ -449,6 +410,10 @@ class SupplierMenu:
         print("\n--- Current Active Formulations ---")
 
         try:
+            # Move the current-version pointers first if the day has changed since they were set,
+            #  committing at once so the refresh holds no locks while the menu waits on input
+            self.cursor.callproc('sp_ensure_current_formulations')
+            self.connection.commit()
             # Pull from the view, limited to this supplier
             self.cursor.execute("""
                 SELECT 
@@ -525,6 +490,8 @@ class SupplierMenu:
         print("\n--- View Formulation Details ---")
         
         try:
+            self.cursor.callproc('sp_ensure_current_formulations')
+            self.connection.commit()
             # Show ALL formulations for this supplier
             self.cursor.execute("""
                 SELECT 
@@ -534,12 +501,13 @@ class SupplierMenu:
                     f.EffectiveStartDate,
                     f.EffectiveEndDate,
                     CASE 
-                        WHEN CURDATE() BETWEEN f.EffectiveStartDate AND f.EffectiveEndDate 
+                        WHEN cf.FormulationID IS NOT NULL 
                         THEN 'ACTIVE' 
                         ELSE 'EXPIRED' 
                     END AS Status
                 FROM Formulation f
                 INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
+                LEFT JOIN CurrentFormulation cf ON cf.FormulationID = f.FormulationID
                 WHERE f.SupplierID = %s
                 ORDER BY i.IngredientName, f.VersionNumber DESC
             """, (self.supplier_id,))
@@ -626,15 +594,17 @@ class SupplierMenu:
         print("-"*60)
         
         try:
+            self.cursor.callproc('sp_ensure_current_formulations')
+            self.connection.commit()
             # Show active formulations
             self.cursor.execute("""
                 SELECT 
                     f.FormulationID, i.IngredientName, f.PackSize,
                     f.UnitPrice, f.VersionNumber
-                FROM Formulation f
+                FROM CurrentFormulation cf
+                INNER JOIN Formulation f ON cf.FormulationID = f.FormulationID
                 INNER JOIN Ingredient i ON f.IngredientID = i.IngredientID
-                WHERE f.SupplierID = %s
-                AND CURDATE() BETWEEN f.EffectiveStartDate AND f.EffectiveEndDate
+                WHERE cf.SupplierID = %s
                 ORDER BY i.IngredientName
             """, (self.supplier_id,))
             
@@ -687,8 +657,8 @@ class SupplierMenu:
             total_oz = quantity * pack_size
             print(f"Total ounces: {total_oz:.2f} oz ({quantity} packages x {pack_size} oz/package)")
             
-            # Expiration date with 90-day minimum
-            min_expiry = date.today() + timedelta(days=90)
+            # Expiration date with the MIN_SHELF_LIFE_DAYS minimum
+            min_expiry = date.today() + timedelta(days=MIN_SHELF_LIFE_DAYS)
             print(f"\nMinimum expiration date: {min_expiry.strftime('%Y-%m-%d')}")
             
             exp_date = None
@@ -703,35 +673,17 @@ class SupplierMenu:
                     print("Invalid date. Please try again.")
                     continue
                 
-                # Check 90-day rule
+                # Check the minimum shelf life
                 exp_date_obj = datetime.strptime(exp_date, "%Y-%m-%d").date()
                 days_until = (exp_date_obj - date.today()).days
                 
-                if days_until < 90:
-                    print(f"Error: Expiration must be at least 90 days from today.")
+                if days_until < MIN_SHELF_LIFE_DAYS:
+                    print(f"Error: Expiration must be at least {MIN_SHELF_LIFE_DAYS} days from today.")
                     print(f"Current days until expiry: {days_until}")
                     exp_date = None
             
             # Create batch
-            self.ensure_clean_transaction()
-            self.connection.start_transaction()
-            
-            self.cursor.execute("""
-                INSERT INTO IngredientBatch (
-                    FormulationID, Quantity, TotalQuantityOz, ExpirationDate
-                ) VALUES (%s, %s, %s, %s)
-            """, (formulation_id, quantity, total_oz, exp_date))
-            
-            # Get generated LotID
-            self.cursor.execute("""
-                SELECT LotID FROM IngredientBatch
-                WHERE FormulationID = %s
-                ORDER BY LotID DESC LIMIT 1
-            """, (formulation_id,))
-            
-            lot_id = self.cursor.fetchone()[0]
-            
-            self.connection.commit()
+            lot_id = self.insert_ingredient_batch(formulation_id, quantity, total_oz, exp_date)
             
             print(f"\nIngredient batch created successfully!")
             print(f"Lot ID: {lot_id}")
@@ -744,6 +696,18 @@ class SupplierMenu:
             print(f"Database error: {err}")
             self.connection.rollback()
     
+    def insert_ingredient_batch(self, formulation_id, quantity, total_oz, exp_date):
+        self.ensure_clean_transaction()
+        self.connection.start_transaction()
+
+        # Generated LotID comes back as the OUT parameter
+        results = self.cursor.callproc(
+            'sp_create_ingredient_batch',
+            [formulation_id, quantity, total_oz, exp_date, None])
+
+        self.connection.commit()
+        return results[4]
+
     def view_ingredient_batches(self):
         print("\n--- My Ingredient Batches ---")
 
@@ -873,11 +837,17 @@ class SupplierMenu:
     def add_do_not_combine_rule(self):
         print("\n--- Add Do-Not-Combine Rule ---")
         
-        self.view_all_ingredients()
-        
         try:
-            ing1_id = int(input("\nEnter First Ingredient ID: "))
-            ing2_id = int(input("Enter Second Ingredient ID: "))
+            # Rules are between atomic ingredients only
+            catalog = get_ingredient_catalog(self.cursor)
+            ing1_id = choose_ingredient(catalog, "\nFirst Ingredient ID or name (0 to cancel): ",
+                                        atomic_only=True)
+            if ing1_id is None:
+                return
+            ing2_id = choose_ingredient(catalog, "Second Ingredient ID or name (0 to cancel): ",
+                                        atomic_only=True, show_list=False)
+            if ing2_id is None:
+                return
             
             if ing1_id == ing2_id:
                 print("Error: Cannot create rule for same ingredient.")
@@ -924,8 +894,6 @@ class SupplierMenu:
         except mysql.connector.Error as err:
             print(f"Error: {err}")
             self.connection.rollback()
-        except ValueError:
-            print("Error: Invalid ingredient ID.")
     
     def remove_do_not_combine_rule(self):
         print("\n--- Remove Do-Not-Combine Rule ---")
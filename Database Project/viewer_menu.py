@@ -5,11 +5,15 @@ Read-only access for viewing products, recipes, and ingredients
 """
 
 import mysql.connector
+from datetime import datetime
+
+PAGE_SIZE = 20  # product batches listed per page
 
 class ViewerMenu:
-    def __init__(self, connection, cursor, user_id):
-        self.connection = connection
-        self.cursor = cursor
+    def __init__(self, pool, user_id):
+        self.pool = pool
+        self.connection = None
+        self.cursor = None
         self.user_id = user_id
 
     # Main menu loop
@@ -30,43 +34,124 @@ class ViewerMenu:
                 print("Invalid input. Please enter a number.")
                 continue
 
-            try:
-                if choice == 1:
-                    self.browse_product_batches()
-                elif choice == 2:
-                    self.view_product_recipes_flattened()
-                elif choice == 3:
-                    self.compare_products_incompatibilities()
-                elif choice == 4:
-                    print("\nReturning to role selection...")
-                    break
-                else:
-                    print("Invalid choice. Please enter 1-4.")
-            except mysql.connector.Error as err:
-                print(f"Database error: {err}")
-            except Exception as e:
-                print(f"Unexpected error: {e}")
+            # Check out a pooled connection for this operation only
+            with self.pool.session() as (connection, cursor):
+                self.connection, self.cursor = connection, cursor
+                try:
+                    if choice == 1:
+                        self.browse_product_batches()
+                    elif choice == 2:
+                        self.view_product_recipes_flattened()
+                    elif choice == 3:
+                        self.compare_products_incompatibilities()
+                    elif choice == 4:
+                        print("\nReturning to role selection...")
+                        break
+                    else:
+                        print("Invalid choice. Please enter 1-4.")
+                except mysql.connector.Error as err:
+                    print(f"Database error: {err}")
+                except Exception as e:
+                    print(f"Unexpected error: {e}")
+
+    def _ask_batch_filters(self):
+        # (ManufacturerID, ProductID, from date, to date); blank entries mean "any"
+        if input("Filter batches by manufacturer, product or date? (Y/N): ").strip().upper() != 'Y':
+            return (None, None, None, None)
+        try:
+            manufacturer_id = input("  ManufacturerID (blank for any): ").strip()
+            product_id = input("  ProductID (blank for any): ").strip()
+            date_from = input("  Produced on/after (YYYY-MM-DD, blank for any): ").strip()
+            date_to = input("  Produced on/before (YYYY-MM-DD, blank for any): ").strip()
+            return (int(manufacturer_id) if manufacturer_id else None,
+                    int(product_id) if product_id else None,
+                    datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None,
+                    datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None)
+        except ValueError:
+            print("Invalid filter.")
+            return None
+
+    def _fetch_batch_page(self, filters, after):
+        # One extra row tells us whether there is a next page
+        self.cursor.callproc('sp_browse_product_batches',
+                             [*filters, *(after or (None, None)), PAGE_SIZE + 1])
+        rows = []
+        for result in self.cursor.stored_results():
+            rows = result.fetchall()
+        return rows[:PAGE_SIZE], len(rows) > PAGE_SIZE
+
+    def _find_batch(self, lot_id):
+        self.cursor.execute("""
+            SELECT pb.LotID, p.ProductName
+            FROM ProductBatch pb
+            INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
+            INNER JOIN Product p ON r.ProductID = p.ProductID
+            WHERE pb.LotID = %s
+        """, (lot_id,))
+        return self.cursor.fetchone()
+
+    def _page_product_batches(self, prompt=None):
+        # Lists batches a page at a time (keyset on ProductionDate, LotID)
+        #  With a prompt, returns the (LotID, ProductName) picked by # or typed Lot ID, else None
+        filters = self._ask_batch_filters()
+        if filters is None:
+            return None
+
+        page_keys = [None]  # (ProductionDate, LotID) to continue after, per page shown
+        while True:
+            rows, has_more = self._fetch_batch_page(filters, page_keys[-1])
+            if not rows and len(page_keys) == 1:
+                print("No product batches found.")
+                if prompt is None:
+                    return None
+
+            first = (len(page_keys) - 1) * PAGE_SIZE
+            if rows:
+                print(f"\n{'#':<4} {'Batch LotID':<20} {'ProdID':<8} {'Product':<25} {'Category':<15} "
+                    f"{'Manufacturer':<15} {'Qty':<6} {'Production':<12}")
+                print("-"*120)
+                for idx, r in enumerate(rows, 1):
+                    print(f"{idx:<4} {r[0]:<20} {r[1]:<8} {r[2]:<25} {r[3]:<15} "
+                        f"{r[5]:<15} {r[6]:<6} {str(r[7]):<12}")
+                print(f"\nBatches {first + 1}-{first + len(rows)}"
+                      f"{' (more available)' if has_more else ''}")
+
+            paging = []
+            if has_more:
+                paging.append("N = next page")
+            if len(page_keys) > 1:
+                paging.append("P = previous page")
+            if prompt is None:
+                selection = input(f"{', '.join(paging + ['Enter to finish'])}: ").strip()
+            else:
+                selection = input(f"{prompt} ({', '.join(paging + ['or type a Lot ID, 0 to cancel'])}): ").strip()
+
+            if selection.upper() == 'N' and has_more:
+                page_keys.append((rows[-1][7], rows[-1][0]))
+            elif selection.upper() == 'P' and len(page_keys) > 1:
+                page_keys.pop()
+            elif prompt is None:
+                return None
+            elif selection == '0' or not selection:
+                return None
+            elif selection.isdigit():
+                idx = int(selection)
+                if 1 <= idx <= len(rows):
+                    return (rows[idx - 1][0], rows[idx - 1][2])
+                print(f"Error: Please enter a number between 1 and {len(rows)}.")
+            else:
+                # Lot ID typed directly
+                batch = self._find_batch(selection)
+                if batch:
+                    return batch
+                print(f"Error: Product batch {selection} not found.")
 
     # 1) Browse Products (uses stored procedure)
     def browse_product_batches(self):
         print("\n--- Browse Product Batches ---")
         
         try:
-            self.cursor.callproc('sp_browse_product_batches')
-            
-            for result in self.cursor.stored_results():
-                rows = result.fetchall()
-                if rows:
-                    print(f"\n{'#':<4} {'Batch LotID':<20} {'ProdID':<8} {'Product':<25} {'Category':<15} "
-                        f"{'Manufacturer':<15} {'Qty':<6} {'Production':<12}")
-                    print("-"*120)
-                    for idx, r in enumerate(rows, 1):
-                        print(f"{idx:<4} {r[0]:<20} {r[1]:<8} {r[2]:<25} {r[3]:<15} "
-                            f"{r[5]:<15} {r[6]:<6} {str(r[7]):<12}")
-                    print(f"\nTotal: {len(rows)} batch(es)")
-                else:
-                    print("No product batches found.")
-                    
+            self._page_product_batches()
         except mysql.connector.Error as err:
             print(f"Database error: {err}")
 
@@ -75,50 +160,10 @@ class ViewerMenu:
         print("\n--- View Batch Ingredients ---")
         
         try:
-            self.cursor.execute("""
-                SELECT 
-                    pb.LotID,
-                    p.ProductID,
-                    p.ProductName,
-                    u.Username AS Manufacturer,
-                    pb.ProductionDate,
-                    pb.BatchQuantity
-                FROM ProductBatch pb
-                INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
-                INNER JOIN Product p ON r.ProductID = p.ProductID
-                INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
-                INNER JOIN User u ON m.UserID = u.UserID
-                ORDER BY pb.ProductionDate DESC, pb.LotID
-            """)
-            batches = self.cursor.fetchall()
-            
-            if not batches:
-                print("No product batches found.")
-                return
-            
-            print(f"\n{'#':<4} {'Batch LotID':<20} {'ProdID':<8} {'Product':<25} {'Manufacturer':<20} {'Production':<12} {'Qty':<6}")
-            print("-"*105)
-            for idx, b in enumerate(batches, 1):
-                print(f"{idx:<4} {b[0]:<20} {b[1]:<8} {b[2]:<25} {b[3]:<20} {str(b[4]):<12} {b[5]:<6}")
-            
-            # Select batch by number
-            try:
-                selection = int(input("\nEnter batch # (0 to cancel): "))
-            except ValueError:
-                print("Invalid input.")
-                return
-            
-            if selection == 0:
-                return
-            
-            if selection < 1 or selection > len(batches):
-                print(f"Error: Please enter a number between 1 and {len(batches)}.")
+            selected = self._page_product_batches("Enter batch #")
+            if selected is None:
                 return
-            
-            # Get the selected batch
-            selected_batch = batches[selection - 1]
-            batch_lot_id = selected_batch[0]
-            batch_quantity = selected_batch[5]
+            batch_lot_id = selected[0]
             
             # Get batch info
             self.cursor.execute("""
@@ -140,6 +185,7 @@ class ViewerMenu:
             if not batch_info:
                 print("Batch not found.")
                 return
+            batch_quantity = batch_info[4]
             
             print("\n" + "="*70)
             print("FLATTENED INGREDIENT LIST (PER UNIT)")
@@ -150,12 +196,13 @@ class ViewerMenu:
             print(f"Production:   {batch_info[3]}")
             print(f"Batch Size:   {batch_info[4]} units")
             
-            # Get flattened ingredients from view
+            # Get flattened ingredients from the materialized per-batch BOM
             self.cursor.execute("""
-                SELECT IngredientID, IngredientName, TotalQuantityOz, BatchQuantity
-                FROM vw_flattened_product_bom
-                WHERE BatchLotID = %s
-                ORDER BY TotalQuantityOz DESC, IngredientName
+                SELECT fb.IngredientID, i.IngredientName, fb.TotalQuantityOz
+                FROM ProductBatchFlatBOM fb
+                INNER JOIN Ingredient i ON fb.IngredientID = i.IngredientID
+                WHERE fb.ProductLotID = %s
+                ORDER BY fb.TotalQuantityOz DESC, i.IngredientName
             """, (batch_lot_id,))
             
             rows = self.cursor.fetchall()
@@ -165,7 +212,7 @@ class ViewerMenu:
                 print("-"*70)
                 total_oz = 0
                 for r in rows:
-                    qty_per_unit = r[2] / r[3]  # TotalQuantityOz / BatchQuantity
+                    qty_per_unit = r[2] / batch_quantity  # TotalQuantityOz / BatchQuantity
                     print(f"{r[0]:<8} {r[1]:<35} {qty_per_unit:<20.3f}")
                     total_oz += qty_per_unit
                 print("-"*70)
@@ -183,74 +230,25 @@ class ViewerMenu:
         print("Check if two batches have conflicting ingredients (Based on actual formulations used in production)")
         
         try:
-            # Show all product batches with numbers
-            self.cursor.execute("""
-                SELECT 
-                    pb.LotID,
-                    p.ProductID,
-                    p.ProductName,
-                    u.Username AS Manufacturer,
-                    pb.ProductionDate,
-                    pb.BatchQuantity
-                FROM ProductBatch pb
-                INNER JOIN Recipe r ON pb.RecipeID = r.RecipeID
-                INNER JOIN Product p ON r.ProductID = p.ProductID
-                INNER JOIN Manufacturer m ON p.ManufacturerID = m.ManufacturerID
-                INNER JOIN User u ON m.UserID = u.UserID
-                ORDER BY pb.ProductionDate DESC, pb.LotID
-            """)
-            batches = self.cursor.fetchall()
-            
-            if not batches:
-                print("No product batches found.")
-                return
-            
-            print(f"\n{'#':<4} {'Batch LotID':<20} {'ProdID':<8} {'Product':<25} {'Manufacturer':<20} {'Production':<12} {'Qty':<6}")
-            print("-"*105)
-            for idx, b in enumerate(batches, 1):
-                print(f"{idx:<4} {b[0]:<20} {b[1]:<8} {b[2]:<25} {b[3]:<20} {str(b[4]):<12} {b[5]:<6}")
-            
-            # Select first batch
-            try:
-                selection1 = int(input("\nEnter first batch # (0 to cancel): "))
-            except ValueError:
-                print("Invalid input.")
-                return
-            
-            if selection1 == 0:
-                return
-            
-            if selection1 < 1 or selection1 > len(batches):
-                print(f"Error: Please enter a number between 1 and {len(batches)}.")
-                return
-            
-            # Select second batch
-            try:
-                selection2 = int(input("Enter second batch # (0 to cancel): "))
-            except ValueError:
-                print("Invalid input.")
-                return
-            
-            if selection2 == 0:
+            batch1 = self._page_product_batches("Enter first batch #")
+            if batch1 is None:
                 return
             
-            if selection2 < 1 or selection2 > len(batches):
-                print(f"Error: Please enter a number between 1 and {len(batches)}.")
+            print(f"\nFirst batch: {batch1[0]} ({batch1[1]})")
+            batch2 = self._page_product_batches("Enter second batch #")
+            if batch2 is None:
                 return
             
-            if selection1 == selection2:
+            if batch1[0] == batch2[0]:
                 print("Error: Please select two different batches.")
                 return
             
-            # Get the selected batches
-            batch1 = batches[selection1 - 1]
-            batch2 = batches[selection2 - 1]
             batch1_id = batch1[0]
             batch2_id = batch2[0]
             
             print(f"\nComparing:")
-            print(f"  Batch {selection1}: {batch1_id} ({batch1[2]})")
-            print(f"  Batch {selection2}: {batch2_id} ({batch2[2]})")
+            print(f"  Batch 1: {batch1_id} ({batch1[1]})")
+            print(f"  Batch 2: {batch2_id} ({batch2[1]})")
             
             # Call stored procedure
             self.cursor.callproc('sp_compare_batches_incompatibilities', 
@@ -155,6 +155,8 @@ CREATE TABLE ProductBatchIngredientBatch (
     IngredientLotID VARCHAR(255) NOT NULL,
     QuantityUsed INT NOT NULL CHECK (QuantityUsed > 0),
     PRIMARY KEY (ProductLotID, IngredientLotID),
+    -- Reverse lookup for recalls: ingredient lot -> product lots that consumed it
+    INDEX idx_pbib_ingredient_lot (IngredientLotID, ProductLotID),
     FOREIGN KEY (ProductLotID) REFERENCES ProductBatch(LotID)
         ON DELETE CASCADE,
     FOREIGN KEY (IngredientLotID) REFERENCES IngredientBatch(LotID)
@@ -9,6 +9,7 @@ DELIMITER $$
 
 -- Checks if product batch's ingredient batchs contain ingredients that should not be combined
 -- 	This is used for the next AddProductBatch procedure, and blocks that if this one returns true
+-- 	One self-join of the batch's RecipeBOM against DoNotCombineList (pairs are stored with Ingredient1ID < Ingredient2ID)
 CREATE PROCEDURE CheckDoNotCombine(
 	-- Procedure inputs
     IN p_product_batch_id VARCHAR(255),
@@ -16,64 +17,28 @@ CREATE PROCEDURE CheckDoNotCombine(
     OUT p_contains_dnc BOOL
 )
 proc_label: BEGIN
-	DECLARE v_ingredient_1_id INT;
-    DECLARE v_ingredient_2_id INT;
-    DECLARE done INT DEFAULT 0;
-	-- RecipeBOM cursor 1
-    DECLARE rbom_cursor1 CURSOR FOR
-        SELECT rbom.IngredientID
-        FROM RecipeBOM rbom
-        WHERE rbom.RecipeID = (SELECT RecipeID FROM ProductBatch pb WHERE pb.LotID = p_product_batch_id);
-	-- RecipeBOM cursor 2
-    DECLARE rbom_cursor2 CURSOR FOR
-        SELECT rbom.IngredientID
-        FROM RecipeBOM rbom
-        WHERE rbom.RecipeID = (SELECT RecipeID FROM ProductBatch pb WHERE pb.LotID = p_product_batch_id);
-	
-    -- Exception handler for cursor loops
-    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
     -- General exception handler
     DECLARE EXIT HANDLER FOR SQLEXCEPTION
     BEGIN
-        ROLLBACK;
-        SET p_product_batch_id = NULL;
+        SET p_contains_dnc = NULL;
     END;
     
-    START TRANSACTION;
-    
-    OPEN rbom_cursor1;
-    rbom_loop1: LOOP
-		FETCH rbom_cursor1 INTO v_ingredient_1_id;
-        IF done THEN
-			CLOSE rbom_cursor1;
-			SET p_contains_dnc = FALSE;
-            LEAVE rbom_loop1;
-		END IF;
-        OPEN rbom_cursor2;
-        rbom_loop2: LOOP
-			FETCH rbom_cursor2 INTO v_ingredient_2_id;
-			IF done THEN
-				CLOSE rbom_cursor2;
-				LEAVE rbom_loop2;
-			END IF;
-            IF EXISTS (
-				SELECT * FROM DoNotCombineList
-                WHERE Ingredient1ID = LEAST(v_ingredient_1_id, v_ingredient_2_id)
-                AND Ingredient2ID = GREATEST(v_ingredient_1_id, v_ingredient_2_id)
-            ) THEN
-				CLOSE rbom_cursor1;
-                CLOSE rbom_cursor2;
-				SET p_contains_dnc = TRUE;
-                LEAVE rbom_loop1;
-			END IF;
-        END LOOP rbom_loop2;
-    END LOOP rbom_loop1;
-    
-    COMMIT;
+    -- No transaction of its own: this is a single read, and AddProductBatch calls it mid-transaction
+    SET p_contains_dnc = EXISTS (
+        SELECT 1
+        FROM ProductBatch pb
+        JOIN RecipeBOM rbom1 ON rbom1.RecipeID = pb.RecipeID
+        JOIN RecipeBOM rbom2 ON rbom2.RecipeID = pb.RecipeID
+        JOIN DoNotCombineList dnc
+            ON dnc.Ingredient1ID = rbom1.IngredientID
+           AND dnc.Ingredient2ID = rbom2.IngredientID
+        WHERE pb.LotID = p_product_batch_id
+    );
 END$$
 
 -- Adding a product batch
 -- 	Supports manual ingredient batch assignment or automatic consumption (FEFO)
+-- 	Allocations are validated and inserted as sets: one INSERT for all ingredient batches, one UPDATE to consume them
 CREATE PROCEDURE AddProductBatch(
 	-- Procedure inputs
     IN p_recipe_id INT,
@@ -89,44 +54,9 @@ CREATE PROCEDURE AddProductBatch(
 )
 proc_label: BEGIN
 	-- Helper variables
-    DECLARE v_required_qty FLOAT;
-    DECLARE v_available_qty FLOAT;
     DECLARE v_ingredient_id INT;
     DECLARE v_ibatch_id VARCHAR(255);
-    DECLARE v_expiration_date DATE;
-    DECLARE v_qty_to_use FLOAT;
-    -- Exception helper bool
-    DECLARE done INT DEFAULT 0;
     
-    -- Cursor for RecipeBOM items
-    DECLARE rbom_cursor CURSOR FOR
-        SELECT rbom.IngredientID, rbom.Quantity * p_quantity_to_produce AS required_qty
-        FROM RecipeBOM rbom
-        WHERE rbom.RecipeID = p_recipe_id;
-
-    -- Cursor for ingredient batches (automatic assignment)
-    DECLARE ibatch_cursor CURSOR FOR
-        SELECT ib.LotID, ib.Quantity
-        FROM IngredientBatch ib
-        -- Ingredient batches of the given ingredientID
-        WHERE (SELECT f.IngredientID FROM Formulation f WHERE ib.FormulationID = f.FormulationID) = v_ingredient_id
-        -- Manufacturer owns ingredient batch
-		AND ib.ManufacturerID = p_manufacturer_id
-		-- Ingredient batch is non-empty
-		AND ib.Quantity > 0
-		-- Ingredient batch is not expired
-		AND ib.ExpirationDate > CURDATE()
-        -- Get earliest expiration date ingredient batches first
-        ORDER BY ib.ExpirationDate ASC;
-	
-	-- Cursor for manually assigned ingredient batches
-	DECLARE ibatch_list_cursor CURSOR FOR
-			SELECT item.ibatch_id, item.ibatch_quantity_used
-            FROM JSON_TABLE(p_ingredient_batch_list, '$[*]' COLUMNS(ibatch_id VARCHAR(255) PATH '$.ibatch_id', ibatch_quantity_used DEC(10,2) PATH '$.ibatch_quantity_used')) item
-            WHERE (SELECT f.IngredientID FROM Formulation f WHERE (SELECT ib.FormulationID FROM IngredientBatch ib WHERE ib.LotID = item.ibatch_id) = f.FormulationID) = v_ingredient_id;
-	
-	-- Exception handler for cursor loops
-    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
     -- General exception handler
     DECLARE EXIT HANDLER FOR SQLEXCEPTION
     BEGIN
@@ -202,116 +132,141 @@ proc_label: BEGIN
     
     -- Manual ingredient batch assignment
     IF p_ingredient_batch_list IS NOT NULL THEN
-		OPEN rbom_cursor;
-		rbom_loop: LOOP
-			FETCH rbom_cursor INTO v_ingredient_id, v_required_qty;
-			IF done THEN
-				SET done = 0;
-				LEAVE rbom_loop;
-			END IF;
-            
-            OPEN ibatch_list_cursor;
-            ibatch_loop: LOOP
-				FETCH ibatch_list_cursor INTO v_ibatch_id, v_qty_to_use;
-				-- Not enough stock for current ingredient
-				IF done THEN
-					SET done = 0;
-					CLOSE ibatch_list_cursor;
-                    CLOSE rbom_cursor;
-					SET p_success = FALSE;
-					SET p_message = CONCAT('Selected stock insufficient for ingredient ID: ', v_ingredient_id);
-					ROLLBACK;
-					LEAVE proc_label;
-				END IF;
-                -- Get relavent attributes for specified ingredient batch
-				SELECT Quantity, ExpirationDate INTO v_available_qty, v_expiration_date
-                FROM IngredientBatch
-                WHERE LotID = v_ibatch_id;
-
-				-- Make sure specified ingredient batch exists
-				IF v_available_qty IS NULL THEN
-					CLOSE ibatch_list_cursor;
-                    CLOSE rbom_cursor;
-					SET p_success = FALSE;
-					SET p_message = CONCAT('Ingredient batch does not exist with LotID: ', v_ibatch_id);
-					SET p_product_batch_id = NULL;
-					ROLLBACK;
-					LEAVE proc_label;
-				END IF;
-                
-				-- Make sure specified ingredient is not expired
-				IF v_expiration_date < CURDATE() THEN
-					CLOSE ibatch_list_cursor;
-                    CLOSE rbom_cursor;
-					SET p_success = FALSE;
-					SET p_message = CONCAT('Ingredient batch expired with LotID: ', v_ibatch_id);
-					SET p_product_batch_id = NULL;
-					ROLLBACK;
-					LEAVE proc_label;
-				END IF;
-
-				-- Make sure specified ingredient batch has enough quantity
-				IF v_available_qty < v_qty_to_use THEN
-					CLOSE ibatch_list_cursor;
-                    CLOSE rbom_cursor;
-					SET p_success = FALSE;
-					SET p_message = CONCAT('Ingredient batch does not have enough quantity with LotID: ', v_ibatch_id);
-					SET p_product_batch_id = NULL;
-					ROLLBACK;
-					LEAVE proc_label;
-				END IF;
-                
-				-- Add that the product batch uses given ingredient batch
-				INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
-				VALUES (p_product_batch_id, v_ibatch_id, v_qty_to_use);
-				-- Decrease quantity left in used ingredient batch
-				UPDATE IngredientBatch
-					SET Quantity = Quantity - v_qty_to_use
-					WHERE LotID = v_ibatch_id;
-				LEAVE ibatch_loop;
-            END LOOP ibatch_loop;
-		END LOOP rbom_loop;
-        CLOSE rbom_cursor;
+		-- Every RecipeBOM item needs at least one selected ingredient batch
+		SET v_ingredient_id = (
+			SELECT rbom.IngredientID
+			FROM RecipeBOM rbom
+			WHERE rbom.RecipeID = p_recipe_id
+			AND NOT EXISTS (
+				SELECT * FROM JSON_TABLE(p_ingredient_batch_list, '$[*]' COLUMNS(ibatch_id VARCHAR(255) PATH '$.ibatch_id')) item
+				JOIN IngredientBatch ib ON ib.LotID = item.ibatch_id
+				JOIN Formulation f ON f.FormulationID = ib.FormulationID
+				WHERE f.IngredientID = rbom.IngredientID
+			)
+			LIMIT 1
+		);
+		IF v_ingredient_id IS NOT NULL THEN
+			SET p_success = FALSE;
+			SET p_message = CONCAT('Selected stock insufficient for ingredient ID: ', v_ingredient_id);
+			SET p_product_batch_id = NULL;
+			ROLLBACK;
+			LEAVE proc_label;
+		END IF;
+		
+		-- Make sure specified ingredient batches exist
+		SET v_ibatch_id = (
+			SELECT item.ibatch_id
+			FROM JSON_TABLE(p_ingredient_batch_list, '$[*]' COLUMNS(ibatch_id VARCHAR(255) PATH '$.ibatch_id')) item
+			LEFT JOIN IngredientBatch ib ON ib.LotID = item.ibatch_id
+			WHERE ib.LotID IS NULL
+			LIMIT 1
+		);
+		IF v_ibatch_id IS NOT NULL THEN
+			SET p_success = FALSE;
+			SET p_message = CONCAT('Ingredient batch does not exist with LotID: ', v_ibatch_id);
+			SET p_product_batch_id = NULL;
+			ROLLBACK;
+			LEAVE proc_label;
+		END IF;
+		
+		-- Make sure specified ingredient batches are not expired
+		SET v_ibatch_id = (
+			SELECT item.ibatch_id
+			FROM JSON_TABLE(p_ingredient_batch_list, '$[*]' COLUMNS(ibatch_id VARCHAR(255) PATH '$.ibatch_id')) item
+			JOIN IngredientBatch ib ON ib.LotID = item.ibatch_id
+			WHERE ib.ExpirationDate < CURDATE()
+			LIMIT 1
+		);
+		IF v_ibatch_id IS NOT NULL THEN
+			SET p_success = FALSE;
+			SET p_message = CONCAT('Ingredient batch expired with LotID: ', v_ibatch_id);
+			SET p_product_batch_id = NULL;
+			ROLLBACK;
+			LEAVE proc_label;
+		END IF;
+		
+		-- Make sure specified ingredient batches have enough quantity
+		SET v_ibatch_id = (
+			SELECT item.ibatch_id
+			FROM JSON_TABLE(p_ingredient_batch_list, '$[*]' COLUMNS(ibatch_id VARCHAR(255) PATH '$.ibatch_id', ibatch_quantity_used DEC(10,2) PATH '$.ibatch_quantity_used')) item
+			JOIN IngredientBatch ib ON ib.LotID = item.ibatch_id
+			WHERE ib.Quantity < item.ibatch_quantity_used
+			LIMIT 1
+		);
+		IF v_ibatch_id IS NOT NULL THEN
+			SET p_success = FALSE;
+			SET p_message = CONCAT('Ingredient batch does not have enough quantity with LotID: ', v_ibatch_id);
+			SET p_product_batch_id = NULL;
+			ROLLBACK;
+			LEAVE proc_label;
+		END IF;
+		
+		-- Add that the product batch uses every selected ingredient batch of a RecipeBOM item
+		INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
+		SELECT p_product_batch_id, item.ibatch_id, item.ibatch_quantity_used
+		FROM JSON_TABLE(p_ingredient_batch_list, '$[*]' COLUMNS(ibatch_id VARCHAR(255) PATH '$.ibatch_id', ibatch_quantity_used DEC(10,2) PATH '$.ibatch_quantity_used')) item
+		JOIN IngredientBatch ib ON ib.LotID = item.ibatch_id
+		JOIN Formulation f ON f.FormulationID = ib.FormulationID
+		JOIN RecipeBOM rbom ON rbom.RecipeID = p_recipe_id AND rbom.IngredientID = f.IngredientID;
 	-- Automatic (FEFO) assignment
 	ELSE
-		-- Process each RecipeBOM item
-		OPEN rbom_cursor;
-		rbom_loop: LOOP
-			FETCH rbom_cursor INTO v_ingredient_id, v_required_qty;
-			IF done THEN
-				SET done = 0;
-				LEAVE rbom_loop;
-			END IF;
-			
-			-- Consume ingredient batches automatically
-			OPEN ibatch_cursor;
-			ibatch_loop: LOOP
-				FETCH ibatch_cursor INTO v_ibatch_id, v_available_qty;
-				-- Not enough stock for current ingredient
-				IF done THEN
-					SET done = 0;
-					CLOSE ibatch_cursor;
-					SET p_success = FALSE;
-					SET p_message = CONCAT('Insufficient stock for ingredient ID: ', v_ingredient_id);
-					ROLLBACK;
-					LEAVE proc_label;
-				END IF;
-				
-				-- If the current batch has at least enough quantity
-				IF v_available_qty >= v_required_qty THEN
-					-- Add that the product batch uses given ingredient batch
-					INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
-					VALUES (p_product_batch_id, v_ibatch_id, v_required_qty);
-					-- Decrease quantity left in used ingredient batch
-					UPDATE IngredientBatch
-						SET Quantity = Quantity - v_required_qty
-						WHERE LotID = v_ibatch_id;
-					CLOSE ibatch_cursor;
-					LEAVE ibatch_loop;
-			END LOOP ibatch_loop;
-		END LOOP rbom_loop;
-		CLOSE rbom_cursor;
+		-- Every RecipeBOM item needs enough usable stock across all of the manufacturer's batches
+		SET v_ingredient_id = (
+			SELECT rbom.IngredientID
+			FROM RecipeBOM rbom
+			LEFT JOIN (
+				SELECT f.IngredientID, SUM(ib.Quantity) AS AvailableQty
+				FROM IngredientBatch ib
+				JOIN Formulation f ON f.FormulationID = ib.FormulationID
+				WHERE ib.ManufacturerID = p_manufacturer_id
+				AND ib.Quantity > 0
+				AND ib.ExpirationDate > CURDATE()
+				GROUP BY f.IngredientID
+			) stock ON stock.IngredientID = rbom.IngredientID
+			WHERE rbom.RecipeID = p_recipe_id
+			AND COALESCE(stock.AvailableQty, 0) < rbom.Quantity * p_quantity_to_produce
+			LIMIT 1
+		);
+		IF v_ingredient_id IS NOT NULL THEN
+			SET p_success = FALSE;
+			SET p_message = CONCAT('Insufficient stock for ingredient ID: ', v_ingredient_id);
+			SET p_product_batch_id = NULL;
+			ROLLBACK;
+			LEAVE proc_label;
+		END IF;
+		
+		-- Consume ingredient batches earliest expiration first, splitting a RecipeBOM item across
+		-- 	batches while the running total of earlier batches is still short of the required quantity
+		INSERT INTO ProductBatchIngredientBatch (ProductLotID, IngredientLotID, QuantityUsed)
+		WITH CandidateBatches AS (
+			SELECT ib.LotID, ib.Quantity,
+				   rbom.Quantity * p_quantity_to_produce AS RequiredQty,
+				   COALESCE(SUM(ib.Quantity) OVER (
+					   PARTITION BY rbom.IngredientID
+					   ORDER BY ib.ExpirationDate ASC, ib.LotID ASC
+					   ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+				   ), 0) AS ConsumedBefore
+			FROM RecipeBOM rbom
+			JOIN Formulation f ON f.IngredientID = rbom.IngredientID
+			JOIN IngredientBatch ib ON ib.FormulationID = f.FormulationID
+			WHERE rbom.RecipeID = p_recipe_id
+			-- Manufacturer owns ingredient batch
+			AND ib.ManufacturerID = p_manufacturer_id
+			-- Ingredient batch is non-empty
+			AND ib.Quantity > 0
+			-- Ingredient batch is not expired
+			AND ib.ExpirationDate > CURDATE()
+		)
+		SELECT p_product_batch_id, LotID, LEAST(Quantity, RequiredQty - ConsumedBefore)
+		FROM CandidateBatches
+		WHERE ConsumedBefore < RequiredQty;
 	END IF;
+	
+	-- Decrease quantity left in every used ingredient batch
+	UPDATE IngredientBatch ib
+	JOIN ProductBatchIngredientBatch pbib ON pbib.IngredientLotID = ib.LotID
+	SET ib.Quantity = ib.Quantity - pbib.QuantityUsed
+	WHERE pbib.ProductLotID = p_product_batch_id;
 
     -- Success
     COMMIT;
@@ -397,40 +352,19 @@ CREATE PROCEDURE RecallIngredientBatch(
     OUT p_message VARCHAR(255)
 )
 proc_label: BEGIN
-	DECLARE v_product_batch_lot_id VARCHAR(255);
-    DECLARE done INT DEFAULT 0;
-    
-	-- Cursor for scanning through ProductBatchIngredientBatch
-	DECLARE pbib_cursor CURSOR FOR
-			SELECT ProductLotID FROM ProductBatchIngredientBatch
-            WHERE IngredientLotID = p_ingredient_batch_id;
-	
-	-- Exception handler for cursor loops
-    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
     -- General exception handler
     DECLARE EXIT HANDLER FOR SQLEXCEPTION
     BEGIN
-        ROLLBACK;
         SET p_success = FALSE;
         SET p_message = 'An error occurred calculation.';
         SET p_affected_batches = NULL;
     END;
 
-	START TRANSACTION;
-		OPEN pbib_cursor;
-		pbib_loop: LOOP
-			FETCH pbib_cursor INTO v_product_batch_lot_id;
-			IF done THEN
-				CLOSE pbib_cursor;
-				LEAVE pbib_loop;
-			END IF;
-            IF p_affected_batches IS NULL THEN
-				SET p_affected_batches = v_product_batch_lot_id;
-			ELSE
-				SET p_affected_batches = CONCAT(p_affected_batches,",",v_product_batch_lot_id);
-            END IF;
-        END LOOP pbib_loop;
-    COMMIT;
+	-- One probe of idx_pbib_ingredient_lot instead of a cursor over ProductBatchIngredientBatch
+	SELECT GROUP_CONCAT(ProductLotID SEPARATOR ',') INTO p_affected_batches
+	FROM ProductBatchIngredientBatch
+	WHERE IngredientLotID = p_ingredient_batch_id;
+
 	SET p_success = TRUE;
     SET p_message = 'Returned product batch lot ids successfully.';
 END$$